@@ -1,5 +1,9 @@
 from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
 from datetime import datetime
+from sqlalchemy import text
+
+from app.database import bootstrap_state, engine
 
 router = APIRouter()
 
@@ -13,6 +17,14 @@ async def health_check():
     }
 @router.get("/ready")
 async def readiness_check():
+    """Готов, если схема подготовлена и БД отвечает"""
+    if not bootstrap_state.ready:
+        return ORJSONResponse({"status": "not ready", "reason": bootstrap_state.reason}, status_code=503)
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        return ORJSONResponse({"status": "not ready", "reason": f"database: {e}"}, status_code=503)
     return {"status": "ready"}
 
 @router.get("/live")
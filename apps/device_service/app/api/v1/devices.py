@@ -1,86 +1,182 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
 
+from app.cache import CachedDevice, device_etag
+from app.config import settings
 from app.database import get_db
+from app.etags import etag_matches
+from app.pagination import DeviceOrder, decode_cursor, encode_cursor
 from app import schemas, crud, services, models
 
 router = APIRouter(prefix="/devices", tags=["Device Management"])
 
 @router.get("/", response_model=List[schemas.Device])
 async def get_devices(
+    request: Request,
+    response: Response,
     user_id: Optional[int] = Query(None),
     type: Optional[models.DeviceType] = Query(None),
-    location: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    status: Optional[models.DeviceStatus] = Query(None),
+    location: Optional[str] = Query(None, description="Подстрока названия комнаты"),
+    location_exact: Optional[str] = Query(None, description="Комната целиком, без учета регистра"),
+    order: DeviceOrder = Query(DeviceOrder.ID),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы из X-Next-Cursor"),
+    limit: int = Query(settings.devices_page_default_limit, ge=1, le=settings.devices_page_max_limit),
+    db: AsyncSession = Depends(get_db)
 ):
-    if user_id is not None:
-        devices = crud.DeviceCRUD.get_by_user_id(db, user_id)
-    elif type is not None:
-        devices = crud.DeviceCRUD.get_by_type(db, type)
-    elif location is not None:
-        devices = crud.DeviceCRUD.get_by_location(db, location)
-    else:
-        devices = crud.DeviceCRUD.get_all(db)
+    """Фильтры объединяются через AND. Следующая страница - по курсору из заголовков
+    X-Next-Cursor / Link; заголовков нет на последней странице."""
+    try:
+        after = decode_cursor(cursor, order)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = schemas.DeviceFilter(
+        user_id=user_id, type=type, status=status, location=location, location_exact=location_exact
+    )
+    devices, next_key = await crud.DeviceCRUD.list_devices(db, filters, order, after, limit)
+    if next_key is not None:
+        next_cursor = encode_cursor(order, next_key)
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
     return devices
 
-@router.get("/{device_id}", response_model=schemas.Device)
-async def get_device(device_id: int, db: Session = Depends(get_db)):
-    device = crud.DeviceCRUD.get_by_id(db, device_id)
-    if not device:
+# Статические пути - до /{device_id}, иначе их перехватит шаблон с ID
+@router.get("/stats", response_model=schemas.DeviceStats)
+async def get_stats(
+    user_id: Optional[int] = Query(None),
+    location_exact: Optional[str] = Query(None, description="Комната целиком, без учета регистра"),
+    db: AsyncSession = Depends(get_db)
+):
+    return await crud.DeviceCRUD.get_stats(db, user_id, location_exact)
+
+@router.get("/stats/breakdown", response_model=List[schemas.DeviceStatsGroup])
+async def get_stats_breakdown(
+    group_by: Literal["user_id", "location"] = Query(...),
+    db: AsyncSession = Depends(get_db)
+):
+    return await crud.DeviceCRUD.get_stats_breakdown(db, group_by)
+
+@router.get("/types", response_model=List[models.DeviceType])
+async def get_types():
+    return list(models.DeviceType)
+
+@router.get("/statuses", response_model=List[models.DeviceStatus])
+async def get_statuses():
+    return list(models.DeviceStatus)
+
+def cached_device_response(request: Request, entry: Optional[CachedDevice]) -> Response:
+    """Готовое тело из кэша с ETag; 304 без тела, если клиент прислал тот же ETag"""
+    if entry is None:
         raise HTTPException(status_code=404, detail="Device not found")
-    return device
+    headers = {"ETag": entry.etag}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+@router.get("/by-mac/{mac_address}", response_model=schemas.Device)
+async def get_device_by_mac(mac_address: str, request: Request, db: AsyncSession = Depends(get_db)):
+    return cached_device_response(request, await crud.DeviceCRUD.get_cached_by_mac_address(db, mac_address))
+
+@router.get("/{device_id}", response_model=schemas.Device)
+async def get_device(device_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    return cached_device_response(request, await crud.DeviceCRUD.get_cached(db, device_id))
 
 @router.post("/", response_model=schemas.Device, status_code=201)
-async def create_device(device: schemas.DeviceCreate, db: Session = Depends(get_db)):
-    return await services.DeviceService(None, "").create_device(db, device)  # Producer injected via dependency
+async def create_device(device: schemas.DeviceCreate, db: AsyncSession = Depends(get_db)):
+    return await services.DeviceService().create_device(db, device)
+
+@router.post("/bulk", response_model=schemas.DeviceBulkResult)
+async def bulk_upsert_devices(batch: schemas.DeviceBulkCreate, db: AsyncSession = Depends(get_db)):
+    """Создание/обновление пачки устройств по mac_address одним запросом к БД.
+    Результат - по каждому элементу в порядке запроса."""
+    results: List[Optional[schemas.DeviceBulkItemResult]] = [None] * len(batch.devices)
+    # Последний элемент с данным MAC побеждает, как при последовательных POST
+    index_by_mac = {}
+    for index, device in enumerate(batch.devices):
+        if not device.mac_address:
+            results[index] = schemas.DeviceBulkItemResult(index=index, result="error", error="mac_address is required")
+            continue
+        previous = index_by_mac.get(device.mac_address)
+        if previous is not None:
+            results[previous] = schemas.DeviceBulkItemResult(
+                index=previous, result="error", error=f"mac_address repeated at index {index}"
+            )
+        index_by_mac[device.mac_address] = index
+
+    if index_by_mac:
+        rows = await crud.DeviceCRUD.bulk_upsert(db, [batch.devices[index] for index in index_by_mac.values()])
+        for row, inserted in rows:
+            index = index_by_mac[row.mac_address]
+            results[index] = schemas.DeviceBulkItemResult(
+                index=index,
+                result="created" if inserted else "updated",
+                device=schemas.Device.model_validate(row),
+            )
+
+    counts = {"created": 0, "updated": 0, "error": 0}
+    for item in results:
+        counts[item.result] += 1
+    return schemas.DeviceBulkResult(
+        created=counts["created"], updated=counts["updated"], failed=counts["error"], results=results
+    )
+
+@router.patch("/status:bulk", response_model=schemas.DeviceStatusBulkResult)
+async def bulk_update_status(batch: schemas.DeviceStatusBulkUpdate, db: AsyncSession = Depends(get_db)):
+    """Смена статуса пачки устройств; при повторе device_id действует последний"""
+    statuses = {item.device_id: item.status for item in batch.updates}
+    rows = await crud.DeviceCRUD.bulk_update_status(db, statuses)
+    devices = {row.id: schemas.Device.model_validate(row) for row in rows}
+    results = [
+        schemas.DeviceStatusBulkItemResult(device_id=device_id, result="updated", device=devices[device_id])
+        if device_id in devices else
+        schemas.DeviceStatusBulkItemResult(device_id=device_id, result="not_found")
+        for device_id in statuses
+    ]
+    return schemas.DeviceStatusBulkResult(
+        updated=len(devices), not_found=len(statuses) - len(devices), results=results
+    )
 
 @router.put("/{device_id}", response_model=schemas.Device)
 async def update_device(
     device_id: int, 
     device: schemas.DeviceUpdate, 
-    db: Session = Depends(get_db)
+    response: Response,
+    db: AsyncSession = Depends(get_db)
 ):
-    updated_device = crud.DeviceCRUD.update(db, device_id, device)
+    updated_device = await crud.DeviceCRUD.update(db, device_id, device)
     if not updated_device:
         raise HTTPException(status_code=404, detail="Device not found")
+    response.headers["ETag"] = device_etag(updated_device)
     return updated_device
 
 @router.delete("/{device_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_device(device_id: int, db: Session = Depends(get_db)):
-    if not crud.DeviceCRUD.delete(db, device_id):
+async def delete_device(device_id: int, db: AsyncSession = Depends(get_db)):
+    if not await crud.DeviceCRUD.delete(db, device_id):
         raise HTTPException(status_code=404, detail="Device not found")
 
 @router.patch("/{device_id}/status", response_model=schemas.Device)
 async def update_status(
     device_id: int, 
     status_update: schemas.DeviceStatusUpdate, 
-    db: Session = Depends(get_db)
+    response: Response,
+    db: AsyncSession = Depends(get_db)
 ):
-    device = crud.DeviceCRUD.update_status(db, device_id, status_update.status)
+    device = await crud.DeviceCRUD.update_status(db, device_id, status_update.status)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
+    response.headers["ETag"] = device_etag(device)
     return device
 
-@router.post("/{device_id}/heartbeat")
+@router.post("/{device_id}/heartbeat", status_code=status.HTTP_202_ACCEPTED)
 async def heartbeat(
     device_id: int,
-    heartbeat_data: schemas.HeartbeatRequest = None,
-    db: Session = Depends(get_db)
+    heartbeat_data: Optional[schemas.HeartbeatRequest] = None,
 ):
-    success = await services.DeviceService(None, "").heartbeat(db, device_id, heartbeat_data.ip_address)
-    if not success:
-        raise HTTPException(status_code=404, detail="Device not found")
-    return {"message": "Heartbeat registered successfully"}
-
-@router.get("/stats", response_model=schemas.DeviceStats)
-async def get_stats(db: Session = Depends(get_db)):
-    return crud.DeviceCRUD.get_stats(db)
-
-@router.get("/types", response_model=List[models.DeviceType])
-async def get_types():
-    return list(models.DeviceType)
-
-@router.get("/statuses", response_model=List[models.DeviceStatus])
-async def get_statuses():
-    return list(models.DeviceStatus)
\ No newline at end of file
+    """Heartbeat принимается в буфер и записывается пачкой (write-behind).
+    Heartbeat несуществующего устройства при записи отбрасывается."""
+    ip_address = heartbeat_data.ip_address if heartbeat_data else None
+    if not services.DeviceService().heartbeat(device_id, ip_address):
+        raise HTTPException(status_code=503, detail="Heartbeat buffer is full", headers={"Retry-After": "1"})
+    return {"message": "Heartbeat accepted"}
@@ -0,0 +1,66 @@
+"""
+Фоновая запись накопленного в памяти (write-behind).
+Одинаковый модуль подключают device_service (heartbeat) и telemetry_service (показания):
+эталон в device_service, копии сверяет и обновляет apps/sync_shared_modules.py.
+
+Наследник хранит накопленное в pending и реализует flush(): вынуть пачку,
+записать, при ошибке вернуть незаписанное в буфер (в том числе при отмене)
+и вернуть False. FlushLoop вызывает flush раз в flush_interval секунд или
+по wake(); после неудачной записи ждет интервал, а не повторяет сразу.
+
+stop не отменяет задачу: отмена посреди flush потеряла бы вынутую из буфера
+пачку. Он дожидается начатой записи и дописывает остаток.
+"""
+import asyncio
+import logging
+
+log = logging.getLogger(__name__)
+
+class FlushLoop:
+    # Что лежит в буфере - для сообщений о потере при остановке
+    items = "items"
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self.pending = None
+        self._wakeup = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._task = None
+
+    def wake(self):
+        """Записать накопленное, не дожидаясь интервала"""
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._stop.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Дожидается начатой записи, останавливает фоновую задачу и пишет остаток"""
+        if self._task is not None:
+            self._stop.set()
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        while self.pending:
+            if not await self.flush():
+                log.error(f"❌ {len(self.pending)} {self.items} lost on shutdown")
+                break
+
+    async def flush(self) -> bool:
+        raise NotImplementedError
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self.pending and not self._stop.is_set() and not await self.flush():
+                # БД недоступна - ждем следующего интервала (или остановки)
+                try:
+                    await asyncio.wait_for(self._stop.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
@@ -0,0 +1,316 @@
+"""
+Кэш карточек устройств для GET /devices/{id} и поиска по MAC.
+
+Запись хранит готовое тело ответа (JSON) и ETag из updated_at: попадание не
+обращается к БД и не сериализует устройство, а при совпадении If-None-Match
+ответ 304 уходит без тела. DeviceCRUD заполняет кэш при чтении и сбрасывает
+записи после коммита изменений.
+
+По умолчанию - LRU с TTL в памяти процесса; с DEVICE_CACHE_REDIS_URL -
+общий Redis для всех процессов и реплик сервиса.
+
+Локальные кэши воркеров и реплик согласуются через Postgres: сброс после
+коммита уходит в NOTIFY device_cache, каждый процесс слушает канал на своем
+соединении. Пока слушатель не подключен, локальный кэш не используется -
+пропущенный сброс не оставит устаревшую карточку.
+
+Heartbeat сбрасывает только устройства, у которых сменились статус или IP:
+last_seen и ETag закэшированной карточки отстают не дольше DEVICE_CACHE_TTL.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import asyncpg
+import orjson
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # нужен только для общего кэша нескольких процессов
+    redis_asyncio = None
+from prometheus_client import Counter
+
+from sqlalchemy import text
+
+from app import schemas
+from app.config import settings
+from app.database import SQLALCHEMY_DATABASE_URL, engine
+
+log = logging.getLogger(__name__)
+
+DEVICE_CACHE_REQUESTS = Counter("device_cache_requests_total", "Чтения кэша устройств", ("result",))
+CACHE_HIT = DEVICE_CACHE_REQUESTS.labels("hit")
+CACHE_MISS = DEVICE_CACHE_REQUESTS.labels("miss")
+
+NOTIFY_CHANNEL = "device_cache"
+# Payload NOTIFY ограничен 8000 байт; большой сброс делится на несколько сообщений
+NOTIFY_MAX_PAYLOAD = 7900
+
+def device_etag(device) -> str:
+    """Слабый ETag: каждое изменение устройства сдвигает updated_at"""
+    changed = device.updated_at or device.created_at
+    return f'W/"{device.id}-{int(changed.timestamp() * 1_000_000)}"'
+
+def notify_payloads(instance_id: str, device_ids, mac_addresses) -> List[str]:
+    """Сброс в сообщениях NOTIFY не длиннее NOTIFY_MAX_PAYLOAD байт"""
+    payloads = []
+    message = {"src": instance_id, "ids": [], "macs": []}
+    empty_size = size = len(orjson.dumps(message))
+    for field, values in (("ids", device_ids), ("macs", mac_addresses)):
+        for value in values:
+            # Значение и запятая перед ним
+            item_size = len(orjson.dumps(value)) + 1
+            if size + item_size > NOTIFY_MAX_PAYLOAD and size > empty_size:
+                payloads.append(orjson.dumps(message).decode())
+                message = {"src": instance_id, "ids": [], "macs": []}
+                size = empty_size
+            message[field].append(value)
+            size += item_size
+    if size > empty_size:
+        payloads.append(orjson.dumps(message).decode())
+    return payloads
+
+class CachedDevice:
+    __slots__ = ("device_id", "mac_address", "etag", "body", "expires_at")
+
+    def __init__(self, device_id: int, mac_address: Optional[str], etag: str, body: bytes, expires_at: float = 0.0):
+        self.device_id = device_id
+        self.mac_address = mac_address
+        self.etag = etag
+        self.body = body
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_device(cls, device) -> "CachedDevice":
+        body = schemas.Device.model_validate(device).model_dump_json().encode()
+        return cls(device.id, device.mac_address, device_etag(device), body)
+
+class LocalDeviceCache:
+    """LRU с TTL в памяти процесса. Индекс MAC -> id живет, пока жива запись id.
+
+    generation растет при каждом сбросе: запись, прочитанная из БД до сброса,
+    в кэш уже не кладется (иначе она пережила бы изменение до конца TTL).
+
+    С notify_url сбросы рассылаются через NOTIFY и принимаются от других
+    процессов; synced - слушатель подключен и кэшу можно верить.
+    """
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int,
+        notify_url: Optional[str] = None,
+        ping_interval: float = 10.0,
+        retry_interval: float = 5.0,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[int, CachedDevice]" = OrderedDict()
+        self.by_mac: Dict[str, int] = {}
+        self.generation = 0
+        self.notify_url = notify_url
+        self.ping_interval = ping_interval
+        self.retry_interval = retry_interval
+        # Свои сбросы из канала не применяются повторно
+        self.instance_id = uuid.uuid4().hex
+        self.synced = notify_url is None
+        self._task = None
+
+    def start(self):
+        if self.notify_url and self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self):
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.notify_url)
+                await conn.add_listener(NOTIFY_CHANNEL, self._on_notify)
+                # Сбросы, пришедшие без слушателя, потеряны - начинаем с пустого кэша
+                self.clear()
+                self.synced = True
+                log.info("✅ Device cache invalidation listener connected")
+                while True:
+                    await asyncio.sleep(self.ping_interval)
+                    await conn.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f"⚠️ Device cache listener disconnected, cache bypassed until reconnect: {e}")
+            finally:
+                self.synced = False
+                if conn is not None:
+                    conn.terminate()
+            await asyncio.sleep(self.retry_interval)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        message = orjson.loads(payload)
+        if message["src"] == self.instance_id:
+            return
+        if message.get("all"):
+            # Полный сброс от процесса прежней версии при раскатке
+            self.clear()
+            return
+        self.drop(message["ids"], message["macs"])
+
+    async def publish(self, device_ids, mac_addresses):
+        payloads = notify_payloads(self.instance_id, device_ids, mac_addresses)
+        if not payloads:
+            return
+        try:
+            async with engine.connect() as conn:
+                # Все части - одним запросом; слушатели получат их вместе после commit
+                await conn.execute(
+                    text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"),
+                    {"channel": NOTIFY_CHANNEL, "payloads": payloads},
+                )
+                await conn.commit()
+        except Exception as e:
+            log.warning(f"⚠️ Device cache invalidation not sent, other processes expire entries in {self.ttl} s: {e}")
+
+    async def get(self, device_id: int) -> Optional[CachedDevice]:
+        if not self.synced:
+            CACHE_MISS.inc()
+            return None
+        entry = self.entries.get(device_id)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self.remove(device_id)
+            entry = None
+        if entry is None:
+            CACHE_MISS.inc()
+            return None
+        self.entries.move_to_end(device_id)
+        CACHE_HIT.inc()
+        return entry
+
+    async def get_by_mac(self, mac_address: str) -> Optional[CachedDevice]:
+        device_id = self.by_mac.get(mac_address)
+        if device_id is None:
+            CACHE_MISS.inc()
+            return None
+        return await self.get(device_id)
+
+    async def put(self, entry: CachedDevice, generation: int):
+        if self.ttl <= 0 or generation != self.generation or not self.synced:
+            return
+        self.remove(entry.device_id)
+        entry.expires_at = time.monotonic() + self.ttl
+        self.entries[entry.device_id] = entry
+        if entry.mac_address:
+            self.by_mac[entry.mac_address] = entry.device_id
+        while len(self.entries) > self.max_entries:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, device_id: int):
+        entry = self.entries.pop(device_id, None)
+        if entry is not None and entry.mac_address and self.by_mac.get(entry.mac_address) == device_id:
+            del self.by_mac[entry.mac_address]
+
+    def clear(self):
+        self.generation += 1
+        self.entries.clear()
+        self.by_mac.clear()
+
+    def drop(self, device_ids: Iterable[int], mac_addresses: Iterable[str]):
+        self.generation += 1
+        for device_id in device_ids:
+            self.remove(device_id)
+        for mac_address in mac_addresses:
+            self.by_mac.pop(mac_address, None)
+
+    async def invalidate(self, device_ids: Iterable[int] = (), mac_addresses: Iterable[Optional[str]] = ()):
+        device_ids = list(device_ids)
+        mac_addresses = [mac_address for mac_address in mac_addresses if mac_address]
+        self.drop(device_ids, mac_addresses)
+        if self.notify_url:
+            await self.publish(device_ids, mac_addresses)
+
+class RedisDeviceCache:
+    """Записи в Redis-хэшах device:id:<id> и ключах device:mac:<mac> -> id с TTL.
+    Ошибки Redis не ломают запросы: чтение идет в БД, записи истекают по TTL."""
+    def __init__(self, url: str, ttl: float):
+        self.client = redis_asyncio.from_url(url)
+        self.ttl_ms = int(ttl * 1000)
+        self.generation = 0
+
+    def start(self):
+        """Redis общий для процессов - рассылка сбросов не нужна"""
+
+    async def stop(self):
+        pass
+
+    async def get(self, device_id: int) -> Optional[CachedDevice]:
+        try:
+            fields = await self.client.hgetall(f"device:id:{device_id}")
+        except Exception as e:
+            log.debug("Device cache backend unavailable: %s", e)
+            fields = None
+        if not fields:
+            CACHE_MISS.inc()
+            return None
+        CACHE_HIT.inc()
+        mac_address = fields[b"mac"].decode() or None
+        return CachedDevice(device_id, mac_address, fields[b"etag"].decode(), fields[b"body"])
+
+    async def get_by_mac(self, mac_address: str) -> Optional[CachedDevice]:
+        try:
+            device_id = await self.client.get(f"device:mac:{mac_address}")
+        except Exception as e:
+            log.debug("Device cache backend unavailable: %s", e)
+            device_id = None
+        entry = await self.get(int(device_id)) if device_id is not None else None
+        if entry is None or entry.mac_address != mac_address:
+            if device_id is None:
+                CACHE_MISS.inc()
+            return None
+        return entry
+
+    async def put(self, entry: CachedDevice, generation: int):
+        if self.ttl_ms <= 0 or generation != self.generation:
+            return
+        key = f"device:id:{entry.device_id}"
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.hset(key, mapping={"etag": entry.etag, "mac": entry.mac_address or "", "body": entry.body})
+                pipe.pexpire(key, self.ttl_ms)
+                if entry.mac_address:
+                    pipe.set(f"device:mac:{entry.mac_address}", entry.device_id, px=self.ttl_ms)
+                await pipe.execute()
+        except Exception as e:
+            log.debug("Device cache backend unavailable: %s", e)
+
+    async def invalidate(self, device_ids: Iterable[int] = (), mac_addresses: Iterable[Optional[str]] = ()):
+        self.generation += 1
+        keys = [f"device:id:{device_id}" for device_id in device_ids]
+        keys.extend(f"device:mac:{mac_address}" for mac_address in mac_addresses if mac_address)
+        if not keys:
+            return
+        try:
+            await self.client.delete(*keys)
+        except Exception as e:
+            log.warning(f"⚠️ Device cache invalidation failed, entries expire in {self.ttl_ms} ms: {e}")
+
+def create_device_cache():
+    if settings.device_cache_redis_url:
+        if redis_asyncio is None:
+            log.warning("DEVICE_CACHE_REDIS_URL is set but redis is not installed, using in-memory cache")
+        else:
+            return RedisDeviceCache(settings.device_cache_redis_url, settings.device_cache_ttl)
+    return LocalDeviceCache(
+        settings.device_cache_ttl,
+        settings.device_cache_max_entries,
+        notify_url=SQLALCHEMY_DATABASE_URL if settings.device_cache_notify and settings.device_cache_ttl > 0 else None,
+    )
+
+device_cache = create_device_cache()
@@ -8,11 +8,64 @@ class Settings(BaseSettings):
     database_name: str = os.getenv("DATABASE_NAME", "smarthome_devices")
     database_user: str = os.getenv("DATABASE_USER", "postgres")
     database_password: str = os.getenv("DATABASE_PASSWORD", "postgres")
+
+    # Пул соединений async-движка (asyncpg)
+    database_pool_size: int = int(os.getenv("DATABASE_POOL_SIZE", "20"))
+    database_max_overflow: int = int(os.getenv("DATABASE_MAX_OVERFLOW", "10"))
+    database_pool_timeout: float = float(os.getenv("DATABASE_POOL_TIMEOUT", "30"))
+    database_pool_recycle: int = int(os.getenv("DATABASE_POOL_RECYCLE", "1800"))
+    database_pool_pre_ping: bool = os.getenv("DATABASE_POOL_PRE_PING", "true").lower() == "true"
+    # 0 - без кэша подготовленных выражений (нужно за pgbouncer в transaction-режиме)
+    database_statement_cache_size: int = int(os.getenv("DATABASE_STATEMENT_CACHE_SIZE", "100"))
     
+    # Подготовка схемы (БД, таблицы, индексы, init.sql) фоновым шагом lifespan; false - схему
+    # готовит python -m scripts.bootstrap_db. Пауза между попытками, пока БД недоступна
+    database_bootstrap: bool = os.getenv("DATABASE_BOOTSTRAP", "true").lower() == "true"
+    database_bootstrap_retry_interval: float = float(os.getenv("DATABASE_BOOTSTRAP_RETRY_INTERVAL", "5.0"))
+
+    # GIN-индекс pg_trgm для поиска по подстроке location (нужно расширение pg_trgm)
+    database_trigram_search: bool = os.getenv("DATABASE_TRIGRAM_SEARCH", "true").lower() == "true"
+
+    # Таблица device_status_counts: /devices/stats без сканирования devices
+    device_status_counters: bool = os.getenv("DEVICE_STATUS_COUNTERS", "true").lower() == "true"
+
+    # Write-behind heartbeat: период и размер пачки записи, потолок буфера
+    heartbeat_flush_interval: float = float(os.getenv("HEARTBEAT_FLUSH_INTERVAL", "1.0"))
+    heartbeat_flush_batch: int = int(os.getenv("HEARTBEAT_FLUSH_BATCH", "5000"))
+    heartbeat_max_pending: int = int(os.getenv("HEARTBEAT_MAX_PENDING", "100000"))
+
+    # Список устройств: размер страницы по умолчанию и потолок limit
+    devices_page_default_limit: int = int(os.getenv("DEVICES_PAGE_DEFAULT_LIMIT", "100"))
+    devices_page_max_limit: int = int(os.getenv("DEVICES_PAGE_MAX_LIMIT", "1000"))
+
+    # Массовые операции: максимум элементов в одном запросе
+    devices_bulk_max_items: int = int(os.getenv("DEVICES_BULK_MAX_ITEMS", "10000"))
+
+    # Кэш карточек устройств (GET по id и MAC): TTL в секундах (0 - выключен),
+    # размер LRU в памяти процесса, общий Redis вместо LRU (redis://...)
+    device_cache_ttl: float = float(os.getenv("DEVICE_CACHE_TTL", "30"))
+    device_cache_max_entries: int = int(os.getenv("DEVICE_CACHE_MAX_ENTRIES", "100000"))
+    device_cache_redis_url: str = os.getenv("DEVICE_CACHE_REDIS_URL", "")
+    # Сброс локальных кэшей других воркеров и реплик через Postgres NOTIFY
+    device_cache_notify: bool = os.getenv("DEVICE_CACHE_NOTIFY", "true").lower() == "true"
+
     # Kafka
     kafka_bootstrap_servers: str = os.getenv("KAFKA_BROKERS", "kafka:9092")
     kafka_topic: str = "device.events"
-    
+    # false - события из outbox не уходят в брокер (InMemoryProducer)
+    kafka_enabled: bool = os.getenv("KAFKA_ENABLED", "true").lower() == "true"
+    # Батчинг продюсера: ожидание добора пачки, размер пачки в байтах, сжатие (gzip/snappy/lz4/zstd или пусто)
+    kafka_linger_ms: int = int(os.getenv("KAFKA_LINGER_MS", "20"))
+    kafka_max_batch_size: int = int(os.getenv("KAFKA_MAX_BATCH_SIZE", "65536"))
+    kafka_compression_type: str = os.getenv("KAFKA_COMPRESSION_TYPE", "gzip")
+
+    # Outbox relay: событий за одну транзакцию, период опроса таблицы,
+    # пауза после ошибки брокера, сколько ждать отправки остатка при остановке
+    outbox_batch_size: int = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+    outbox_poll_interval: float = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))
+    outbox_retry_interval: float = float(os.getenv("OUTBOX_RETRY_INTERVAL", "5.0"))
+    outbox_drain_timeout: float = float(os.getenv("OUTBOX_DRAIN_TIMEOUT", "5.0"))
+
     # Server
     server_port: int = 8082
 
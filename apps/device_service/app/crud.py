@@ -1,86 +1,364 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Row, Select, func, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime  # ✅ ДОБАВЛЕН НЕОБХОДИМЫЙ ИМПОРТ
 from app import models, schemas  # ✅ АБСОЛЮТНЫЕ ИМПОРТЫ вместо относительных
+from app.cache import CachedDevice, device_cache
+from app.config import settings
+from app.outbox import add_events, device_event, status_change_event
+from app.pagination import DeviceOrder
+
+BULK_HEARTBEAT_SQL = text("""
+UPDATE devices AS d
+SET ip_address = COALESCE(v.ip_address, d.ip_address),
+    last_seen = v.last_seen,
+    status = CASE WHEN d.id = ANY(:came_online) THEN 'online' ELSE d.status END,
+    updated_at = now()
+FROM unnest(CAST(:ids AS integer[]), CAST(:ips AS varchar[]), CAST(:seen AS timestamptz[]))
+    AS v(id, ip_address, last_seen)
+WHERE d.id = v.id
+""")
+
+BULK_UPSERT_SQL = text("""
+INSERT INTO devices (name, type, location, mac_address, ip_address, firmware_version, user_id, status, updated_at)
+SELECT v.name, v.type, v.location, v.mac_address, v.ip_address, v.firmware_version, v.user_id, 'offline', now()
+FROM unnest(
+    CAST(:names AS varchar[]), CAST(:types AS varchar[]), CAST(:locations AS varchar[]),
+    CAST(:macs AS varchar[]), CAST(:ips AS varchar[]), CAST(:firmwares AS varchar[]), CAST(:user_ids AS integer[])
+) AS v(name, type, location, mac_address, ip_address, firmware_version, user_id)
+ON CONFLICT (mac_address) DO UPDATE SET
+    name = EXCLUDED.name,
+    type = EXCLUDED.type,
+    location = EXCLUDED.location,
+    ip_address = EXCLUDED.ip_address,
+    firmware_version = EXCLUDED.firmware_version,
+    user_id = EXCLUDED.user_id,
+    updated_at = now()
+RETURNING devices.*, (xmax = 0) AS inserted
+""")
+
+BULK_STATUS_SQL = text("""
+UPDATE devices AS d
+SET status = v.status, updated_at = now()
+FROM unnest(CAST(:ids AS integer[]), CAST(:statuses AS varchar[])) AS v(id, status)
+WHERE d.id = v.id
+RETURNING d.*
+""")
 
 class DeviceCRUD:
     @staticmethod
-    def get_all(db: Session, skip: int = 0, limit: int = 100) -> List[models.Device]:
-        return db.query(models.Device).offset(skip).limit(limit).all()
+    def list_query(
+        filters: schemas.DeviceFilter,
+        order: DeviceOrder = DeviceOrder.ID,
+        after: Optional[Tuple] = None,
+        limit: int = 100,
+    ) -> Select:
+        """SELECT страницы по keyset: WHERE (ключ) > after ORDER BY ключ LIMIT limit + 1.
+
+        Лишняя строка показывает, что следующая страница существует.
+        """
+        Device = models.Device
+        criteria = []
+        if filters.user_id is not None:
+            criteria.append(Device.user_id == filters.user_id)
+        if filters.type is not None:
+            criteria.append(Device.type == filters.type)
+        if filters.status is not None:
+            criteria.append(Device.status == filters.status)
+        if filters.location:
+            criteria.append(Device.location.ilike(f"%{filters.location}%"))
+        if filters.location_exact:
+            criteria.append(func.lower(Device.location) == filters.location_exact.lower())
+
+        key_columns = DeviceCRUD.key_columns(order)
+        if after is not None:
+            criteria.append(tuple_(*key_columns) > tuple_(*after))
+        return select(Device).where(*criteria).order_by(*key_columns).limit(limit + 1)
+
+    @staticmethod
+    def key_columns(order: DeviceOrder) -> Tuple:
+        if order == DeviceOrder.UPDATED_AT:
+            return models.Device.updated_at, models.Device.id
+        return (models.Device.id,)
 
     @staticmethod
-    def get_by_id(db: Session, device_id: int) -> Optional[models.Device]:
-        return db.query(models.Device).filter(models.Device.id == device_id).first()
+    async def list_devices(
+        db: AsyncSession,
+        filters: schemas.DeviceFilter,
+        order: DeviceOrder = DeviceOrder.ID,
+        after: Optional[Tuple] = None,
+        limit: int = 100,
+    ) -> Tuple[List[models.Device], Optional[Tuple]]:
+        """Страница устройств и ключ последнего из них, если есть следующая страница"""
+        query = DeviceCRUD.list_query(filters, order, after, limit)
+        devices = list((await db.execute(query)).scalars())
+        if len(devices) <= limit:
+            return devices, None
+        devices = devices[:limit]
+        last = devices[-1]
+        next_key = (last.updated_at, last.id) if order == DeviceOrder.UPDATED_AT else (last.id,)
+        return devices, next_key
 
     @staticmethod
-    def get_by_user_id(db: Session, user_id: int) -> List[models.Device]:
-        return db.query(models.Device).filter(models.Device.user_id == user_id).all()
+    async def get_by_id(db: AsyncSession, device_id: int) -> Optional[models.Device]:
+        return await db.get(models.Device, device_id)
 
     @staticmethod
-    def get_by_type(db: Session, device_type: models.DeviceType) -> List[models.Device]:
-        return db.query(models.Device).filter(models.Device.type == device_type).all()
+    async def get_by_mac_address(db: AsyncSession, mac_address: str) -> Optional[models.Device]:
+        result = await db.execute(select(models.Device).where(models.Device.mac_address == mac_address))
+        return result.scalars().first()
 
     @staticmethod
-    def get_by_location(db: Session, location: str) -> List[models.Device]:
-        return db.query(models.Device).filter(
-            models.Device.location.ilike(f"%{location}%")
-        ).all()
+    async def get_cached(db: AsyncSession, device_id: int) -> Optional[CachedDevice]:
+        """Карточка устройства через кэш (read-through)"""
+        entry = await device_cache.get(device_id)
+        if entry is None:
+            generation = device_cache.generation
+            device = await DeviceCRUD.get_by_id(db, device_id)
+            if device is not None:
+                entry = CachedDevice.from_device(device)
+                await device_cache.put(entry, generation)
+        return entry
 
     @staticmethod
-    def get_by_mac_address(db: Session, mac_address: str) -> Optional[models.Device]:
-        return db.query(models.Device).filter(models.Device.mac_address == mac_address).first()
+    async def get_cached_by_mac_address(db: AsyncSession, mac_address: str) -> Optional[CachedDevice]:
+        entry = await device_cache.get_by_mac(mac_address)
+        if entry is None:
+            generation = device_cache.generation
+            device = await DeviceCRUD.get_by_mac_address(db, mac_address)
+            if device is not None:
+                entry = CachedDevice.from_device(device)
+                await device_cache.put(entry, generation)
+        return entry
 
     @staticmethod
-    def create(db: Session, device: schemas.DeviceCreate) -> models.Device:
+    async def create(db: AsyncSession, device: schemas.DeviceCreate) -> models.Device:
         db_device = models.Device(**device.dict())
         db.add(db_device)
-        db.commit()
-        db.refresh(db_device)
+        await db.flush()
+        await DeviceCRUD.count_status_change(db, {db_device.status: 1})
+        await add_events(db, [device_event("device.created", db_device)])
+        await db.commit()
+        await db.refresh(db_device)
         return db_device
 
     @staticmethod
-    def update(db: Session, device_id: int, device_update: schemas.DeviceUpdate) -> Optional[models.Device]:
-        db_device = db.query(models.Device).filter(models.Device.id == device_id).first()
+    async def bulk_upsert(db: AsyncSession, devices: List[schemas.DeviceCreate]) -> List[Tuple[Row, bool]]:
+        """Один INSERT ... SELECT FROM unnest(...) ON CONFLICT (mac_address) DO UPDATE RETURNING.
+
+        mac_address в пачке обязателен и уникален - это ключ upsert. Возвращает
+        строки устройств и признак вставки (xmax = 0 у только что вставленной строки).
+        """
+        rows = (await db.execute(BULK_UPSERT_SQL, {
+            "names": [device.name for device in devices],
+            "types": [device.type.value for device in devices],
+            "locations": [device.location for device in devices],
+            "macs": [device.mac_address for device in devices],
+            "ips": [device.ip_address for device in devices],
+            "firmwares": [device.firmware_version for device in devices],
+            "user_ids": [device.user_id for device in devices],
+        })).all()
+        created = sum(1 for row in rows if row.inserted)
+        await DeviceCRUD.count_status_change(db, {models.DeviceStatus.OFFLINE: created})
+        await add_events(db, [
+            device_event("device.created" if row.inserted else "device.updated", row) for row in rows
+        ])
+        await db.commit()
+        await device_cache.invalidate([row.id for row in rows], [row.mac_address for row in rows])
+        return [(row, row.inserted) for row in rows]
+
+    @staticmethod
+    async def bulk_update_status(db: AsyncSession, statuses: Dict[int, models.DeviceStatus]) -> List[Row]:
+        """Смена статуса пачки устройств одним UPDATE ... FROM unnest(...)"""
+        ids = sorted(statuses)
+        # Старые статусы под блокировкой - для счетчиков; порядок id против взаимоблокировок
+        locked = await db.execute(
+            text("SELECT id, status FROM devices WHERE id = ANY(:ids) ORDER BY id FOR UPDATE"),
+            {"ids": ids},
+        )
+        deltas: Dict[str, int] = {}
+        old_statuses: Dict[int, str] = {}
+        for device_id, old_status in locked:
+            new_status = statuses[device_id].value
+            if old_status != new_status:
+                old_statuses[device_id] = old_status
+                deltas[old_status] = deltas.get(old_status, 0) - 1
+                deltas[new_status] = deltas.get(new_status, 0) + 1
+        rows = (await db.execute(BULK_STATUS_SQL, {
+            "ids": ids,
+            "statuses": [statuses[device_id].value for device_id in ids],
+        })).all()
+        await DeviceCRUD.count_status_change(db, deltas)
+        await add_events(db, [
+            status_change_event(row, old_statuses[row.id], row.status) for row in rows if row.id in old_statuses
+        ])
+        await db.commit()
+        await device_cache.invalidate([row.id for row in rows])
+        return rows
+
+    @staticmethod
+    async def update(db: AsyncSession, device_id: int, device_update: schemas.DeviceUpdate) -> Optional[models.Device]:
+        db_device = await db.get(models.Device, device_id)
         if db_device:
+            old_mac_address = db_device.mac_address
             update_data = device_update.dict(exclude_unset=True)
             for field, value in update_data.items():
                 setattr(db_device, field, value)
-            db.commit()
-            db.refresh(db_device)
+            # UPDATE до записи события: блокировка строки упорядочивает события устройства
+            await db.flush()
+            await add_events(db, [device_event("device.updated", db_device)])
+            await db.commit()
+            await device_cache.invalidate([device_id], [old_mac_address, db_device.mac_address])
+            await db.refresh(db_device)
         return db_device
 
     @staticmethod
-    def update_status(db: Session, device_id: int, status: models.DeviceStatus, last_seen: Optional[datetime] = None) -> Optional[models.Device]:
-        # ✅ Теперь datetime определен!
-        db_device = db.query(models.Device).filter(models.Device.id == device_id).first()
+    async def lock(db: AsyncSession, device_id: int) -> Optional[models.Device]:
+        """Устройство под SELECT ... FOR UPDATE со свежими значениями из БД:
+        старый статус для счетчиков не гонится с параллельной сменой"""
+        return await db.get(models.Device, device_id, with_for_update=True, populate_existing=True)
+
+    @staticmethod
+    async def update_status(db: AsyncSession, device_id: int, status: models.DeviceStatus, last_seen: Optional[datetime] = None) -> Optional[models.Device]:
+        db_device = await DeviceCRUD.lock(db, device_id)
         if db_device:
+            if db_device.status != status:
+                await DeviceCRUD.count_status_change(db, {db_device.status: -1, status: 1})
+                await add_events(db, [status_change_event(db_device, db_device.status, status)])
             db_device.status = status
             if last_seen:
                 db_device.last_seen = last_seen
             db_device.updated_at = datetime.utcnow()
-            db.commit()
-            db.refresh(db_device)
+            await db.commit()
+            await device_cache.invalidate([device_id])
+            await db.refresh(db_device)
         return db_device
 
     @staticmethod
-    def delete(db: Session, device_id: int) -> bool:
-        db_device = db.query(models.Device).filter(models.Device.id == device_id).first()
+    async def apply_heartbeats(db: AsyncSession, heartbeats: Dict[int, Tuple[Optional[str], datetime]]) -> List[int]:
+        """Пачка heartbeat одной транзакцией: блокировка строк по порядку id,
+        затем один UPDATE ... FROM unnest(...). Возвращает id, перешедшие OFFLINE -> ONLINE.
+
+        Кэш сбрасывается только для смены статуса или IP: иначе каждая пачка
+        вычищала бы карточки почти всех устройств во всех процессах.
+
+        unnest массивов вместо VALUES: текст запроса не зависит от размера пачки
+        (один подготовленный statement) и нет лимита asyncpg в 32767 параметров.
+        """
+        ids = sorted(heartbeats)
+        # ORDER BY id: параллельные пачки (несколько воркеров) не взаимоблокируются
+        locked = await db.execute(
+            text("SELECT id, status, name, location, ip_address FROM devices WHERE id = ANY(:ids) ORDER BY id FOR UPDATE"),
+            {"ids": ids},
+        )
+        locked = locked.all()
+        came_online = [device for device in locked if device.status == models.DeviceStatus.OFFLINE.value]
+        changed = [
+            device.id for device in locked
+            if device.status == models.DeviceStatus.OFFLINE.value
+            or heartbeats[device.id][0] not in (None, device.ip_address)
+        ]
+        await db.execute(BULK_HEARTBEAT_SQL, {
+            "ids": ids,
+            "ips": [heartbeats[device_id][0] for device_id in ids],
+            "seen": [heartbeats[device_id][1] for device_id in ids],
+            "came_online": [device.id for device in came_online],
+        })
+        await DeviceCRUD.count_status_change(db, {
+            models.DeviceStatus.OFFLINE: -len(came_online),
+            models.DeviceStatus.ONLINE: len(came_online),
+        })
+        await add_events(db, [
+            status_change_event(device, models.DeviceStatus.OFFLINE, models.DeviceStatus.ONLINE)
+            for device in came_online
+        ])
+        await db.commit()
+        await device_cache.invalidate(changed)
+        return [device.id for device in came_online]
+
+    @staticmethod
+    async def delete(db: AsyncSession, device_id: int) -> bool:
+        db_device = await DeviceCRUD.lock(db, device_id)
         if db_device:
-            db.delete(db_device)
-            db.commit()
+            await DeviceCRUD.count_status_change(db, {db_device.status: -1})
+            await add_events(db, [device_event("device.deleted", db_device)])
+            await db.delete(db_device)
+            await db.commit()
+            await device_cache.invalidate([device_id], [db_device.mac_address])
             return True
         return False
 
     @staticmethod
-    def get_stats(db: Session) -> schemas.DeviceStats:
-        total = db.query(models.Device).count()
-        online = db.query(models.Device).filter(models.Device.status == models.DeviceStatus.ONLINE).count()
-        offline = db.query(models.Device).filter(models.Device.status == models.DeviceStatus.OFFLINE).count()
-        error = db.query(models.Device).filter(models.Device.status == models.DeviceStatus.ERROR).count()
+    async def count_status_change(db: AsyncSession, deltas: Dict[str, int]) -> None:
+        """Применяет изменения к device_status_counts в текущей транзакции.
+
+        Строки обновляются в порядке статусов, чтобы встречные смены
+        (online -> offline и offline -> online) не взаимоблокировались.
+        """
+        if not settings.device_status_counters:
+            return
+        rows = sorted(
+            (str(getattr(status, "value", status)), delta)
+            for status, delta in deltas.items() if delta
+        )
+        if not rows:
+            return
+        stmt = insert(models.DeviceStatusCount).values([{"status": status, "count": delta} for status, delta in rows])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[models.DeviceStatusCount.status],
+            set_={"count": models.DeviceStatusCount.count + stmt.excluded.count},
+        )
+        await db.execute(stmt)
+
+    @staticmethod
+    def stats_from_counts(counts: Dict[str, int]) -> Dict[str, int]:
+        by_status = {status.value: 0 for status in models.DeviceStatus}
+        for status, count in counts.items():
+            if count:
+                by_status[status] = by_status.get(status, 0) + count
+        return by_status
+
+    @staticmethod
+    async def get_stats(db: AsyncSession, user_id: Optional[int] = None, location: Optional[str] = None) -> schemas.DeviceStats:
+        """Все статусы одним запросом. Без фильтров и со счетчиками - чтение
+        device_status_counts, иначе GROUP BY status по devices"""
+        Device = models.Device
+        if user_id is None and location is None and settings.device_status_counters:
+            query = select(models.DeviceStatusCount.status, models.DeviceStatusCount.count)
+        else:
+            criteria = []
+            if user_id is not None:
+                criteria.append(Device.user_id == user_id)
+            if location is not None:
+                criteria.append(func.lower(Device.location) == location.lower())
+            query = select(Device.status, func.count()).where(*criteria).group_by(Device.status)
+        by_status = DeviceCRUD.stats_from_counts(dict((await db.execute(query)).all()))
         return schemas.DeviceStats(
-            total_devices=total,
-            online_devices=online,
-            offline_devices=offline,
-            error_devices=error
-        )
\ No newline at end of file
+            total_devices=sum(by_status.values()),
+            online_devices=by_status[models.DeviceStatus.ONLINE.value],
+            offline_devices=by_status[models.DeviceStatus.OFFLINE.value],
+            error_devices=by_status[models.DeviceStatus.ERROR.value],
+            by_status=by_status,
+        )
+
+    @staticmethod
+    async def get_stats_breakdown(db: AsyncSession, group_by: str) -> List[schemas.DeviceStatsGroup]:
+        """GROUP BY <user_id|location>, status одним запросом"""
+        Device = models.Device
+        column = Device.user_id if group_by == "user_id" else Device.location
+        rows = await db.execute(
+            select(column, Device.status, func.count()).group_by(column, Device.status).order_by(column)
+        )
+        groups: Dict = {}
+        for key, status, count in rows:
+            groups.setdefault(key, {})[status] = count
+        result = []
+        for key, counts in groups.items():
+            by_status = DeviceCRUD.stats_from_counts(counts)
+            result.append(schemas.DeviceStatsGroup(
+                key=None if key is None else str(key),
+                total_devices=sum(by_status.values()),
+                by_status=by_status,
+            ))
+        return result
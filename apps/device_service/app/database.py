@@ -1,70 +1,175 @@
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
+from typing import Optional
+from app.bootstrap import BootstrapState, run_with_retry
 from app.config import settings
 import logging
 import os
 Base = declarative_base()
 log = logging.getLogger(__name__)
 
-MASTER_URL = f"postgresql://{settings.database_user}:{settings.database_password}@{settings.database_host}:{settings.database_port}/postgres"
+MASTER_URL = f"postgresql+asyncpg://{settings.database_user}:{settings.database_password}@{settings.database_host}:{settings.database_port}/postgres"
+# Синхронный URL (psycopg2) - для скриптов в scripts/
 SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.database_user}:{settings.database_password}@{settings.database_host}:{settings.database_port}/{settings.database_name}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{settings.database_user}:{settings.database_password}@{settings.database_host}:{settings.database_port}/{settings.database_name}"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-
-def ensure_database_exists():
-    """Создать БД"""
-    master_engine = create_engine(MASTER_URL, isolation_level="AUTOCOMMIT")
-    with master_engine.connect() as conn:
-        result = conn.execute(text(f"SELECT 1 FROM pg_catalog.pg_database WHERE datname = '{settings.database_name}'"))
-        if not result.fetchone():
-            conn.execute(text(f'CREATE DATABASE "{settings.database_name}"'))
-            log.info(f"✅ Database CREATED")
-        else:
-            log.info(f"✅ Database exists")
-    master_engine.dispose()
-
-def ensure_tables_exist():
+# Рабочий движок сервиса: запросы не блокируют event loop
+engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=settings.database_pool_size,
+    max_overflow=settings.database_max_overflow,
+    pool_timeout=settings.database_pool_timeout,
+    pool_recycle=settings.database_pool_recycle,
+    pool_pre_ping=settings.database_pool_pre_ping,
+    # Кэш asyncpg и кэш подготовленных выражений диалекта SQLAlchemy
+    connect_args={
+        "statement_cache_size": settings.database_statement_cache_size,
+        "prepared_statement_cache_size": settings.database_statement_cache_size,
+    },
+)
+
+# Подготовка схемы из нескольких процессов - по очереди (лок в БД postgres)
+BOOTSTRAP_LOCK_ID = 7_346_002
+# Версия шагов bootstrap_database: увеличить при их изменении, иначе
+# подготовка с уже записанной версией пропускается
+SCHEMA_VERSION = 1
+
+bootstrap_state = BootstrapState()
+
+async def ensure_database_exists(conn):
+    """Создать БД (conn - AUTOCOMMIT-соединение с БД postgres)"""
+    exists = await conn.scalar(
+        text("SELECT 1 FROM pg_catalog.pg_database WHERE datname = :name"), {"name": settings.database_name}
+    )
+    if not exists:
+        await conn.execute(text(f'CREATE DATABASE "{settings.database_name}"'))
+        log.info("✅ Database CREATED")
+
+async def schema_version() -> Optional[int]:
+    """Версия последней завершенной подготовки; None - подготовки еще не было"""
+    async with engine.connect() as conn:
+        if await conn.scalar(text("SELECT to_regclass('device_schema_version')")) is None:
+            return None
+        return await conn.scalar(text("SELECT version FROM device_schema_version WHERE id = 1"))
+
+async def record_schema_version():
+    async with engine.begin() as conn:
+        # GREATEST: процесс прежней версии при раскатке не понижает записанную версию
+        await conn.execute(text(
+            "INSERT INTO device_schema_version (id, version, finished_at) VALUES (1, :version, now()) "
+            "ON CONFLICT (id) DO UPDATE SET version = GREATEST(device_schema_version.version, EXCLUDED.version), "
+            "finished_at = now()"
+        ), {"version": SCHEMA_VERSION})
+
+def create_schema(conn):
+    from app.models import Device
+    Base.metadata.create_all(bind=conn)
+    # create_all не добавляет индексы в уже существующую таблицу
+    for index in Device.__table__.indexes:
+        index.create(bind=conn, checkfirst=True)
+    # create_all не меняет колонки существующей таблицы: без DEFAULT и NOT NULL
+    # новые строки получили бы updated_at NULL и выпали бы из keyset по (updated_at, id)
+    conn.execute(text("ALTER TABLE devices ALTER COLUMN updated_at SET DEFAULT now()"))
+    conn.execute(text("UPDATE devices SET updated_at = COALESCE(created_at, now()) WHERE updated_at IS NULL"))
+    conn.execute(text("ALTER TABLE devices ALTER COLUMN updated_at SET NOT NULL"))
+
+async def ensure_tables_exist():
     """✅ 1. СОЗДАТЬ СТРУКТУРУ ТАБЛИЦ"""
-    from .models import Device
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(create_schema)
     log.info("✅ Tables structure created")
 
-def load_init_data():
+async def ensure_search_indexes():
+    """GIN-индекс pg_trgm: ILIKE '%...%' по location без полного сканирования"""
+    if not settings.database_trigram_search:
+        return
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_devices_location_trgm ON devices USING gin (location gin_trgm_ops)"
+            ))
+        log.info("✅ Trigram index on devices.location")
+    except Exception as e:
+        # Без pg_trgm остается точный поиск location_exact по ix_devices_location_lower
+        log.warning(f"⚠️ pg_trgm unavailable, substring location search will scan: {e}")
+
+async def ensure_status_counters():
+    """Пересобрать device_status_counts из devices (дальше их ведет DeviceCRUD)"""
+    if not settings.device_status_counters:
+        return
+    async with engine.begin() as conn:
+        # SHARE блокирует запись в devices на время пересчета, чтение не мешает
+        await conn.execute(text("LOCK TABLE devices IN SHARE MODE"))
+        await conn.execute(text("DELETE FROM device_status_counts"))
+        await conn.execute(text(
+            "INSERT INTO device_status_counts (status, count) SELECT status, count(*) FROM devices GROUP BY status"
+        ))
+    log.info("✅ Device status counters rebuilt")
+
+async def load_init_data():
     """✅ 2. ЗАГРУЗИТЬ ДАННЫЕ (ПОСЛЕ таблиц!)"""
     init_sql_path = "/app/init.sql"
-    
+
     if not os.path.exists(init_sql_path):
         log.warning("⚠️ init.sql not found")
         return
-    
-    # ✅ Проверяем devices после создания таблицы
+
     try:
-        with engine.connect() as conn:
-            device_count = conn.execute(text("SELECT COUNT(*) FROM devices")).scalar() or 0
-            
+        async with engine.connect() as conn:
+            device_count = await conn.scalar(text("SELECT COUNT(*) FROM devices")) or 0
             if device_count == 0:
-                # Выполняем init.sql
                 with open(init_sql_path, 'r') as f:
                     sql_content = f.read()
-                conn.execute(text(sql_content))
-                conn.commit()
+                # Несколько выражений подряд - простым протоколом asyncpg, без параметров
+                raw = (await conn.get_raw_connection()).driver_connection
+                await raw.execute(sql_content)
+                await conn.commit()
                 log.info("✅ Loaded init.sql data")
             else:
                 log.info(f"✅ {device_count} devices exist - skipped init.sql")
     except Exception as e:
         log.error(f"❌ init.sql error: {e}")
 
-# ✅ АВТОЗАПУСК (строгий порядок!)
-ensure_database_exists()      # 1. БД
-ensure_tables_exist()         # 2. Таблицы
-load_init_data()              # 3. Данные
+async def bootstrap_database() -> bool:
+    """Подготовка схемы под advisory-локом: БД, таблицы, индексы, данные, счетчики.
+    Выполняется один раз на версию SCHEMA_VERSION: записанная в device_schema_version
+    версия пропускает подготовку (и блокировку devices при пересчете счетчиков).
+    False - схема уже текущей версии"""
+    master_engine = create_async_engine(MASTER_URL, isolation_level="AUTOCOMMIT")
+    try:
+        async with master_engine.connect() as lock_conn:
+            params = {"lock": BOOTSTRAP_LOCK_ID}
+            if not await lock_conn.scalar(text("SELECT pg_try_advisory_lock(:lock)"), params):
+                log.info("⏳ Database bootstrap is running in another process, waiting")
+                await lock_conn.execute(text("SELECT pg_advisory_lock(:lock)"), params)
+            try:
+                await ensure_database_exists(lock_conn)
+                version = await schema_version()
+                if version is not None and version >= SCHEMA_VERSION:
+                    return False
+                await ensure_tables_exist()
+                await ensure_search_indexes()
+                await load_init_data()
+                await ensure_status_counters()
+                await record_schema_version()
+                return True
+            finally:
+                await lock_conn.execute(text("SELECT pg_advisory_unlock(:lock)"), params)
+    finally:
+        await master_engine.dispose()
+
+async def run_bootstrap(retry_interval: float):
+    """Фоновый шаг lifespan (см. app.bootstrap)"""
+    if not settings.database_bootstrap:
+        bootstrap_state.status = "disabled"
+        return
+    migrated = await run_with_retry(bootstrap_state, bootstrap_database, retry_interval)
+    log.info("✅ Database bootstrap finished" if migrated else f"✅ Database schema is current (version {SCHEMA_VERSION})")
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -0,0 +1,12 @@
+"""
+Сравнение ETag для условных GET (If-None-Match -> 304).
+Одинаковый модуль подключают gateway_api (кэш ответов) и device_service (кэш карточек):
+эталон в gateway_api, копии сверяет и обновляет apps/sync_shared_modules.py.
+"""
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Для If-None-Match используется слабое сравнение (RFC 7232, 3.2)
+    weak = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == weak for tag in if_none_match.split(","))
@@ -0,0 +1,72 @@
+"""
+Write-behind прием heartbeat.
+
+Запрос только кладет отметку в память (последняя на устройство) и сразу
+получает ответ. Фоновая задача раз в heartbeat_flush_interval секунд или
+при накоплении heartbeat_flush_batch устройств пишет все отметки одним
+UPDATE ... FROM unnest(...) в одной транзакции (цикл записи - app.batching).
+Пачка идет целиком: отметок не больше одной на устройство, ее размер
+ограничен числом устройств.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from app.batching import FlushLoop
+from app.config import settings
+from app.crud import DeviceCRUD
+from app.database import SessionLocal
+
+log = logging.getLogger(__name__)
+
+# device_id -> (ip_address, seen_at)
+Heartbeats = Dict[int, Tuple[Optional[str], datetime]]
+
+class HeartbeatBuffer(FlushLoop):
+    items = "heartbeats"
+
+    def __init__(self, flush_interval: float, flush_batch: int, max_pending: int):
+        super().__init__(flush_interval)
+        self.flush_batch = flush_batch
+        self.max_pending = max_pending
+        self.pending: Heartbeats = {}
+
+    def record(self, device_id: int, ip_address: Optional[str], seen_at: datetime) -> bool:
+        """Запоминает heartbeat. False - буфер переполнен (БД не успевает)"""
+        if device_id not in self.pending and len(self.pending) >= self.max_pending:
+            return False
+        previous = self.pending.get(device_id)
+        # Без ip в новом heartbeat сохраняем адрес из предыдущего
+        if ip_address is None and previous is not None:
+            ip_address = previous[0]
+        self.pending[device_id] = (ip_address, seen_at)
+        if len(self.pending) >= self.flush_batch:
+            self.wake()
+        return True
+
+    async def flush(self) -> bool:
+        batch, self.pending = self.pending, {}
+        try:
+            async with SessionLocal() as db:
+                came_online = await DeviceCRUD.apply_heartbeats(db, batch)
+        except Exception as e:
+            log.error(f"❌ Heartbeat flush of {len(batch)} devices failed: {e}")
+            self.restore(batch)
+            return False
+        except BaseException:
+            self.restore(batch)
+            raise
+        if came_online:
+            log.info(f"✅ {len(came_online)} devices came online")
+        return True
+
+    def restore(self, batch: Heartbeats):
+        """Возвращает пачку в буфер: отметка, пришедшая во время записи, свежее вынутой"""
+        batch.update(self.pending)
+        self.pending = batch
+
+heartbeat_buffer = HeartbeatBuffer(
+    flush_interval=settings.heartbeat_flush_interval,
+    flush_batch=settings.heartbeat_flush_batch,
+    max_pending=settings.heartbeat_max_pending,
+)
@@ -1,16 +1,55 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+from fastapi.responses import ORJSONResponse
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import os
 
-# ✅ Импорт database автоматически создает БД/таблицы!
-from app.database import get_db
+from app.database import run_bootstrap
 from app.api.health import router as health_router
 from app.api.v1.devices import router as devices_router
+from app.cache import device_cache
+from app.config import settings
+from app.heartbeats import heartbeat_buffer
+from app.metrics import MetricsMiddleware, mark_process_dead, metrics_response, start_queue_logging
+from app.outbox import outbox_relay
+
+logging.basicConfig(level=logging.INFO)
+
+async def bootstrap_then_relay():
+    await run_bootstrap(settings.database_bootstrap_retry_interval)
+    # Слушатель сбросов кэша подключается к БД сервиса - после ее создания
+    device_cache.start()
+    # Relay читает device_outbox - только когда таблица есть
+    outbox_relay.start()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_listener = start_queue_logging()
+    heartbeat_buffer.start()
+    bootstrap_task = asyncio.create_task(bootstrap_then_relay())
+    print("🚀 Device Service started!")
+    yield
+    bootstrap_task.cancel()
+    try:
+        await bootstrap_task
+    except asyncio.CancelledError:
+        pass
+    await device_cache.stop()
+    # Накопленные heartbeat пишутся до остановки
+    await heartbeat_buffer.stop()
+    # Затем события, в том числе от последней пачки heartbeat
+    await outbox_relay.stop(settings.outbox_drain_timeout)
+    log_listener.stop()
+    mark_process_dead()
 
 app = FastAPI(
     title="Device Management Service API",
     description="Микросервис для управления устройствами умного дома",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 app.add_middleware(
@@ -21,22 +60,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Метрики и выборочный access-лог
+app.add_middleware(
+    MetricsMiddleware,
+    access_logger=logging.getLogger("app.access"),
+    sample_rate=float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "0.01")),
+)
+
 app.include_router(health_router, prefix="/health")
 app.include_router(devices_router, prefix="/api/v1")
 
-@app.on_event("startup")
-async def startup_event():
-    print("🚀 Device Service started!")
-    print("✅ Database auto-created by database.py import")
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
 
 @app.get("/")
 async def root():
     return {"message": "Device Service running ✅"}
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host="0.0.0.0",
-        port=8082,
-        reload=False
-    )
\ No newline at end of file
+    from app.serving import run
+    run("app.main:app", int(os.getenv("PORT", "8082")))
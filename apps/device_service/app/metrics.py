@@ -0,0 +1,118 @@
+"""
+Метрики Prometheus и выборочный access-лог.
+Одинаковый модуль подключают gateway_api, device_service, telemetry_service и temperature_api:
+эталон в gateway_api, копии сверяет и обновляет apps/sync_shared_modules.py.
+Копии, а не общий пакет: каждый сервис собирается из своего каталога как
+контекста Docker (context: ./<сервис> в docker-compose.yml), и файлы вне
+него в образ не попадают.
+
+С PROMETHEUS_MULTIPROC_DIR (несколько воркеров, см. serving) значения пишутся
+в файлы каталога, а /metrics собирает их со всех процессов. Gauge в таком
+режиме объявляются с multiprocess_mode: livesum - сумма по живым процессам.
+"""
+
+import logging
+import os
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from starlette.responses import Response
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки запроса по шаблону маршрута",
+    ("method", "route"),
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Запросы в обработке", multiprocess_mode="livesum")
+REQUEST_ERRORS = Counter(
+    "http_request_errors_total",
+    "Ответы со статусом 4xx/5xx",
+    ("method", "route", "status"),
+)
+
+class MetricsMiddleware:
+    """ASGI middleware: задержка, ошибки и число запросов в работе.
+
+    Метка route - шаблон пути FastAPI, а не сам путь, поэтому число серий
+    ограничено числом маршрутов. Дочерние серии создаются один раз и
+    дальше берутся из словаря. Access-лог пишется для доли sample_rate
+    запросов.
+    """
+    def __init__(self, app, access_logger: logging.Logger = None, sample_rate: float = 0.0):
+        self.app = app
+        self.access_logger = access_logger or logging.getLogger("access")
+        self.sample_rate = sample_rate
+        self.latency = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            elapsed = time.perf_counter() - started
+            method = scope["method"]
+            route = scope.get("route")
+            template = getattr(route, "path", "unmatched")
+            key = (method, template)
+            latency = self.latency.get(key)
+            if latency is None:
+                latency = self.latency[key] = REQUEST_LATENCY.labels(method, template)
+            latency.observe(elapsed)
+            if status_code >= 400:
+                REQUEST_ERRORS.labels(method, template, str(status_code)).inc()
+            if self.sample_rate and random.random() < self.sample_rate:
+                client = scope.get("client")
+                self.access_logger.info(
+                    "%s - %s %s %d %.3fs",
+                    client[0] if client else "-", method, scope["path"], status_code, elapsed,
+                )
+
+def metrics_response() -> Response:
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+def mark_process_dead():
+    """При остановке воркера: его live-gauge больше не входят в сумму"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+class DeferredQueueHandler(QueueHandler):
+    """Кладет запись в очередь без форматирования: сообщение собирает
+    поток QueueListener, а не обработчик запроса"""
+    def prepare(self, record):
+        return record
+
+def start_queue_logging() -> QueueListener:
+    """
+    Переводит обработчики корневого логгера на фоновый поток.
+    Вызывается в lifespan после logging.basicConfig: переносятся уже настроенные обработчики.
+    """
+    root = logging.getLogger()
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    root.handlers = [DeferredQueueHandler(log_queue)]
+    listener.start()
+    return listener
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import BigInteger, Column, Integer, String, DateTime, Index
 from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import JSONB
 from .database import Base
 import enum
 
@@ -30,10 +31,46 @@ class Device(Base):
     firmware_version = Column(String(50))
     user_id = Column(Integer)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True))
+    # Ключ keyset-пагинации (updated_at, id); у существующей таблицы DEFAULT и
+    # NOT NULL выставляет database.create_schema
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), onupdate=func.now())
     last_seen = Column(DateTime(timezone=True))
     
-    # ✅ Check constraints (опционально)
+    # Составные индексы под фильтры списка + keyset по id / (updated_at, id)
     __table_args__ = (
+        Index("ix_devices_user_id_id", "user_id", "id"),
+        Index("ix_devices_type_id", "type", "id"),
+        Index("ix_devices_status_id", "status", "id"),
+        Index("ix_devices_updated_at_id", "updated_at", "id"),
+        Index("ix_devices_user_id_updated_at_id", "user_id", "updated_at", "id"),
+        # Точное совпадение комнаты без учета регистра; поиск по подстроке -
+        # GIN pg_trgm, его создает database.ensure_search_indexes
+        Index("ix_devices_location_lower", func.lower(location)),
         {'schema': None}
-    )
\ No newline at end of file
+    )
+
+class SchemaVersion(Base):
+    """Версия завершенной подготовки схемы (database.bootstrap_database), одна строка id = 1"""
+    __tablename__ = "device_schema_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+class DeviceStatusCount(Base):
+    """Счетчик устройств по статусу; ведется в транзакциях DeviceCRUD"""
+    __tablename__ = "device_status_counts"
+
+    status = Column(String(20), primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
+
+class OutboxEvent(Base):
+    """Событие устройства, ожидающее отправки в Kafka (transactional outbox).
+    Пишется в транзакции изменения, удаляется OutboxRelay после подтверждения брокера"""
+    __tablename__ = "device_outbox"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    event_type = Column(String(50), nullable=False)
+    key = Column(String(100), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
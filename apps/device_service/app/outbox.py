@@ -0,0 +1,240 @@
+"""
+Transactional outbox для событий устройств.
+
+DeviceCRUD пишет событие в device_outbox в той же транзакции, что и само
+изменение: событие есть тогда и только тогда, когда изменение закоммичено,
+а запрос API не ждет брокер. OutboxRelay в фоне читает таблицу по порядку id,
+отправляет пачку в Kafka (батчинг/linger/сжатие делает продюсер), дожидается
+подтверждений и только потом удаляет строки. Доставка at-least-once: после
+сбоя между подтверждением и COMMIT пачка уйдет повторно, потребители
+дедуплицируют по заголовку event_id.
+"""
+import asyncio
+import collections
+import logging
+from datetime import datetime, timezone
+from typing import Callable, List, Tuple
+
+import orjson
+from aiokafka import AIOKafkaProducer
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import schemas
+from app.config import settings
+from app.database import SessionLocal
+
+log = logging.getLogger(__name__)
+
+# (event_type, key, payload)
+OutboxRecord = Tuple[str, str, dict]
+
+# Ключ pg advisory lock: пачку отправляет один relay на всю БД. События
+# одного устройства пишутся под блокировкой его строки, поэтому их id
+# возрастают в порядке коммитов и уходят в Kafka в том же порядке
+OUTBOX_LOCK_ID = 7_346_001
+
+INSERT_EVENTS_SQL = text("""
+INSERT INTO device_outbox (event_type, key, payload)
+SELECT * FROM unnest(CAST(:event_types AS varchar[]), CAST(:keys AS varchar[]), CAST(:payloads AS jsonb[]))
+""")
+
+CLAIM_EVENTS_SQL = text("""
+SELECT id, event_type, key, payload::text AS payload
+FROM device_outbox
+ORDER BY id
+LIMIT :limit
+""")
+
+def enum_value(value) -> str:
+    return str(getattr(value, "value", value))
+
+def device_event(event_type: str, device) -> OutboxRecord:
+    """device.created / device.updated / device.deleted; device - модель или строка RETURNING"""
+    event = schemas.DeviceEvent(
+        event_type=event_type,
+        device_id=device.id,
+        device_name=device.name,
+        device_type=enum_value(device.type),
+        location=device.location,
+        status=enum_value(device.status),
+        timestamp=datetime.now(timezone.utc),
+    )
+    return event_type, str(device.id), event.model_dump(mode="json")
+
+def status_change_event(device, old_status, new_status) -> OutboxRecord:
+    event = schemas.DeviceStatusChangeEvent(
+        device_id=device.id,
+        device_name=device.name,
+        location=device.location,
+        old_status=enum_value(old_status),
+        new_status=enum_value(new_status),
+        timestamp=datetime.now(timezone.utc),
+    )
+    return "device.status.changed", str(device.id), event.model_dump(mode="json")
+
+async def add_events(db: AsyncSession, events: List[OutboxRecord]) -> None:
+    """Кладет события в device_outbox в текущей транзакции (один INSERT на пачку)"""
+    if not events:
+        return
+    await db.execute(INSERT_EVENTS_SQL, {
+        "event_types": [event_type for event_type, _, _ in events],
+        "keys": [key for _, key, _ in events],
+        "payloads": [orjson.dumps(payload).decode() for _, _, payload in events],
+    })
+    db.sync_session.info["outbox_pending"] = True
+
+@event.listens_for(Session, "after_commit")
+def wake_relay_after_commit(session: Session):
+    # Relay этого процесса забирает события сразу, не дожидаясь опроса
+    if session.info.pop("outbox_pending", False):
+        outbox_relay.wake()
+
+@event.listens_for(Session, "after_rollback")
+def forget_pending_after_rollback(session: Session):
+    session.info.pop("outbox_pending", None)
+
+class InMemoryProducer:
+    """Замена AIOKafkaProducer без брокера (KAFKA_ENABLED=false, тесты):
+    записи подтверждаются сразу и хранятся в records"""
+    def __init__(self, max_records: int = 10000):
+        self.records = collections.deque(maxlen=max_records)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def send(self, topic, value=None, key=None, headers=None):
+        self.records.append((topic, key, value, headers))
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+def kafka_producer() -> AIOKafkaProducer:
+    return AIOKafkaProducer(
+        bootstrap_servers=settings.kafka_bootstrap_servers,
+        acks="all",
+        enable_idempotence=True,
+        linger_ms=settings.kafka_linger_ms,
+        max_batch_size=settings.kafka_max_batch_size,
+        compression_type=settings.kafka_compression_type or None,
+    )
+
+def default_producer():
+    return kafka_producer() if settings.kafka_enabled else InMemoryProducer()
+
+class OutboxRelay:
+    def __init__(
+        self,
+        producer_factory: Callable,
+        topic: str,
+        batch_size: int,
+        poll_interval: float,
+        retry_interval: float,
+    ):
+        self.producer_factory = producer_factory
+        self.topic = topic
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.producer = None
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, drain_timeout: float):
+        """Останавливает фоновую отправку; остаток отправляет не дольше drain_timeout.
+        Неотправленное остается в device_outbox до следующего запуска"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.producer is None:
+            return
+        try:
+            await asyncio.wait_for(self.drain(), drain_timeout)
+        except Exception as e:
+            log.warning(f"⚠️ Outbox drain on shutdown stopped: {e}")
+        await self.producer.stop()
+        self.producer = None
+
+    async def drain(self):
+        while await self.relay_batch() == self.batch_size:
+            pass
+
+    async def connect(self):
+        producer = self.producer_factory()
+        try:
+            await producer.start()
+        except BaseException:
+            await producer.stop()
+            raise
+        self.producer = producer
+
+    async def _run(self):
+        while True:
+            try:
+                if self.producer is None:
+                    await self.connect()
+                sent = await self.relay_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f"❌ Outbox relay failed, retry in {self.retry_interval}s: {e}")
+                await asyncio.sleep(self.retry_interval)
+                continue
+            # Полная пачка - в таблице, вероятно, есть еще
+            if sent == self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def relay_batch(self) -> int:
+        """Отправляет до batch_size событий и удаляет подтвержденные. Возвращает их число"""
+        async with SessionLocal() as db:
+            locked = await db.scalar(text("SELECT pg_try_advisory_xact_lock(:lock)"), {"lock": OUTBOX_LOCK_ID})
+            if not locked:
+                return 0
+            rows = (await db.execute(CLAIM_EVENTS_SQL, {"limit": self.batch_size})).all()
+            if not rows:
+                return 0
+            # send() только ставит запись в буфер продюсера; пачку он отправит сам
+            futures = [
+                await self.producer.send(
+                    self.topic,
+                    value=row.payload.encode(),
+                    key=row.key.encode(),
+                    headers=[("event_type", row.event_type.encode()), ("event_id", str(row.id).encode())],
+                )
+                for row in rows
+            ]
+            await asyncio.gather(*futures)
+            await db.execute(
+                text("DELETE FROM device_outbox WHERE id = ANY(:ids)"),
+                {"ids": [row.id for row in rows]},
+            )
+            await db.commit()
+            return len(rows)
+
+outbox_relay = OutboxRelay(
+    producer_factory=default_producer,
+    topic=settings.kafka_topic,
+    batch_size=settings.outbox_batch_size,
+    poll_interval=settings.outbox_poll_interval,
+    retry_interval=settings.outbox_retry_interval,
+)
@@ -0,0 +1,36 @@
+"""
+Keyset-пагинация: непрозрачный курсор хранит ключ сортировки последней строки страницы
+"""
+import base64
+import enum
+from datetime import datetime
+from typing import Optional, Tuple
+
+import orjson
+
+class DeviceOrder(str, enum.Enum):
+    ID = "id"                  # ORDER BY id
+    UPDATED_AT = "updated_at"  # ORDER BY updated_at, id - выгрузка изменений
+
+def encode_cursor(order: DeviceOrder, key: Tuple) -> str:
+    if order == DeviceOrder.UPDATED_AT:
+        updated_at, device_id = key
+        payload = [order.value, updated_at.isoformat(), device_id]
+    else:
+        payload = [order.value, key[0]]
+    return base64.urlsafe_b64encode(orjson.dumps(payload)).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str], order: DeviceOrder) -> Optional[Tuple]:
+    """Ключ последней строки предыдущей страницы; ValueError для чужого или битого курсора"""
+    if not cursor:
+        return None
+    try:
+        payload = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        # Курсор другой сортировки тоже недействителен
+        if payload[0] != order.value:
+            raise ValueError
+        if order == DeviceOrder.UPDATED_AT:
+            return datetime.fromisoformat(payload[1]), int(payload[2])
+        return (int(payload[1]),)
+    except (ValueError, TypeError, KeyError, IndexError):
+        raise ValueError("Invalid cursor")
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Dict, List, Literal, Optional
 from datetime import datetime
+from .config import settings
 from .models import DeviceStatus, DeviceType
 
 class DeviceBase(BaseModel):
@@ -23,6 +24,14 @@ class DeviceUpdate(BaseModel):
     firmware_version: Optional[str] = Field(None, max_length=50)
     user_id: Optional[int] = None
 
+class DeviceFilter(BaseModel):
+    """Фильтры списка устройств; заданные поля объединяются через AND"""
+    user_id: Optional[int] = None
+    type: Optional[DeviceType] = None
+    status: Optional[DeviceStatus] = None
+    location: Optional[str] = None        # подстрока, ILIKE (GIN pg_trgm)
+    location_exact: Optional[str] = None  # комната целиком без учета регистра (btree lower(location))
+
 class DeviceStatusUpdate(BaseModel):
     status: DeviceStatus
 
@@ -40,11 +49,50 @@ class Device(DeviceBase):
     class Config:
         from_attributes = True
 
+class DeviceBulkCreate(BaseModel):
+    """Upsert по mac_address: новые устройства создаются, известные обновляются"""
+    devices: List[DeviceCreate] = Field(..., min_length=1, max_length=settings.devices_bulk_max_items)
+
+class DeviceBulkItemResult(BaseModel):
+    index: int  # позиция в запросе
+    result: Literal["created", "updated", "error"]
+    device: Optional[Device] = None
+    error: Optional[str] = None
+
+class DeviceBulkResult(BaseModel):
+    created: int
+    updated: int
+    failed: int
+    results: List[DeviceBulkItemResult]
+
+class DeviceStatusBulkItem(BaseModel):
+    device_id: int
+    status: DeviceStatus
+
+class DeviceStatusBulkUpdate(BaseModel):
+    updates: List[DeviceStatusBulkItem] = Field(..., min_length=1, max_length=settings.devices_bulk_max_items)
+
+class DeviceStatusBulkItemResult(BaseModel):
+    device_id: int
+    result: Literal["updated", "not_found"]
+    device: Optional[Device] = None
+
+class DeviceStatusBulkResult(BaseModel):
+    updated: int
+    not_found: int
+    results: List[DeviceStatusBulkItemResult]
+
 class DeviceStats(BaseModel):
     total_devices: int
     online_devices: int
     offline_devices: int
     error_devices: int
+    by_status: Dict[str, int] = Field(default_factory=dict)  # все DeviceStatus, включая нулевые
+
+class DeviceStatsGroup(BaseModel):
+    key: Optional[str] = None  # user_id или location; None - устройства без значения
+    total_devices: int
+    by_status: Dict[str, int]
 
 class HeartbeatRequest(BaseModel):
     ip_address: Optional[str] = None
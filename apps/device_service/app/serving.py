@@ -0,0 +1,96 @@
+"""
+Запуск сервиса uvicorn в production-режиме: WORKERS процессов на одном порту.
+Одинаковый модуль подключают gateway_api, device_service, telemetry_service и temperature_api:
+эталон в gateway_api, копии сверяет и обновляет apps/sync_shared_modules.py.
+Копии, а не общий пакет: каждый сервис собирается из своего каталога как
+контекста Docker (context: ./<сервис> в docker-compose.yml), и файлы вне
+него в образ не попадают.
+
+WORKERS - число воркеров (по умолчанию - доступные процессу CPU; квоту CPU
+контейнера это не учитывает, ее лучше отразить в WORKERS явно). uvloop и
+httptools используются, если установлены. По SIGTERM воркеры перестают
+принимать соединения и до GRACEFUL_SHUTDOWN_TIMEOUT секунд дорабатывают
+начатые запросы, затем выполняют shutdown приложения.
+
+Воркеры не делят память. Для нескольких воркеров главный процесс готовит
+каталог запуска SERVING_RUN_DIR; в нем файлы метрик Prometheus
+(PROMETHEUS_MULTIPROC_DIR, если не задан явно) - /metrics любого воркера
+отдает сумму по всем процессам.
+"""
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from importlib.util import find_spec
+
+import uvicorn
+
+log = logging.getLogger(__name__)
+
+def default_workers() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def prepare_run_dir(workers: int):
+    """Каталог запуска и файлов метрик; задается до старта воркеров, они наследуют окружение"""
+    if workers <= 1:
+        return None
+    run_dir = tempfile.mkdtemp(prefix="serving-")
+    os.environ["SERVING_RUN_DIR"] = run_dir
+    metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(run_dir, "metrics"))
+    os.makedirs(metrics_dir, exist_ok=True)
+    # Файлы метрик прошлого запуска в заданном явно каталоге
+    for name in os.listdir(metrics_dir):
+        if name.endswith(".db"):
+            os.remove(os.path.join(metrics_dir, name))
+    return run_dir
+
+def loaded_app(app: str):
+    """Объект приложения из уже выполненного __main__ (python main.py, python -m app.main);
+    None - строка указывает на другой модуль"""
+    module_name, _, attribute = app.partition(":")
+    main_file = getattr(sys.modules["__main__"], "__file__", None)
+    spec = find_spec(module_name)
+    if main_file is None or spec is None or spec.origin is None:
+        return None
+    if os.path.realpath(spec.origin) != os.path.realpath(main_file):
+        return None
+    return getattr(sys.modules["__main__"], attribute, None)
+
+def run(app: str, port: int, host: str = "0.0.0.0"):
+    workers = int(os.getenv("WORKERS") or default_workers())
+    os.environ["WORKERS"] = str(workers)
+    run_dir = prepare_run_dir(workers)
+    loop = "uvloop" if find_spec("uvloop") else "asyncio"
+    http = "httptools" if find_spec("httptools") else "h11"
+    log.info(f"Serving {app} on {host}:{port}: {workers} workers, loop {loop}, http {http}")
+    # Воркеры (spawn) заново выполняют модуль __main__, а затем uvicorn импортирует
+    # приложение по строке - запущенный как скрипт модуль приложения загрузился бы
+    # дважды (повторная регистрация метрик). Воркерам достается этот модуль
+    main_module = sys.modules["__main__"]
+    target = app
+    if workers <= 1:
+        # Один воркер - этот же процесс: по строке uvicorn импортировал бы модуль
+        # приложения второй раз, поэтому передается уже созданный объект
+        target = loaded_app(app) or app
+    sys.modules["__main__"] = sys.modules[__name__]
+    try:
+        uvicorn.run(
+            target,
+            host=host,
+            port=port,
+            workers=workers,
+            loop=loop,
+            http=http,
+            timeout_graceful_shutdown=int(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "20")),
+            reload=False,
+            access_log=False,
+        )
+    finally:
+        sys.modules["__main__"] = main_module
+        if run_dir is not None:
+            shutil.rmtree(run_dir, ignore_errors=True)
@@ -0,0 +1,30 @@
+"""
+Подготовка схемы device_service отдельным запуском.
+
+    python -m scripts.bootstrap_db
+
+Тот же шаг, что выполняет lifespan сервиса (БД, таблицы, индексы, init.sql,
+счетчики статусов), под тем же advisory-локом и один раз на SCHEMA_VERSION. Нужен, когда сервис запущен
+с DATABASE_BOOTSTRAP=false и схему готовит job перед выкаткой.
+Код возврата 1 - БД недоступна или подготовка упала.
+"""
+import asyncio
+import logging
+import sys
+
+from app.database import bootstrap_database, engine
+
+async def run() -> int:
+    try:
+        migrated = await bootstrap_database()
+    except Exception as e:
+        logging.getLogger(__name__).error(f"❌ Database bootstrap failed: {e}")
+        return 1
+    finally:
+        await engine.dispose()
+    print("Bootstrap finished" if migrated else "Schema is already current, bootstrap skipped")
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(run()))
@@ -0,0 +1,100 @@
+"""
+EXPLAIN-бенчмарк запросов списка устройств.
+
+    python -m scripts.explain_device_queries --seed 200000
+    python -m scripts.explain_device_queries --cleanup
+
+Схема должна быть подготовлена (запущенный сервис или python -m scripts.bootstrap_db).
+Скрипт при необходимости заполняет devices синтетическими строками (mac BENCH-*),
+выполняет запросы DeviceCRUD.list_query через EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)
+и печатает узлы плана и время. Код возврата 1, если запрос читает devices через Seq Scan.
+"""
+import argparse
+import sys
+from typing import List, Optional, Tuple
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql
+
+# app.database первым: его Base нужен models
+from app.database import SQLALCHEMY_DATABASE_URL
+from app import models, schemas
+from app.crud import DeviceCRUD
+from app.pagination import DeviceOrder
+
+SEED_SQL = """
+INSERT INTO devices (name, type, location, status, mac_address, user_id, updated_at)
+SELECT 'bench ' || g,
+       (ARRAY['temperature_sensor', 'humidity_sensor', 'motion_sensor', 'unknown'])[1 + g % 4],
+       'Room ' || (g % :rooms),
+       (ARRAY['online', 'offline', 'error', 'maintenance', 'configuring', 'low_battery'])[1 + g % 6],
+       'BENCH-' || g,
+       g % :users,
+       now() - g * interval '1 second'
+FROM generate_series(1, :rows) g
+ON CONFLICT (mac_address) DO NOTHING
+"""
+
+CASES = (
+    ("all by id", schemas.DeviceFilter(), DeviceOrder.ID, None),
+    ("user_id", schemas.DeviceFilter(user_id=42), DeviceOrder.ID, None),
+    ("user_id, next page", schemas.DeviceFilter(user_id=42), DeviceOrder.ID, (100000,)),
+    ("user_id by updated_at", schemas.DeviceFilter(user_id=42), DeviceOrder.UPDATED_AT, None),
+    ("type + status", schemas.DeviceFilter(
+        type=models.DeviceType.MOTION_SENSOR, status=models.DeviceStatus.ERROR,
+    ), DeviceOrder.ID, None),
+    ("location exact", schemas.DeviceFilter(location_exact="room 123"), DeviceOrder.ID, None),
+    ("location substring", schemas.DeviceFilter(location="oom 123"), DeviceOrder.ID, None),
+)
+
+def plan_nodes(plan: dict) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    nodes = [(plan["Node Type"], plan.get("Relation Name"), plan.get("Index Name"))]
+    for child in plan.get("Plans", ()):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+def compile_query(query) -> str:
+    return str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0, help="сколько синтетических устройств добавить")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rooms", type=int, default=5000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--cleanup", action="store_true", help="удалить синтетические устройства и выйти")
+    args = parser.parse_args()
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+    with engine.begin() as conn:
+        if args.cleanup:
+            deleted = conn.execute(text("DELETE FROM devices WHERE mac_address LIKE 'BENCH-%'")).rowcount
+            print(f"Deleted {deleted} benchmark devices")
+            return 0
+        if args.seed:
+            conn.execute(text(SEED_SQL), {"rows": args.seed, "users": args.users, "rooms": args.rooms})
+        conn.execute(text("ANALYZE devices"))
+        total = conn.execute(text("SELECT count(*) FROM devices")).scalar()
+        has_trigram = conn.execute(text("SELECT to_regclass('ix_devices_location_trgm') IS NOT NULL")).scalar()
+
+    print(f"devices: {total} rows, pg_trgm index: {'yes' if has_trigram else 'no'}\n")
+    failed = False
+    with engine.connect() as conn:
+        for name, filters, order, after in CASES:
+            sql = compile_query(DeviceCRUD.list_query(filters, order, after, args.limit))
+            plan = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")).scalar()[0]
+            nodes = plan_nodes(plan["Plan"])
+            seq_scan = any(node == "Seq Scan" and relation == "devices" for node, relation, _ in nodes)
+            # Без pg_trgm поиск по подстроке читает всю таблицу - это ожидаемо
+            expected_scan = name == "location substring" and not has_trigram
+            if seq_scan and not expected_scan:
+                failed = True
+            status = "SEQ SCAN" if seq_scan else "ok"
+            if seq_scan and expected_scan:
+                status += " (no pg_trgm)"
+            described = ", ".join(f"{node} [{index}]" if index else node for node, _, index in nodes)
+            print(f"{name:<24} {plan['Execution Time']:>9.2f} ms  {status:<22} {described}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,19 @@
+import os
+import sys
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+# Пакет app импортируется из корня сервиса, как в образе (PYTHONPATH=/app)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CREATED = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+def make_device(device_id: int, **fields):
+    """Устройство в виде ORM-объекта: атрибуты модели Device"""
+    device = dict(
+        id=device_id, name=f"sensor {device_id}", type="temperature_sensor", location="kitchen",
+        status="offline", mac_address=f"00:00:00:00:00:{device_id:02x}", ip_address="10.0.0.1",
+        firmware_version=None, user_id=None, created_at=CREATED, updated_at=CREATED, last_seen=None,
+    )
+    device.update(fields)
+    return SimpleNamespace(**device)
@@ -0,0 +1,67 @@
+import asyncio
+
+from app.batching import FlushLoop
+
+class ListLoop(FlushLoop):
+    """Буфер-список: flush пишет все накопленное за delay секунд"""
+    def __init__(self, delay: float = 0.0, fail: bool = False):
+        super().__init__(flush_interval=0.05)
+        self.delay = delay
+        self.fail = fail
+        self.pending = []
+        self.written = []
+        self.attempts = 0
+
+    async def flush(self) -> bool:
+        batch, self.pending = self.pending, []
+        self.attempts += 1
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise ConnectionError("database is down")
+        except ConnectionError:
+            self.pending = batch + self.pending
+            return False
+        self.written.extend(batch)
+        return True
+
+def test_stop_waits_for_flush_in_progress():
+    async def scenario():
+        loop = ListLoop(delay=0.05)
+        loop.start()
+        loop.pending.extend([1, 2])
+        loop.wake()
+        await asyncio.sleep(0.01)
+        # Пришло во время записи - дописывается при остановке
+        loop.pending.append(3)
+        await loop.stop()
+        return loop
+
+    loop = asyncio.run(scenario())
+    assert loop.written == [1, 2, 3]
+    assert loop.pending == []
+
+def test_failed_flush_waits_for_next_interval():
+    async def scenario():
+        loop = ListLoop(fail=True)
+        loop.start()
+        loop.pending.append(1)
+        loop.wake()
+        await asyncio.sleep(0.12)
+        attempts = loop.attempts
+        await loop.stop()
+        return attempts, loop
+
+    attempts, loop = asyncio.run(scenario())
+    # Не чаще раза в интервал, а не в цикле без пауз
+    assert 1 <= attempts <= 3
+    assert loop.pending == [1]
+
+def test_stop_without_start_writes_pending():
+    async def scenario():
+        loop = ListLoop()
+        loop.pending.append(1)
+        await loop.stop()
+        return loop
+
+    assert asyncio.run(scenario()).written == [1]
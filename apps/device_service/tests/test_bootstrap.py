@@ -0,0 +1,59 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+from app import database
+from app.database import SCHEMA_VERSION, bootstrap_database
+
+class FakeLockConnection:
+    """Соединение с БД postgres: advisory-лок всегда свободен"""
+    async def scalar(self, statement, params=None):
+        return True
+
+    async def execute(self, statement, params=None):
+        pass
+
+class FakeMasterEngine:
+    @asynccontextmanager
+    async def connect(self):
+        yield FakeLockConnection()
+
+    async def dispose(self):
+        pass
+
+def patch_steps(monkeypatch, version):
+    """Подменяет шаги подготовки; возвращает список выполненных"""
+    steps = []
+
+    def step(name):
+        async def run(*args):
+            steps.append(name)
+        return run
+
+    async def schema_version():
+        return version
+
+    monkeypatch.setattr(database, "create_async_engine", lambda *args, **kwargs: FakeMasterEngine())
+    monkeypatch.setattr(database, "schema_version", schema_version)
+    for name in ("ensure_database_exists", "ensure_tables_exist", "ensure_search_indexes",
+                 "load_init_data", "ensure_status_counters", "record_schema_version"):
+        monkeypatch.setattr(database, name, step(name))
+    return steps
+
+@pytest.mark.parametrize("version", [None, SCHEMA_VERSION - 1])
+def test_bootstrap_runs_for_new_or_outdated_schema(monkeypatch, version):
+    steps = patch_steps(monkeypatch, version)
+    assert asyncio.run(bootstrap_database())
+    assert steps == [
+        "ensure_database_exists", "ensure_tables_exist", "ensure_search_indexes",
+        "load_init_data", "ensure_status_counters", "record_schema_version",
+    ]
+
+@pytest.mark.parametrize("version", [SCHEMA_VERSION, SCHEMA_VERSION + 1])
+def test_bootstrap_skipped_for_current_schema(monkeypatch, version):
+    # Лок свободен (перезапуск без конкуренции), но подготовка уже записана:
+    # счетчики не пересчитываются и devices не блокируется
+    steps = patch_steps(monkeypatch, version)
+    assert not asyncio.run(bootstrap_database())
+    assert steps == ["ensure_database_exists"]
@@ -0,0 +1,115 @@
+import asyncio
+from types import SimpleNamespace
+
+import orjson
+
+from app import crud
+from app.cache import NOTIFY_MAX_PAYLOAD, LocalDeviceCache, notify_payloads
+from conftest import CREATED, make_device
+
+def patch_database(monkeypatch, cache: LocalDeviceCache, on_load=None):
+    """Кэш и чтение устройства из БД подменяются; возвращает список прочитанных id"""
+    loaded = []
+
+    async def get_by_id(db, device_id):
+        loaded.append(device_id)
+        if on_load is not None:
+            await on_load()
+        return make_device(device_id)
+
+    monkeypatch.setattr(crud, "device_cache", cache)
+    monkeypatch.setattr(crud.DeviceCRUD, "get_by_id", staticmethod(get_by_id))
+    return loaded
+
+def test_read_through_and_invalidate(monkeypatch):
+    cache = LocalDeviceCache(ttl=60, max_entries=10)
+    loaded = patch_database(monkeypatch, cache)
+
+    async def scenario():
+        first = await crud.DeviceCRUD.get_cached(None, 1)
+        second = await crud.DeviceCRUD.get_cached(None, 1)
+        assert second is first
+        await cache.invalidate([1])
+        await crud.DeviceCRUD.get_cached(None, 1)
+
+    asyncio.run(scenario())
+    assert loaded == [1, 1]
+
+def test_read_racing_invalidation_is_not_cached(monkeypatch):
+    cache = LocalDeviceCache(ttl=60, max_entries=10)
+    # Устройство изменилось, пока шло чтение из БД: прочитанная карточка могла устареть
+    loaded = patch_database(monkeypatch, cache, on_load=lambda: cache.invalidate([1]))
+
+    async def scenario():
+        await crud.DeviceCRUD.get_cached(None, 1)
+        await crud.DeviceCRUD.get_cached(None, 1)
+
+    asyncio.run(scenario())
+    assert loaded == [1, 1]
+
+def test_remote_invalidation_drops_entries():
+    cache = LocalDeviceCache(ttl=60, max_entries=10)
+    other = LocalDeviceCache(ttl=60, max_entries=10)
+    device = make_device(1)
+
+    async def scenario():
+        for device_id in (1, 2):
+            await cache.put(crud.CachedDevice.from_device(make_device(device_id)), cache.generation)
+        # Свой сброс из канала не применяется повторно
+        for payload in notify_payloads(cache.instance_id, [1, 2], []):
+            cache._on_notify(None, 0, "device_cache", payload)
+        assert await cache.get(1) is not None
+        for payload in notify_payloads(other.instance_id, [1], [device.mac_address]):
+            cache._on_notify(None, 0, "device_cache", payload)
+        assert await cache.get(1) is None
+        assert await cache.get_by_mac(device.mac_address) is None
+        assert await cache.get(2) is not None
+
+    asyncio.run(scenario())
+
+def test_large_invalidation_is_split_not_escalated():
+    device_ids = list(range(1_000_000, 1_005_000))
+    mac_addresses = [f"aa:bb:cc:{i >> 16 & 0xff:02x}:{i >> 8 & 0xff:02x}:{i & 0xff:02x}" for i in range(3000)]
+    payloads = notify_payloads("instance", device_ids, mac_addresses)
+    assert len(payloads) > 1
+    assert all(len(payload.encode()) <= NOTIFY_MAX_PAYLOAD for payload in payloads)
+    messages = [orjson.loads(payload) for payload in payloads]
+    assert not any(message.get("all") for message in messages)
+    assert [i for message in messages for i in message["ids"]] == device_ids
+    assert [mac for message in messages for mac in message["macs"]] == mac_addresses
+    assert notify_payloads("instance", [], []) == []
+
+def test_heartbeats_invalidate_only_changed_devices(monkeypatch):
+    locked = [
+        make_device(1, status="offline"),
+        make_device(2, status="online"),
+        make_device(3, status="online"),
+        make_device(4, status="online"),
+    ]
+    invalidated = []
+
+    class FakeSession:
+        async def execute(self, statement, params=None):
+            return SimpleNamespace(all=lambda: locked)
+
+        async def commit(self):
+            pass
+
+    async def invalidate(device_ids=(), mac_addresses=()):
+        invalidated.extend(device_ids)
+
+    async def ignore(*args):
+        pass
+
+    monkeypatch.setattr(crud, "add_events", ignore)
+    monkeypatch.setattr(crud.DeviceCRUD, "count_status_change", staticmethod(ignore))
+    monkeypatch.setattr(crud.device_cache, "invalidate", invalidate)
+    heartbeats = {
+        1: (None, CREATED),  # OFFLINE -> ONLINE
+        2: (None, CREATED),  # только last_seen
+        3: ("10.0.0.1", CREATED),  # IP тот же
+        4: ("10.0.0.9", CREATED),  # IP сменился
+    }
+    came_online = asyncio.run(crud.DeviceCRUD.apply_heartbeats(FakeSession(), heartbeats))
+    assert came_online == [1]
+    assert invalidated == [1, 4]
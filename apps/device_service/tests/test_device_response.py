@@ -0,0 +1,31 @@
+import orjson
+from starlette.requests import Request
+
+from app.api.v1.devices import cached_device_response
+from app.cache import CachedDevice, device_etag
+from app.etags import etag_matches
+from conftest import CREATED, make_device
+
+def make_request(if_none_match: str = None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+def test_not_modified_when_etag_matches():
+    entry = CachedDevice.from_device(make_device(1))
+    assert entry.etag == device_etag(make_device(1))
+
+    response = cached_device_response(make_request(), entry)
+    assert response.status_code == 200
+    assert response.headers["etag"] == entry.etag
+    assert orjson.loads(response.body)["id"] == 1
+
+    for if_none_match in (entry.etag, entry.etag.removeprefix("W/"), f'"other", {entry.etag}', "*"):
+        response = cached_device_response(make_request(if_none_match), entry)
+        assert response.status_code == 304
+        assert response.body == b""
+        assert response.headers["etag"] == entry.etag
+
+    # Изменение устройства сдвигает updated_at и ETag
+    changed = CachedDevice.from_device(make_device(1, updated_at=CREATED.replace(second=1)))
+    assert not etag_matches(entry.etag, changed.etag)
+    assert cached_device_response(make_request(entry.etag), changed).status_code == 200
@@ -0,0 +1,85 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+from app import heartbeats
+from app.heartbeats import HeartbeatBuffer
+
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+LATER = NOW.replace(minute=1)
+
+@asynccontextmanager
+async def fake_session():
+    yield None
+
+def patch_apply(monkeypatch, delay: float = 0.0, fail: bool = False):
+    """Подменяет UPDATE пачки; возвращает список записанных пачек"""
+    applied = []
+
+    async def apply_heartbeats(db, batch):
+        await asyncio.sleep(delay)
+        if fail:
+            raise ConnectionError("database is down")
+        applied.append(dict(batch))
+        return []
+
+    monkeypatch.setattr(heartbeats, "SessionLocal", fake_session)
+    monkeypatch.setattr(heartbeats.DeviceCRUD, "apply_heartbeats", staticmethod(apply_heartbeats))
+    return applied
+
+def test_record_keeps_last_heartbeat_and_known_ip():
+    buffer = HeartbeatBuffer(flush_interval=60, flush_batch=100, max_pending=2)
+    assert buffer.record(1, "10.0.0.1", NOW)
+    assert buffer.record(1, None, LATER)
+    assert buffer.record(2, None, NOW)
+    # Буфер полон: новое устройство не помещается, известное обновляется
+    assert not buffer.record(3, None, NOW)
+    assert buffer.record(2, "10.0.0.2", LATER)
+    assert buffer.pending == {1: ("10.0.0.1", LATER), 2: ("10.0.0.2", LATER)}
+
+def test_cancelled_flush_keeps_fresher_heartbeat(monkeypatch):
+    patch_apply(monkeypatch, delay=10)
+
+    async def scenario():
+        buffer = HeartbeatBuffer(flush_interval=60, flush_batch=100, max_pending=100)
+        buffer.record(1, "10.0.0.1", NOW)
+        buffer.record(2, "10.0.0.2", NOW)
+        task = asyncio.create_task(buffer.flush())
+        await asyncio.sleep(0.01)
+        # Во время записи устройство 2 прислало новую отметку
+        buffer.record(2, "10.0.0.9", LATER)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return buffer
+
+    buffer = asyncio.run(scenario())
+    assert buffer.pending == {1: ("10.0.0.1", NOW), 2: ("10.0.0.9", LATER)}
+
+def test_failed_flush_keeps_batch(monkeypatch):
+    patch_apply(monkeypatch, fail=True)
+
+    async def scenario():
+        buffer = HeartbeatBuffer(flush_interval=60, flush_batch=100, max_pending=100)
+        buffer.record(5, None, NOW)
+        assert not await buffer.flush()
+        return buffer
+
+    assert asyncio.run(scenario()).pending == {5: (None, NOW)}
+
+def test_batch_size_triggers_flush(monkeypatch):
+    applied = patch_apply(monkeypatch)
+
+    async def scenario():
+        buffer = HeartbeatBuffer(flush_interval=60, flush_batch=2, max_pending=100)
+        buffer.start()
+        buffer.record(1, None, NOW)
+        buffer.record(2, None, NOW)
+        await asyncio.sleep(0.05)
+        written = list(applied)
+        await buffer.stop()
+        return written
+
+    assert asyncio.run(scenario()) == [{1: (None, NOW), 2: (None, NOW)}]
@@ -0,0 +1,83 @@
+"""Keyset по (updated_at, id) на настоящем Postgres (DATABASE_* из окружения);
+без доступной БД тесты пропускаются"""
+import asyncio
+import uuid
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import schemas
+from app.crud import DeviceCRUD
+from app.database import MASTER_URL, create_schema
+from app.pagination import DeviceOrder, decode_cursor, encode_cursor
+
+async def schema_engine(schema: str):
+    """Движок с отдельной схемой: таблицы теста не пересекаются с данными сервиса"""
+    admin = create_async_engine(MASTER_URL, isolation_level="AUTOCOMMIT")
+    try:
+        async with admin.connect() as conn:
+            await conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+    finally:
+        await admin.dispose()
+    return create_async_engine(MASTER_URL, connect_args={"server_settings": {"search_path": schema}})
+
+async def drop_schema(schema: str):
+    admin = create_async_engine(MASTER_URL, isolation_level="AUTOCOMMIT")
+    try:
+        async with admin.connect() as conn:
+            await conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+    finally:
+        await admin.dispose()
+
+async def insert_device(conn, name: str):
+    # Как DeviceCRUD.create: updated_at не передается, его ставит DEFAULT колонки
+    await conn.execute(
+        text("INSERT INTO devices (name, type, location, status) VALUES (:name, 'unknown', 'hall', 'offline')"),
+        {"name": name},
+    )
+
+async def page_through(engine, limit: int):
+    """id всех страниц по курсорам X-Next-Cursor"""
+    seen, cursor = [], None
+    async with engine.connect() as conn:
+        while True:
+            after = decode_cursor(cursor, DeviceOrder.UPDATED_AT)
+            query = DeviceCRUD.list_query(schemas.DeviceFilter(), DeviceOrder.UPDATED_AT, after, limit)
+            rows = (await conn.execute(query)).all()
+            seen.extend(row.id for row in rows[:limit])
+            if len(rows) <= limit:
+                return seen
+            last = rows[limit - 1]
+            cursor = encode_cursor(DeviceOrder.UPDATED_AT, (last.updated_at, last.id))
+
+def test_rows_inserted_into_legacy_table_are_paged_once():
+    schema = f"test_keyset_{uuid.uuid4().hex[:8]}"
+
+    async def scenario():
+        try:
+            engine = await schema_engine(schema)
+        except (OSError, ConnectionError) as e:
+            pytest.skip(f"database unavailable: {e}")
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(create_schema)
+                # Таблица прежней версии: updated_at без DEFAULT и NOT NULL
+                await conn.execute(text(
+                    "ALTER TABLE devices ALTER COLUMN updated_at DROP DEFAULT, ALTER COLUMN updated_at DROP NOT NULL"
+                ))
+                for index in range(3):
+                    await insert_device(conn, f"legacy {index}")
+                assert await conn.scalar(text("SELECT count(*) FROM devices WHERE updated_at IS NULL")) == 3
+            async with engine.begin() as conn:
+                await conn.run_sync(create_schema)
+                for index in range(4):
+                    await insert_device(conn, f"new {index}")
+                assert await conn.scalar(text("SELECT count(*) FROM devices WHERE updated_at IS NULL")) == 0
+                ids = list(await conn.scalars(text("SELECT id FROM devices")))
+            assert sorted(await page_through(engine, limit=2)) == sorted(ids)
+        finally:
+            await engine.dispose()
+            await drop_schema(schema)
+
+    asyncio.run(scenario())
@@ -0,0 +1,70 @@
+import asyncio
+import base64
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import orjson
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app import schemas
+from app.crud import DeviceCRUD
+from app.pagination import DeviceOrder, decode_cursor, encode_cursor
+
+UPDATED = datetime(2026, 1, 1, 12, 30, 15, 123456)
+
+@pytest.mark.parametrize("order, key", [
+    (DeviceOrder.ID, (42,)),
+    (DeviceOrder.UPDATED_AT, (UPDATED, 42)),
+    # Микросекунды и зона не теряются: иначе страница повторила бы или пропустила строки
+    (DeviceOrder.UPDATED_AT, (UPDATED.replace(tzinfo=timezone(timedelta(hours=3))), 7)),
+])
+def test_cursor_round_trip(order, key):
+    cursor = encode_cursor(order, key)
+    # Курсор без паддинга и символов, которые надо экранировать в query string
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+    assert decode_cursor(cursor, order) == key
+
+@pytest.mark.parametrize("cursor", [None, ""])
+def test_no_cursor_is_first_page(cursor):
+    assert decode_cursor(cursor, DeviceOrder.ID) is None
+
+def raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(payload)).decode().rstrip("=")
+
+@pytest.mark.parametrize("order, cursor", [
+    # Курсор другой сортировки
+    (DeviceOrder.UPDATED_AT, encode_cursor(DeviceOrder.ID, (42,))),
+    (DeviceOrder.ID, encode_cursor(DeviceOrder.UPDATED_AT, (UPDATED, 42))),
+    (DeviceOrder.ID, "not a cursor"),
+    (DeviceOrder.ID, raw_cursor({"order": "id"})),
+    (DeviceOrder.ID, raw_cursor(["id"])),
+    (DeviceOrder.ID, raw_cursor(["id", "abc"])),
+    (DeviceOrder.UPDATED_AT, raw_cursor(["updated_at", "yesterday", 1])),
+    (DeviceOrder.UPDATED_AT, raw_cursor(["updated_at", 5, 1])),
+])
+def test_invalid_cursor(order, cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor, order)
+
+@pytest.mark.parametrize("order, key", [
+    (DeviceOrder.ID, [3]),
+    (DeviceOrder.UPDATED_AT, [UPDATED + timedelta(seconds=3), 3]),
+])
+def test_next_page_starts_after_last_device(order, key):
+    devices = [SimpleNamespace(id=index, updated_at=UPDATED + timedelta(seconds=index)) for index in range(1, 5)]
+
+    class FakeSession:
+        async def execute(self, query):
+            return SimpleNamespace(scalars=lambda: iter(devices))
+
+    filters = schemas.DeviceFilter()
+    page, next_key = asyncio.run(DeviceCRUD.list_devices(FakeSession(), filters, order, limit=3))
+    assert [device.id for device in page] == [1, 2, 3]
+
+    # Ключ последней строки через курсор попадает в WHERE следующей страницы
+    after = decode_cursor(encode_cursor(order, next_key), order)
+    query = DeviceCRUD.list_query(filters, order, after, limit=3).compile(dialect=postgresql.dialect())
+    # (ключ) > (после последней) ... LIMIT 3 + 1
+    assert list(query.params.values()) == key + [4]
+    assert ") > (" in str(query)
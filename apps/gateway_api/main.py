@@ -5,19 +5,33 @@ Backend for Frontend (BFF) паттерн
 """
 
 import os
+import asyncio
+import fcntl
+import hashlib
+import json
 import logging
+import math
+import random
 import time
-import signal
-import sys
-from typing import Dict, Any
-from urllib.parse import urlparse, urlunparse
-import uvicorn
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional
+from urllib.parse import quote, urlparse, urlunparse
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 from contextlib import asynccontextmanager
 from pydantic import BaseModel
 import httpx
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # нужен только для общего rate limit нескольких реплик
+    redis_asyncio = None
+from prometheus_client import Counter, Gauge, Histogram
+
+from compression import CompressionMiddleware
+from etags import etag_matches
+from metrics import LATENCY_BUCKETS, MetricsMiddleware, mark_process_dead, metrics_response, start_queue_logging
 
 # Configure logging
 logging.basicConfig(
@@ -25,18 +39,704 @@ logging.basicConfig(
     format='API Gateway - %(asctime)s | %(levelname)s | %(message)s'
 )
 logger = logging.getLogger(__name__)
+# httpx пишет INFO-строку на каждый запрос к апстриму
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Upstream metrics
+UPSTREAM_LATENCY = Histogram(
+    "gateway_upstream_duration_seconds",
+    "Время до заголовков ответа апстрима",
+    ("upstream",),
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_IN_FLIGHT = Gauge("gateway_upstream_in_flight", "Запросы к апстриму в работе", ("upstream",), multiprocess_mode="livesum")
+RATE_LIMITED = Counter("gateway_rate_limited_total", "Запросы, отклоненные rate limit", ("scope",))
+UPSTREAM_ERRORS = Counter(
+    "gateway_upstream_errors_total",
+    "Ошибки апстрима: transport, status_5xx, circuit_open, rejected",
+    ("upstream", "kind"),
+)
 
 # Configuration
+class UpstreamConfig:
+    """Настройки пула соединений к одному апстриму.
+
+    Каждый параметр читается из {PREFIX}_<PARAM>, затем из общего
+    UPSTREAM_<PARAM>, затем берется значение по умолчанию.
+    """
+    def __init__(self, name: str, env_prefix: str, default_url: str, default_health_path: str = "/health"):
+        self.name = name
+        # Несколько инстансов задаются через запятую
+        self.urls = [url.strip() for url in os.getenv(f"{env_prefix}_URL", default_url).split(",") if url.strip()]
+        self.balancer = self._get(env_prefix, "BALANCER", "p2c")
+        self.health_path = self._get(env_prefix, "HEALTH_PATH", default_health_path)
+        # Пассивное исключение инстанса после N подряд ошибок; вернется после успешного /health
+        self.eject_failures = int(self._get(env_prefix, "EJECT_FAILURES", "3"))
+        self.eject_seconds = float(self._get(env_prefix, "EJECT_SECONDS", "30.0"))
+        self.max_connections = int(self._get(env_prefix, "MAX_CONNECTIONS", "100"))
+        self.max_keepalive_connections = int(self._get(env_prefix, "MAX_KEEPALIVE", "20"))
+        self.keepalive_expiry = float(self._get(env_prefix, "KEEPALIVE_EXPIRY", "5.0"))
+        self.connect_timeout = float(self._get(env_prefix, "CONNECT_TIMEOUT", "5.0"))
+        self.read_timeout = float(self._get(env_prefix, "READ_TIMEOUT", "30.0"))
+        self.write_timeout = float(self._get(env_prefix, "WRITE_TIMEOUT", "30.0"))
+        self.pool_timeout = float(self._get(env_prefix, "POOL_TIMEOUT", "5.0"))
+        self.http2 = self._get(env_prefix, "HTTP2", "false").lower() in ("1", "true", "yes")
+        # Circuit breaker: после N подряд ошибок апстрим закрывается на OPEN_SECONDS
+        self.breaker_failure_threshold = int(self._get(env_prefix, "BREAKER_FAILURES", "5"))
+        self.breaker_open_seconds = float(self._get(env_prefix, "BREAKER_OPEN_SECONDS", "10.0"))
+        self.breaker_half_open_probes = int(self._get(env_prefix, "BREAKER_HALF_OPEN_PROBES", "1"))
+        # Повторы идемпотентных запросов: не больше RETRY_BUDGET_RATIO от потока запросов
+        self.retry_attempts = int(self._get(env_prefix, "RETRY_ATTEMPTS", "2"))
+        self.retry_budget_ratio = float(self._get(env_prefix, "RETRY_BUDGET_RATIO", "0.2"))
+        self.retry_backoff = float(self._get(env_prefix, "RETRY_BACKOFF", "0.05"))
+        # Hedged GET: второй запрос, если первый не ответил за перцентиль задержки (0 - выключено)
+        self.hedge_percentile = float(self._get(env_prefix, "HEDGE_PERCENTILE", "0"))
+        self.hedge_min_delay = float(self._get(env_prefix, "HEDGE_MIN_DELAY", "0.05"))
+        # Admission control: не больше MAX_IN_FLIGHT запросов (0 - без ограничения),
+        # остальные ждут в очереди до QUEUE_TIMEOUT и получают 503
+        self.max_in_flight = int(self._get(env_prefix, "MAX_IN_FLIGHT", "256"))
+        self.max_queue = int(self._get(env_prefix, "MAX_QUEUE", "512"))
+        self.queue_timeout = float(self._get(env_prefix, "QUEUE_TIMEOUT", "0.5"))
+
+    @staticmethod
+    def _get(env_prefix: str, param: str, default: str) -> str:
+        return os.getenv(f"{env_prefix}_{param}", os.getenv(f"UPSTREAM_{param}", default))
+
+def parse_rate_limits(raw: str) -> Dict[str, tuple]:
+    """"префикс=rps:burst" через запятую"""
+    limits = {}
+    for item in raw.split(","):
+        prefix, sep, value = item.partition("=")
+        if sep:
+            rate, _, burst = value.partition(":")
+            limits[prefix.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+def parse_ttls(raw: str) -> Dict[str, float]:
+    ttls = {}
+    for item in raw.split(","):
+        prefix, sep, ttl = item.partition("=")
+        if sep and float(ttl) > 0:
+            ttls[prefix.strip()] = float(ttl)
+    return ttls
+
 class GatewayConfig:
     def __init__(self):
-        self.smart_home_url = os.getenv("SMART_HOME_URL", "http://smarthome-app:8080")
-        self.device_service_url = os.getenv("DEVICE_SERVICE_URL", "http://device-service:8082")
-        self.telemetry_service_url = os.getenv("TELEMETRY_SERVICE_URL", "http://telemetry-service:8083")
+        self.upstreams = {
+            "smart-home": UpstreamConfig("smart-home", "SMART_HOME", "http://smarthome-app:8080"),
+            "device": UpstreamConfig("device", "DEVICE_SERVICE", "http://device-service:8082", "/health/ready"),
+            "telemetry": UpstreamConfig("telemetry", "TELEMETRY_SERVICE", "http://telemetry-service:8083"),
+        }
+        self.health_check_interval = float(os.getenv("GATEWAY_HEALTH_CHECK_INTERVAL", "5.0"))
+
+        # Rate limiting: token bucket на клиента и на префикс маршрута (0 - выключено)
+        self.client_rate = float(os.getenv("RATE_LIMIT_CLIENT_RPS", "50"))
+        self.client_burst = float(os.getenv("RATE_LIMIT_CLIENT_BURST", "100"))
+        self.route_limits = parse_rate_limits(os.getenv("RATE_LIMIT_ROUTES", ""))
+        self.trust_forwarded_for = os.getenv("GATEWAY_TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+        # Общее состояние для нескольких реплик шлюза (redis://...), иначе в памяти
+        self.rate_limit_redis_url = os.getenv("RATE_LIMIT_REDIS_URL", "")
+        # Воркеры процесса (serving.run); без Redis каждый лимитирует свою долю
+        self.workers = max(1, int(os.getenv("WORKERS", "1")))
+
+        # Дедлайн одного вызова апстрима в BFF-агрегации
+        self.bff_call_timeout = float(os.getenv("BFF_CALL_TIMEOUT", "2.0"))
+
+        # Кэш GET-ответов: "префикс=TTL в секундах" через запятую
+        self.cache_ttls = parse_ttls(os.getenv("GATEWAY_CACHE_TTLS", "/api/v1/sensors=2,/api/v1/devices=5"))
+        self.cache_max_entries = int(os.getenv("GATEWAY_CACHE_MAX_ENTRIES", "1024"))
+        self.cache_max_body_bytes = int(os.getenv("GATEWAY_CACHE_MAX_BODY_BYTES", str(256 * 1024)))
 
 config = GatewayConfig()
 
-# HTTP Client
-http_client = httpx.AsyncClient(timeout=30.0, limits=httpx.Limits(max_keepalive_connections=10))
+# Upstream resilience
+class CircuitOpenError(Exception):
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"Circuit for {upstream} is open")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """closed -> open после N подряд ошибок; по истечении open_seconds
+    пропускает ограниченное число пробных запросов (half-open)"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, open_seconds: float, half_open_probes: int):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now - self.opened_at < self.open_seconds:
+                return False
+            self.state = self.HALF_OPEN
+            self.probes = 0
+        if self.probes >= self.half_open_probes:
+            return False
+        self.probes += 1
+        return True
+
+    def retry_after(self) -> float:
+        return max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Пробный запрос прерван без результата"""
+        if self.state == self.HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+class AdmissionRejected(Exception):
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"Upstream {upstream} is at capacity")
+        self.retry_after = retry_after
+
+class RetryBudget:
+    """Каждый запрос добавляет ratio токена, каждый повтор тратит один"""
+    def __init__(self, ratio: float, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+class LatencyTracker:
+    """Скользящее окно задержек до заголовков ответа"""
+    def __init__(self, window: int = 512, min_samples: int = 50, refresh_every: int = 64):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.refresh_every = refresh_every
+        self.pending = 0
+        self.sorted_samples = []
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self.pending += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        # Пересортировка раз в refresh_every замеров
+        if self.pending >= self.refresh_every or not self.sorted_samples:
+            self.sorted_samples = sorted(self.samples)
+            self.pending = 0
+        index = min(len(self.sorted_samples) - 1, int(len(self.sorted_samples) * p / 100))
+        return self.sorted_samples[index]
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRYABLE_STATUSES = frozenset({502, 503, 504})
+
+def close_when_done(task: asyncio.Task):
+    """Закрывает ответ проигравшего hedged-запроса"""
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(task.result().aclose())
+
+# Rate limiting
+RATE_LIMIT_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+class LocalRateLimiter:
+    """Token bucket в памяти процесса; число ключей ограничено LRU.
+
+    При shares > 1 (несколько воркеров без общего хранилища) процесс пропускает
+    1/shares лимита: соединения распределяет ядро, поэтому сумма по воркерам
+    близка к лимиту, но клиент с одним keep-alive соединением получит только долю.
+    """
+    def __init__(self, max_keys: int = 100_000, shares: int = 1):
+        self.buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.max_keys = max_keys
+        self.shares = shares
+
+    async def acquire(self, key: str, rate: float, burst: float) -> float:
+        """0 - запрос разрешен, иначе через сколько секунд появится токен"""
+        if self.shares > 1:
+            rate = rate / self.shares
+            burst = max(1.0, burst / self.shares)
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(burst, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+        if bucket.tokens >= 1.0:
+            bucket.tokens -= 1.0
+            return 0.0
+        return (1.0 - bucket.tokens) / rate
+
+class RedisRateLimiter:
+    """Token bucket в Redis-совместимом хранилище, общий для реплик шлюза.
+    При недоступности хранилища используется локальный лимитер."""
+    def __init__(self, url: str):
+        self.client = redis_asyncio.from_url(url)
+        self.script = self.client.register_script(RATE_LIMIT_SCRIPT)
+        self.fallback = LocalRateLimiter(shares=config.workers)
+
+    async def acquire(self, key: str, rate: float, burst: float) -> float:
+        try:
+            wait = await self.script(keys=[f"gateway:rl:{key}"], args=[rate, burst, time.time()])
+            return float(wait)
+        except Exception as e:
+            logger.debug("Rate limit backend unavailable: %s", e)
+            return await self.fallback.acquire(key, rate, burst)
+
+def create_rate_limiter():
+    if config.rate_limit_redis_url:
+        if redis_asyncio is None:
+            logger.warning("RATE_LIMIT_REDIS_URL is set but redis is not installed, using in-memory limiter")
+        else:
+            return RedisRateLimiter(config.rate_limit_redis_url)
+    if config.workers > 1:
+        logger.warning(f"In-memory rate limit with {config.workers} workers: each worker allows 1/{config.workers} of the limit")
+    return LocalRateLimiter(shares=config.workers)
+
+# Load balancing
+class UpstreamInstance:
+    __slots__ = ("url", "outstanding", "failures", "ejected_until")
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    def is_ejected(self, now: float) -> bool:
+        return self.ejected_until > now
+
+    def release(self):
+        self.outstanding -= 1
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "outstanding": self.outstanding,
+            "failures": self.failures,
+            "ejected": self.is_ejected(now),
+        }
+
+class TrackedStream(httpx.AsyncByteStream):
+    """Вызывает on_close, когда тело ответа дочитано или закрыто"""
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self.stream = stream
+        self.on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        if self.on_close is not None:
+            self.on_close()
+            self.on_close = None
+        await self.stream.aclose()
+
+class LoadBalancer:
+    """Выбор инстанса: p2c (power of two choices) или least (наименьшее
+    число незавершенных запросов). Исключенные инстансы пропускаются,
+    пока остаются другие."""
+    def __init__(self, urls, strategy: str, eject_failures: int, eject_seconds: float):
+        self.instances = [UpstreamInstance(url) for url in urls]
+        self.strategy = strategy
+        self.eject_failures = eject_failures
+        self.eject_seconds = eject_seconds
+
+    def pick(self, exclude: Optional[UpstreamInstance] = None) -> UpstreamInstance:
+        now = time.monotonic()
+        candidates = [i for i in self.instances if not i.is_ejected(now) and i is not exclude]
+        if not candidates:
+            # Все исключены - лучше попробовать, чем отказать сразу
+            candidates = [i for i in self.instances if i is not exclude] or self.instances
+        if not candidates:
+            raise httpx.ConnectError("No upstream instances configured")
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.strategy == "least":
+            lowest = min(i.outstanding for i in candidates)
+            return random.choice([i for i in candidates if i.outstanding == lowest])
+        first, second = random.sample(candidates, 2)
+        return first if first.outstanding <= second.outstanding else second
+
+    def record_success(self, instance: UpstreamInstance):
+        instance.failures = 0
+
+    def record_failure(self, instance: UpstreamInstance):
+        instance.failures += 1
+        if instance.failures >= self.eject_failures and not instance.is_ejected(time.monotonic()):
+            instance.ejected_until = time.monotonic() + self.eject_seconds
+            logger.warning(f"Upstream instance {instance.url} ejected after {instance.failures} failures")
+
+    def readmit(self, instance: UpstreamInstance):
+        instance.failures = 0
+        instance.ejected_until = 0.0
+
+    def add(self, url: str) -> bool:
+        url = url.rstrip("/")
+        if any(i.url == url for i in self.instances):
+            return False
+        # Новый список, чтобы не мешать итерациям в pick()
+        self.instances = self.instances + [UpstreamInstance(url)]
+        return True
+
+    def remove(self, url: str) -> bool:
+        url = url.rstrip("/")
+        remaining = [i for i in self.instances if i.url != url]
+        if len(remaining) == len(self.instances):
+            return False
+        self.instances = remaining
+        return True
+
+    def urls(self):
+        return [i.url for i in self.instances]
+
+    def set_urls(self, urls: List[str]):
+        """Новый состав инстансов; у оставшихся сохраняется состояние"""
+        current = {i.url: i for i in self.instances}
+        self.instances = [current.get(url.rstrip("/")) or UpstreamInstance(url) for url in urls]
+
+# HTTP Clients: отдельный пул на каждый апстрим, чтобы медленный сервис
+# не занимал keep-alive слоты остальных
+class UpstreamPool:
+    def __init__(self, upstream: UpstreamConfig):
+        self.config = upstream
+        self.transport = httpx.AsyncHTTPTransport(
+            http2=upstream.http2,
+            limits=httpx.Limits(
+                max_connections=upstream.max_connections,
+                max_keepalive_connections=upstream.max_keepalive_connections,
+                keepalive_expiry=upstream.keepalive_expiry,
+            ),
+        )
+        self.client = httpx.AsyncClient(
+            transport=self.transport,
+            timeout=httpx.Timeout(
+                connect=upstream.connect_timeout,
+                read=upstream.read_timeout,
+                write=upstream.write_timeout,
+                pool=upstream.pool_timeout,
+            ),
+        )
+        self.breaker = CircuitBreaker(
+            upstream.breaker_failure_threshold,
+            upstream.breaker_open_seconds,
+            upstream.breaker_half_open_probes,
+        )
+        self.retry_budget = RetryBudget(upstream.retry_budget_ratio)
+        self.latency = LatencyTracker()
+        self.balancer = LoadBalancer(
+            upstream.urls, upstream.balancer, upstream.eject_failures, upstream.eject_seconds
+        )
+        self.semaphore = asyncio.Semaphore(upstream.max_in_flight) if upstream.max_in_flight > 0 else None
+        self.queued = 0
+        self.in_flight = 0
+        self.latency_metric = UPSTREAM_LATENCY.labels(upstream.name)
+        self.in_flight_metric = UPSTREAM_IN_FLIGHT.labels(upstream.name)
+        self.error_metrics = {
+            kind: UPSTREAM_ERRORS.labels(upstream.name, kind)
+            for kind in ("transport", "status_5xx", "circuit_open", "rejected")
+        }
+
+    async def send(self, method: str, target: str, headers, content=None) -> httpx.Response:
+        """Отправляет запрос через circuit breaker с повторами и hedging.
+
+        target - путь с query-строкой. Запрос с потоковым телом (content)
+        отправляется один раз, остальные идемпотентные можно повторить на
+        другом инстансе. Ответ возвращается в потоковом режиме.
+        """
+        if not self.breaker.allow():
+            self.error_metrics["circuit_open"].inc()
+            raise CircuitOpenError(self.config.name, self.breaker.retry_after())
+        try:
+            await self._admit()
+        except BaseException:
+            # Отказ admission или отмена в очереди: пробный слот half-open не теряется
+            self.breaker.release()
+            raise
+        self.retry_budget.deposit()
+        try:
+            resp = await self._send_with_retries(method, target, headers, content)
+        except BaseException:
+            self._release()
+            raise
+        # Слот admission занят, пока тело ответа не отдано клиенту
+        resp.stream = TrackedStream(resp.stream, self._release)
+        return resp
+
+    async def _admit(self):
+        if self.semaphore is not None:
+            if self.semaphore.locked():
+                if self.queued >= self.config.max_queue:
+                    self.error_metrics["rejected"].inc()
+                    raise AdmissionRejected(self.config.name, self.config.queue_timeout)
+                self.queued += 1
+                try:
+                    await asyncio.wait_for(self.semaphore.acquire(), self.config.queue_timeout)
+                except asyncio.TimeoutError:
+                    self.error_metrics["rejected"].inc()
+                    raise AdmissionRejected(self.config.name, self.config.queue_timeout)
+                finally:
+                    self.queued -= 1
+            else:
+                await self.semaphore.acquire()
+        self.in_flight += 1
+        self.in_flight_metric.inc()
+
+    def _release(self):
+        self.in_flight -= 1
+        self.in_flight_metric.dec()
+        if self.semaphore is not None:
+            self.semaphore.release()
+
+    async def _send_with_retries(self, method: str, target: str, headers, content=None) -> httpx.Response:
+        retryable = content is None and method in IDEMPOTENT_METHODS
+        attempt = 0
+        instance = None
+        while True:
+            started = time.monotonic()
+            instance = self.balancer.pick(exclude=instance)
+            try:
+                if retryable and method == "GET" and self.config.hedge_percentile:
+                    resp = await self._hedged_send(method, target, headers, instance)
+                else:
+                    resp = await self._send_to(instance, method, target, headers, content)
+            except httpx.TransportError:
+                self.error_metrics["transport"].inc()
+                self.breaker.record_failure()
+                self.balancer.record_failure(instance)
+                if not self._can_retry(retryable, attempt):
+                    raise
+            except BaseException:
+                self.breaker.release()
+                raise
+            else:
+                elapsed = time.monotonic() - started
+                self.latency_metric.observe(elapsed)
+                if resp.status_code not in RETRYABLE_STATUSES:
+                    self.breaker.record_success()
+                    self.balancer.record_success(instance)
+                    self.latency.record(elapsed)
+                    return resp
+                self.error_metrics["status_5xx"].inc()
+                self.breaker.record_failure()
+                self.balancer.record_failure(instance)
+                if not self._can_retry(retryable, attempt):
+                    return resp
+                await resp.aclose()
+            attempt += 1
+            await asyncio.sleep(self.config.retry_backoff * (2 ** attempt) * random.random())
+
+    async def _send_to(self, instance: UpstreamInstance, method: str, target: str, headers, content=None) -> httpx.Response:
+        upstream_request = self.client.build_request(
+            method=method,
+            url=f"{instance.url}{target}",
+            headers=headers,
+            content=content,
+        )
+        instance.outstanding += 1
+        try:
+            resp = await self.client.send(upstream_request, stream=True)
+        except BaseException:
+            instance.release()
+            raise
+        resp.stream = TrackedStream(resp.stream, instance.release)
+        return resp
+
+    def _can_retry(self, retryable: bool, attempt: int) -> bool:
+        return (
+            retryable
+            and attempt < self.config.retry_attempts
+            and self.breaker.allow()
+            and self.retry_budget.withdraw()
+        )
+
+    async def _hedged_send(self, method: str, target: str, headers, instance: UpstreamInstance) -> httpx.Response:
+        primary = asyncio.ensure_future(self._send_to(instance, method, target, headers))
+        latency = self.latency.percentile(self.config.hedge_percentile)
+        if latency is None:
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=max(latency, self.config.hedge_min_delay))
+        if done or not self.retry_budget.withdraw():
+            return await primary
+
+        # Дублирующий запрос по возможности уходит на другой инстанс
+        hedge_instance = self.balancer.pick(exclude=instance)
+        hedge = asyncio.ensure_future(self._send_to(hedge_instance, method, target, headers))
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Успешные ответы раньше ошибок
+                for task in sorted(done, key=lambda t: t.exception() is not None):
+                    if task.exception() is None or not pending:
+                        for other in done - {task}:
+                            close_when_done(other)
+                        return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+                task.add_done_callback(close_when_done)
+
+    def stats(self) -> Dict[str, Any]:
+        """Состояние пула: соединения в работе и запросы в очереди за соединением"""
+        # httpx не публикует статистику пула, читаем ее у httpcore
+        pool = getattr(self.transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        requests = list(getattr(pool, "_requests", []))
+        in_use = sum(1 for conn in connections if not conn.is_idle())
+        waiting = sum(1 for req in requests if req.is_queued())
+        now = time.monotonic()
+        return {
+            "instances": [instance.to_dict(now) for instance in self.balancer.instances],
+            "balancer": self.balancer.strategy,
+            "http2": self.config.http2,
+            "max_connections": self.config.max_connections,
+            "max_keepalive_connections": self.config.max_keepalive_connections,
+            "connections": len(connections),
+            "in_use": in_use,
+            "idle": len(connections) - in_use,
+            "active_requests": len(requests) - waiting,
+            "waiting_requests": waiting,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.config.max_in_flight,
+            "queued": self.queued,
+            "circuit": self.breaker.state,
+            "retry_tokens": round(self.retry_budget.tokens, 2),
+        }
+
+    async def check_ejected(self):
+        """Возвращает исключенные инстансы, если их /health снова отвечает"""
+        now = time.monotonic()
+        for instance in self.balancer.instances:
+            if not instance.is_ejected(now):
+                continue
+            try:
+                resp = await self.client.get(f"{instance.url}{self.config.health_path}", timeout=2.0)
+            except httpx.HTTPError:
+                continue
+            if resp.status_code < 400:
+                self.balancer.readmit(instance)
+                logger.info(f"Upstream instance {instance.url} readmitted")
+
+    async def aclose(self):
+        await self.client.aclose()
+
+pools: Dict[str, UpstreamPool] = {
+    name: UpstreamPool(upstream) for name, upstream in config.upstreams.items()
+}
+
+async def health_check_loop(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        for pool in pools.values():
+            try:
+                await pool.check_ejected()
+            except Exception as e:
+                logger.error(f"Health check failed for {pool.config.name}: {e}")
+
+class SharedInstances:
+    """Состав инстансов после /gateway/upstreams/{name}/instances, общий для воркеров.
+
+    JSON-файл в каталоге запуска (SERVING_RUN_DIR): изменение - под flock,
+    остальные воркеры перечитывают файл по mtime раз в interval секунд.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.mtime_ns: Optional[int] = None
+
+    def _read(self) -> Dict[str, List[str]]:
+        try:
+            with open(self.path, "rb") as f:
+                return json.loads(f.read())
+        except FileNotFoundError:
+            return {}
+
+    def modify(self, name: str, urls: List[str], change) -> Optional[List[str]]:
+        """change(urls) - новый список или None, если менять нечего"""
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            data = self._read()
+            updated = change(list(data.get(name, urls)))
+            if updated is None:
+                return None
+            data[name] = updated
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            return updated
+
+    def sync(self, pools: Dict[str, "UpstreamPool"]):
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self.mtime_ns:
+            return
+        self.mtime_ns = mtime_ns
+        for name, urls in self._read().items():
+            if name in pools:
+                pools[name].balancer.set_urls(urls)
+
+    async def sync_loop(self, pools: Dict[str, "UpstreamPool"], interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.sync(pools)
+            except Exception as e:
+                logger.error(f"Shared instances sync failed: {e}")
+
+run_dir = os.getenv("SERVING_RUN_DIR")
+shared_instances = SharedInstances(os.path.join(run_dir, "upstreams.json")) if run_dir else None
 
 # Pydantic models for responses
 class GatewayStatus(BaseModel):
@@ -50,13 +750,39 @@ class ServiceInfo(BaseModel):
     url: str
     description: str
 
+class InstanceRequest(BaseModel):
+    url: str
+
+class RoomView(BaseModel):
+    location: str
+    devices: Optional[List[Dict[str, Any]]] = None
+    sensors: Optional[List[Dict[str, Any]]] = None
+    temperature: Optional[Dict[str, Any]] = None
+    errors: Dict[str, str] = {}
+    partial: bool = False
+    timestamp: int
+
 # FastAPI app with graceful shutdown
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    log_listener = start_queue_logging()
     logger.info("API Gateway starting...")
+    health_task = None
+    if config.health_check_interval > 0:
+        health_task = asyncio.create_task(health_check_loop(config.health_check_interval))
+    sync_task = None
+    if shared_instances is not None:
+        shared_instances.sync(pools)
+        sync_task = asyncio.create_task(shared_instances.sync_loop(pools, 1.0))
     yield
-    await http_client.aclose()
+    for task in (health_task, sync_task):
+        if task is not None:
+            task.cancel()
+    for pool in pools.values():
+        await pool.aclose()
     logger.info("API Gateway stopped")
+    log_listener.stop()
+    mark_process_dead()
 
 app = FastAPI(
     title="Smart Home API Gateway",
@@ -76,18 +802,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Logging middleware
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    
-    logger.info(
-        f"{request.client.host} - {request.method} {request.url.path} "
-        f"{response.status_code} {process_time:.3f}s"
-    )
-    return response
+# Response compression (br/gzip), уже сжатые апстримом ответы не трогаем
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("GATEWAY_COMPRESSION_MIN_SIZE", "1024")),
+    gzip_level=int(os.getenv("GATEWAY_GZIP_LEVEL", "6")),
+    brotli_quality=int(os.getenv("GATEWAY_BROTLI_QUALITY", "4")),
+)
+
+# Metrics and sampled access log
+app.add_middleware(
+    MetricsMiddleware,
+    access_logger=logger,
+    sample_rate=float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "0.01")),
+)
 
 # Health check
 @app.get("/health")
@@ -98,63 +826,426 @@ async def health_check():
         "timestamp": int(time.time())
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
 # Gateway status endpoints
 @app.get("/gateway/status")
 async def get_gateway_status():
     return GatewayStatus(
         services={
-            "smart-home": config.smart_home_url,
-            "device": config.device_service_url,
-            "telemetry": config.telemetry_service_url,
+            name: ",".join(pool.balancer.urls()) for name, pool in pools.items()
         },
         timestamp=int(time.time())
     )
 
+@app.get("/gateway/pools")
+async def get_pools():
+    return {name: pool.stats() for name, pool in pools.items()}
+
+# Управление инстансами апстримов без перезапуска
+@app.get("/gateway/upstreams/{name}/instances")
+async def get_instances(name: str):
+    pool = get_pool_or_404(name)
+    now = time.monotonic()
+    return [instance.to_dict(now) for instance in pool.balancer.instances]
+
+@app.post("/gateway/upstreams/{name}/instances", status_code=201)
+async def add_instance(name: str, instance: InstanceRequest):
+    pool = get_pool_or_404(name)
+    if shared_instances is not None:
+        url = instance.url.rstrip("/")
+        urls = shared_instances.modify(name, pool.balancer.urls(), lambda urls: None if url in urls else urls + [url])
+        if urls is None:
+            raise HTTPException(409, "Instance already registered")
+        pool.balancer.set_urls(urls)
+    elif not pool.balancer.add(instance.url):
+        raise HTTPException(409, "Instance already registered")
+    logger.info(f"Instance {instance.url} added to {name}")
+    return {"instances": pool.balancer.urls()}
+
+@app.delete("/gateway/upstreams/{name}/instances")
+async def remove_instance(name: str, url: str):
+    pool = get_pool_or_404(name)
+    if shared_instances is not None:
+        stripped = url.rstrip("/")
+        urls = shared_instances.modify(
+            name, pool.balancer.urls(), lambda urls: [u for u in urls if u != stripped] if stripped in urls else None
+        )
+        if urls is None:
+            raise HTTPException(404, "Instance not found")
+        pool.balancer.set_urls(urls)
+    elif not pool.balancer.remove(url):
+        raise HTTPException(404, "Instance not found")
+    logger.info(f"Instance {url} removed from {name}")
+    return {"instances": pool.balancer.urls()}
+
+def get_pool_or_404(name: str) -> UpstreamPool:
+    pool = pools.get(name)
+    if pool is None:
+        raise HTTPException(404, "Upstream not found")
+    return pool
+
+@app.get("/gateway/cache")
+async def get_cache_stats():
+    return response_cache.stats()
+
 @app.get("/gateway/services")
 async def get_services():
     services = [
-        ServiceInfo(name="smart-home-app", url=config.smart_home_url, description="Монолитное приложение Smart Home"),
-        ServiceInfo(name="device-service", url=config.device_service_url, description="Микросервис управления устройствами"),
-        ServiceInfo(name="telemetry-service", url=config.telemetry_service_url, description="Микросервис сбора телеметрии"),
+        ServiceInfo(name="smart-home-app", url=",".join(pools["smart-home"].balancer.urls()), description="Монолитное приложение Smart Home"),
+        ServiceInfo(name="device-service", url=",".join(pools["device"].balancer.urls()), description="Микросервис управления устройствами"),
+        ServiceInfo(name="telemetry-service", url=",".join(pools["telemetry"].balancer.urls()), description="Микросервис сбора телеметрии"),
     ]
     return services
 
-# ✅ ИСПРАВЛЕННАЯ Proxy function
-async def proxy_request(request: Request, target_base_url: str):
-    """Проверенный рабочий прокси"""
+# Hop-by-hop заголовки (RFC 7230, 6.1) не передаются через прокси
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "proxy-connection",
+    "te",
+    "trailer",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+})
+
+def filter_headers(raw_headers, extra_excluded=()):
+    """Убирает hop-by-hop заголовки, включая перечисленные в Connection"""
+    excluded = set(HOP_BY_HOP_HEADERS)
+    excluded.update(extra_excluded)
+    for name, value in raw_headers:
+        if name.lower() == b"connection":
+            excluded.update(token.strip().lower() for token in value.decode("latin-1").split(","))
+    return [
+        (name, value) for name, value in raw_headers
+        if name.decode("latin-1").lower() not in excluded
+    ]
+
+def request_has_body(request: Request) -> bool:
+    headers = request.headers
+    if "transfer-encoding" in headers:
+        return True
+    return headers.get("content-length", "0") not in ("", "0")
+
+def stream_response(resp: httpx.Response, body=None) -> StreamingResponse:
+    """Отдает ответ апстрима потоком; body - итератор тела, если чтение уже начато"""
+    if body is None:
+        body = resp.aiter_raw()
+    # aiter_raw отдает байты как есть (без распаковки), поэтому
+    # Content-Encoding и Content-Length апстрима остаются корректными
+    response = StreamingResponse(
+        body,
+        status_code=resp.status_code,
+        background=BackgroundTask(resp.aclose),
+    )
+    # date/server выставляет сам uvicorn
+    response.raw_headers = filter_headers(resp.headers.raw, extra_excluded=("date", "server"))
+    return response
+
+async def chain_chunks(buffered, rest):
+    for chunk in buffered:
+        yield chunk
+    async for chunk in rest:
+        yield chunk
+
+def parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    directives = {}
+    for part in value.split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+class CachedResponse:
+    __slots__ = ("status_code", "headers", "body", "etag", "stored_at", "expires_at")
+
+    def __init__(self, status_code: int, headers, body: bytes, ttl: float):
+        self.status_code = status_code
+        self.body = body
+        self.stored_at = time.monotonic()
+        self.expires_at = self.stored_at + ttl
+        self.headers = filter_headers(headers, extra_excluded=("date", "server", "content-length"))
+        etag = next((value for name, value in self.headers if name.lower() == b"etag"), None)
+        if etag is None:
+            etag = f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'.encode("latin-1")
+            self.headers.append((b"etag", etag))
+        self.etag = etag.decode("latin-1")
+
+    def to_response(self, request: Request, cache_status: str) -> Response:
+        age = str(int(time.monotonic() - self.stored_at)).encode("latin-1")
+        extra = [(b"age", age), (b"x-cache", cache_status.encode("latin-1"))]
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and self.status_code == 200 and etag_matches(if_none_match, self.etag):
+            response = Response(status_code=304)
+            response.raw_headers = [(b"etag", self.etag.encode("latin-1"))] + extra
+            return response
+        response = Response(content=self.body, status_code=self.status_code)
+        response.raw_headers.extend(self.headers)
+        response.raw_headers.extend(extra)
+        return response
+
+class ResponseCache:
+    """LRU-кэш GET-ответов с TTL по префиксу маршрута.
+
+    Одновременные промахи по одному ключу объединяются: в апстрим уходит
+    один запрос, остальные ждут его результат.
+
+    Кэш у каждого воркера свой: сброс после записи через шлюз видит только
+    обработавший ее воркер, в остальных ответ устаревает не дольше TTL.
+    """
+    def __init__(self, ttls: Dict[str, float], max_entries: int, max_body_bytes: int):
+        # Сначала более длинные префиксы
+        self.ttls = sorted(ttls.items(), key=lambda item: len(item[0]), reverse=True)
+        self.max_entries = max_entries
+        self.max_body_bytes = max_body_bytes
+        self.entries: "OrderedDict[tuple, CachedResponse]" = OrderedDict()
+        self.inflight: Dict[tuple, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def ttl_for(self, path: str) -> float:
+        for prefix, ttl in self.ttls:
+            if path.startswith(prefix):
+                return ttl
+        return 0.0
+
+    @staticmethod
+    def make_key(request: Request) -> tuple:
+        headers = request.headers
+        return (
+            request.url.path,
+            request.url.query,
+            headers.get("accept", ""),
+            headers.get("accept-encoding", ""),
+            headers.get("authorization", ""),
+        )
+
+    def get(self, key: tuple) -> Optional[CachedResponse]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: tuple, entry: CachedResponse):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, path: str):
+        """Сбрасывает записи маршрута после изменяющего запроса"""
+        prefix = next((prefix for prefix, _ in self.ttls if path.startswith(prefix)), None)
+        if prefix is None:
+            return
+        for key in [key for key in self.entries if key[0].startswith(prefix)]:
+            del self.entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "inflight": len(self.inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+    async def fetch(self, request: Request, pool: UpstreamPool, target: str, headers, ttl: float):
+        key = self.make_key(request)
+        request_cc = parse_cache_control(request.headers.get("cache-control", ""))
+        if "no-cache" not in request_cc:
+            entry = self.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry.to_response(request, "HIT")
+
+        # Кэшу нужен полный ответ, а не 304 на условный запрос клиента
+        headers = filter_headers(headers, extra_excluded=("if-none-match", "if-modified-since"))
+
+        future = self.inflight.get(key)
+        if future is not None:
+            entry = await asyncio.shield(future)
+            if entry is not None:
+                self.coalesced += 1
+                return entry.to_response(request, "HIT")
+            # Ответ лидера нельзя разделить (большой или private) - идем сами
+            return stream_response(await pool.send("GET", target, headers))
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        # Исключение лидера получают ожидающие; без них оно не должно логироваться
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self.inflight[key] = future
+        try:
+            resp = await pool.send("GET", target, headers)
+            response, entry = await self._read(resp, ttl, request_cc)
+            future.set_result(entry)
+            if entry is not None:
+                if entry.status_code == 200 and entry.expires_at > entry.stored_at:
+                    self.put(key, entry)
+                return entry.to_response(request, "MISS")
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            if not future.done():
+                future.set_result(None)
+            self.inflight.pop(key, None)
+
+    async def _read(self, resp: httpx.Response, ttl: float, request_cc: Dict[str, Optional[str]]):
+        """Буферизует ответ, если его можно разделить между клиентами"""
+        response_cc = parse_cache_control(resp.headers.get("cache-control", ""))
+        if "private" in response_cc or "no-store" in response_cc or "no-store" in request_cc:
+            return stream_response(resp), None
+        if "no-cache" in response_cc:
+            ttl = 0.0
+        max_age = response_cc.get("s-maxage") or response_cc.get("max-age")
+        if max_age is not None and max_age.isdigit():
+            ttl = min(ttl, float(max_age))
+
+        content_length = resp.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            return stream_response(resp), None
+
+        chunks = []
+        size = 0
+        raw = resp.aiter_raw()
+        async for chunk in raw:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                # Тело оказалось больше лимита - отдаем его потоком без кэширования
+                return stream_response(resp, chain_chunks(chunks, raw)), None
+        await resp.aclose()
+        return None, CachedResponse(resp.status_code, resp.headers.raw, b"".join(chunks), ttl)
+
+response_cache = ResponseCache(config.cache_ttls, config.cache_max_entries, config.cache_max_body_bytes)
+
+# Admission control
+rate_limiter = create_rate_limiter()
+route_limits = sorted(config.route_limits.items(), key=lambda item: len(item[0]), reverse=True)
+
+def client_key(request: Request) -> str:
+    if config.trust_forwarded_for:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",", 1)[0].strip()
+    return request.client.host if request.client else "unknown"
+
+async def enforce_rate_limits(request: Request, path: str):
+    """429 с Retry-After, если исчерпан bucket клиента или маршрута"""
+    if config.client_rate > 0:
+        wait = await rate_limiter.acquire(f"client:{client_key(request)}", config.client_rate, config.client_burst)
+        if wait:
+            RATE_LIMITED.labels("client").inc()
+            raise HTTPException(429, "Too many requests", headers={"Retry-After": str(max(1, math.ceil(wait)))})
+    for prefix, (rate, burst) in route_limits:
+        if path.startswith(prefix):
+            wait = await rate_limiter.acquire(f"route:{prefix}", rate, burst)
+            if wait:
+                RATE_LIMITED.labels("route").inc()
+                raise HTTPException(429, "Too many requests", headers={"Retry-After": str(max(1, math.ceil(wait)))})
+            break
+
+# BFF aggregation
+class UpstreamStatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"Upstream returned {status_code}")
+        self.status_code = status_code
+
+async def fetch_json(upstream: str, target: str) -> Any:
+    resp = await pools[upstream].send("GET", target, [(b"accept", b"application/json")])
+    try:
+        await resp.aread()
+    finally:
+        await resp.aclose()
+    if resp.status_code >= 400:
+        raise UpstreamStatusError(resp.status_code)
+    return resp.json()
+
+async def fetch_part(name: str, call, timeout: float):
+    """Результат одного вызова или причина, по которой его нет"""
+    try:
+        return name, await asyncio.wait_for(call, timeout), None
+    except asyncio.TimeoutError:
+        return name, None, "timeout"
+    except CircuitOpenError:
+        return name, None, "circuit_open"
+    except AdmissionRejected:
+        return name, None, "overloaded"
+    except UpstreamStatusError as e:
+        return name, None, f"status_{e.status_code}"
+    except Exception as e:
+        logger.error(f"BFF call {name} failed: {type(e).__name__}: {e}")
+        return name, None, "unavailable"
+
+async def load_sensors(location: str) -> List[Dict[str, Any]]:
+    sensors = await fetch_json("smart-home", "/api/v1/sensors")
+    location = location.lower()
+    return [sensor for sensor in sensors if str(sensor.get("location", "")).lower() == location]
+
+# Streaming proxy function
+async def proxy_request(request: Request, upstream: str):
+    """Потоковый прокси: тело запроса и ответа не буферизуется в памяти шлюза.
+
+    GET-запросы к маршрутам с TTL проходят через response_cache.
+    """
+    pool = pools[upstream]
+    path = request.scope["path"]
+    await enforce_rate_limits(request, path)
     try:
-        # Формируем URL
-        path = request.scope["path"]
+        # Формируем путь; инстанс апстрима выбирает балансировщик
         query = request.url.query or ""
-        url = f"{target_base_url.rstrip('/')}{path}"
+        target = path
         if query:
-            url += f"?{query}"
+            target += f"?{query}"
             
-        logger.info(f"Proxying {request.method} {path} -> {url}")
+        logger.debug("Proxying %s %s -> %s%s", request.method, path, upstream, target)
         
-        # КОПИРУЕМ headers БЕЗ host
-        headers = {k: v for k, v in dict(request.headers).items() if k.lower() != 'host'}
+        # Копируем headers без host и hop-by-hop
+        headers = filter_headers(request.headers.raw, extra_excluded=("host",))
+        # Иначе httpx подставит свой Accept-Encoding и клиент получит сжатое тело,
+        # которое не запрашивал
+        if "accept-encoding" not in request.headers:
+            headers.append((b"accept-encoding", b"identity"))
         
-        # GET без body, остальные с body
-        if request.method == 'GET':
-            resp = await http_client.get(url, headers=headers)
-        else:
-            # Правильно получаем body ОДИН РАЗ
-            body = await request.body()
-            resp = await http_client.request(
-                method=request.method, 
-                url=url, 
-                headers=headers, 
-                content=body
-            )
+        if request.method == "GET":
+            ttl = response_cache.ttl_for(path)
+            if ttl:
+                return await response_cache.fetch(request, pool, target, headers, ttl)
+
+        # Тело передаем потоком, только если клиент его прислал
+        content = request.stream() if request_has_body(request) else None
+        resp = await pool.send(request.method, target, headers, content)
         
-        logger.info(f"Backend response: {resp.status_code}")
+        logger.debug("Backend response: %d", resp.status_code)
+
+        if request.method not in ("GET", "HEAD", "OPTIONS") and resp.status_code < 400:
+            response_cache.invalidate(path)
         
-        return Response(
-            content=resp.content,
-            status_code=resp.status_code,
-            headers=dict(resp.headers)
-        )
+        return stream_response(resp)
+    except CircuitOpenError as e:
+        logger.debug("Circuit open for %s, rejecting %s %s", upstream, request.method, path)
+        raise HTTPException(503, "Backend temporarily unavailable",
+                            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+    except AdmissionRejected as e:
+        logger.debug("Upstream %s at capacity, rejecting %s %s", upstream, request.method, path)
+        raise HTTPException(503, "Backend overloaded",
+                            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+    except httpx.TimeoutException as e:
+        logger.error(f"Backend timeout: {type(e).__name__}")
+        raise HTTPException(504, "Backend timeout")
     except httpx.ConnectError as e:
         logger.error(f"Connection failed: {e}")
         raise HTTPException(502, "Backend connection failed")
@@ -162,38 +1253,51 @@ async def proxy_request(request: Request, target_base_url: str):
         logger.error(f"Proxy error: {type(e).__name__}: {e}")
         raise HTTPException(502, "Backend unavailable")
 
+# BFF: экран комнаты одним запросом вместо N+1
+@app.get("/bff/rooms/{location}", response_model=RoomView)
+async def get_room_view(request: Request, location: str):
+    """Параллельно собирает устройства, датчики и температуру комнаты.
+
+    Каждый вызов ограничен BFF_CALL_TIMEOUT; не успевшие части приходят
+    как null с причиной в errors.
+    """
+    await enforce_rate_limits(request, request.url.path)
+    quoted = quote(location, safe="")
+    timeout = config.bff_call_timeout
+    parts = await asyncio.gather(
+        fetch_part("devices", fetch_json("device", f"/api/v1/devices/?location={quoted}"), timeout),
+        fetch_part("sensors", load_sensors(location), timeout),
+        fetch_part("temperature", fetch_json("smart-home", f"/api/v1/sensors/temperature/{quoted}"), timeout),
+    )
+    view = RoomView(location=location, timestamp=int(time.time()))
+    for name, data, error in parts:
+        if error is None:
+            setattr(view, name, data)
+        else:
+            view.errors[name] = error
+    view.partial = bool(view.errors)
+    return view
+
 # Роуты прокси
 @app.api_route("/api/v1/sensors/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"])
 async def proxy_sensors(request: Request, path: str):
-    return await proxy_request(request, config.smart_home_url)
+    return await proxy_request(request, "smart-home")
 
 @app.api_route("/api/v1/devices/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"])
 async def proxy_devices(request: Request, path: str):
-    return await proxy_request(request, config.smart_home_url)
+    return await proxy_request(request, "smart-home")
 
 @app.api_route("/api/v1/telemetry/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"])
 async def proxy_telemetry(request: Request, path: str):
-    return await proxy_request(request, config.telemetry_service_url)
+    return await proxy_request(request, "telemetry")
 
 # Catch-all -> Smart Home App
 @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"])
 async def catch_all(request: Request, path: str):
-    return await proxy_request(request, config.smart_home_url)
-
-# Graceful shutdown
-def signal_handler(sig, frame):
-    logger.info("Shutdown signal received")
-    sys.exit(0)
-
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
+    return await proxy_request(request, "smart-home")
 
+# Graceful shutdown: SIGTERM/SIGINT обрабатывает uvicorn - новые соединения
+# не принимаются, начатые запросы дорабатывают, затем выполняется lifespan
 if __name__ == "__main__":
-    port = int(os.getenv("PORT", 8000))
-    logger.info(f"API Gateway starting on port {port}")
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=port,
-        reload=False
-    )
\ No newline at end of file
+    from serving import run
+    run("main:app", int(os.getenv("PORT", 8000)))
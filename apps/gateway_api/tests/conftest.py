@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули шлюза лежат в корне сервиса (main.py, metrics.py), как в образе
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
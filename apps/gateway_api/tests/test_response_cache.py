@@ -0,0 +1,150 @@
+import asyncio
+
+import httpx
+from starlette.requests import Request
+
+import main
+from etags import etag_matches
+from main import ResponseCache
+
+class FakePool:
+    """Апстрим с подсчетом запросов; ответ - тело и заголовки по пути"""
+    def __init__(self, delay: float = 0.0, headers=None, status_code: int = 200):
+        self.delay = delay
+        self.headers = headers or {}
+        self.status_code = status_code
+        self.calls = []
+
+    async def send(self, method, target, headers, content=None):
+        self.calls.append((method, target))
+        await asyncio.sleep(self.delay)
+        body = f"{method} {target} #{len(self.calls)}".encode()
+        return httpx.Response(self.status_code, headers=self.headers, stream=httpx.ByteStream(body))
+
+def make_request(path: str, method: str = "GET", **headers) -> Request:
+    raw_path, _, query = path.partition("?")
+    return Request({
+        "type": "http",
+        "method": method,
+        "path": raw_path,
+        "query_string": query.encode(),
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+        "client": ("127.0.0.1", 50000),
+    })
+
+def make_cache(max_entries: int = 100) -> ResponseCache:
+    return ResponseCache({"/api/v1/sensors": 60.0}, max_entries=max_entries, max_body_bytes=1024)
+
+async def fetch(cache: ResponseCache, pool: FakePool, path: str, ttl: float = 60.0, **headers):
+    return await cache.fetch(make_request(path, **headers), pool, path, [], ttl)
+
+def test_concurrent_misses_make_one_upstream_call():
+    cache = make_cache()
+    pool = FakePool(delay=0.05)
+
+    async def scenario():
+        return await asyncio.gather(*(fetch(cache, pool, "/api/v1/sensors") for _ in range(10)))
+
+    responses = asyncio.run(scenario())
+    assert len(pool.calls) == 1
+    assert {response.body for response in responses} == {b"GET /api/v1/sensors #1"}
+    assert sorted(response.headers["x-cache"] for response in responses) == ["HIT"] * 9 + ["MISS"]
+    assert cache.stats()["coalesced"] == 9
+
+def test_entry_expires_after_ttl():
+    cache = make_cache()
+    pool = FakePool()
+
+    async def scenario():
+        await fetch(cache, pool, "/api/v1/sensors", ttl=0.01)
+        await asyncio.sleep(0.02)
+        return await fetch(cache, pool, "/api/v1/sensors", ttl=0.01)
+
+    assert asyncio.run(scenario()).headers["x-cache"] == "MISS"
+    assert len(pool.calls) == 2
+
+def test_least_recently_used_entry_is_evicted():
+    cache = make_cache(max_entries=2)
+    pool = FakePool()
+
+    async def scenario():
+        await fetch(cache, pool, "/api/v1/sensors?page=1")
+        await fetch(cache, pool, "/api/v1/sensors?page=2")
+        # Чтение page=1 делает вытесняемой page=2
+        await fetch(cache, pool, "/api/v1/sensors?page=1")
+        await fetch(cache, pool, "/api/v1/sensors?page=3")
+
+    asyncio.run(scenario())
+    assert [key[1] for key in cache.entries] == ["page=1", "page=3"]
+    assert [target for _, target in pool.calls] == [
+        "/api/v1/sensors?page=1", "/api/v1/sensors?page=2", "/api/v1/sensors?page=3",
+    ]
+
+def test_no_store_and_private_responses_are_not_cached():
+    for cache_control in ("no-store", "private, max-age=60"):
+        cache = make_cache()
+        pool = FakePool(headers={"cache-control": cache_control})
+
+        async def scenario():
+            await fetch(cache, pool, "/api/v1/sensors")
+            await fetch(cache, pool, "/api/v1/sensors")
+
+        asyncio.run(scenario())
+        assert len(pool.calls) == 2, cache_control
+        assert not cache.entries
+
+def test_request_cache_control_bypasses_cache():
+    cache = make_cache()
+    pool = FakePool()
+
+    async def scenario():
+        await fetch(cache, pool, "/api/v1/sensors", cache_control="no-store")
+        assert not cache.entries
+        await fetch(cache, pool, "/api/v1/sensors")
+        # no-cache: ответ берется из апстрима и заменяет запись
+        response = await fetch(cache, pool, "/api/v1/sensors", cache_control="no-cache")
+        assert response.headers["x-cache"] == "MISS"
+        return await fetch(cache, pool, "/api/v1/sensors")
+
+    assert asyncio.run(scenario()).body == b"GET /api/v1/sensors #3"
+
+def test_not_modified_for_matching_etag():
+    cache = make_cache()
+    pool = FakePool()
+
+    async def scenario():
+        first = await fetch(cache, pool, "/api/v1/sensors")
+        etag = first.headers["etag"]
+        # Без ETag апстрима шлюз выдает слабый ETag по телу
+        assert etag.startswith('W/"')
+        not_modified = await fetch(cache, pool, "/api/v1/sensors", if_none_match=etag)
+        changed = await fetch(cache, pool, "/api/v1/sensors", if_none_match='W/"other"')
+        return not_modified, changed
+
+    not_modified, changed = asyncio.run(scenario())
+    assert not_modified.status_code == 304 and not_modified.body == b""
+    assert changed.status_code == 200 and changed.body == b"GET /api/v1/sensors #1"
+    assert len(pool.calls) == 1
+
+def test_etag_matching():
+    assert etag_matches('"a"', 'W/"a"')
+    assert etag_matches('W/"b", W/"a"', '"a"')
+    assert etag_matches("*", '"a"')
+    assert not etag_matches('"b"', '"a"')
+
+def test_write_through_gateway_invalidates_route(monkeypatch):
+    cache = make_cache()
+    pool = FakePool()
+    monkeypatch.setattr(main, "response_cache", cache)
+    monkeypatch.setitem(main.pools, "smart-home", pool)
+
+    async def scenario():
+        await main.proxy_request(make_request("/api/v1/sensors"), "smart-home")
+        await main.proxy_request(make_request("/api/v1/sensors/1"), "smart-home")
+        assert len(cache.entries) == 2
+        await main.proxy_request(make_request("/api/v1/sensors/1", method="PUT"), "smart-home")
+        assert not cache.entries
+        return await main.proxy_request(make_request("/api/v1/sensors"), "smart-home")
+
+    assert asyncio.run(scenario()).headers["x-cache"] == "MISS"
+    assert [method for method, _ in pool.calls] == ["GET", "GET", "PUT", "GET"]
@@ -0,0 +1,11 @@
+import importlib.util
+from pathlib import Path
+
+SYNC_SCRIPT = Path(__file__).resolve().parents[2] / "sync_shared_modules.py"
+
+def test_shared_module_copies_match_gateway():
+    # Копии metrics.py и serving.py в других сервисах не должны расходиться с эталоном
+    spec = importlib.util.spec_from_file_location("sync_shared_modules", SYNC_SCRIPT)
+    sync_shared_modules = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sync_shared_modules)
+    assert list(sync_shared_modules.diverged_copies()) == []
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from main import AdmissionRejected, CircuitBreaker, UpstreamConfig, UpstreamPool
+
+def make_pool(monkeypatch, **params) -> UpstreamPool:
+    for name, value in params.items():
+        monkeypatch.setenv(f"TEST_{name}", str(value))
+    return UpstreamPool(UpstreamConfig("test", "TEST", "http://127.0.0.1:9"))
+
+def half_open(pool: UpstreamPool):
+    """Breaker после open_seconds: следующий allow() займет пробный слот"""
+    pool.breaker.state = CircuitBreaker.OPEN
+    pool.breaker.opened_at = -pool.breaker.open_seconds
+
+def test_admission_rejection_keeps_half_open_probe(monkeypatch):
+    pool = make_pool(monkeypatch, MAX_IN_FLIGHT=1, MAX_QUEUE=0, BREAKER_HALF_OPEN_PROBES=1)
+
+    async def scenario():
+        await pool.semaphore.acquire()
+        half_open(pool)
+        with pytest.raises(AdmissionRejected):
+            await pool.send("GET", "/", [])
+        assert pool.breaker.state == CircuitBreaker.HALF_OPEN
+        assert pool.breaker.allow()
+
+    asyncio.run(scenario())
+
+def test_queue_timeout_keeps_half_open_probe(monkeypatch):
+    pool = make_pool(monkeypatch, MAX_IN_FLIGHT=1, MAX_QUEUE=1, QUEUE_TIMEOUT=0.01, BREAKER_HALF_OPEN_PROBES=1)
+
+    async def scenario():
+        await pool.semaphore.acquire()
+        half_open(pool)
+        with pytest.raises(AdmissionRejected):
+            await pool.send("GET", "/", [])
+        assert pool.queued == 0
+        assert pool.breaker.allow()
+
+    asyncio.run(scenario())
+
+def test_cancel_in_queue_keeps_half_open_probe(monkeypatch):
+    pool = make_pool(monkeypatch, MAX_IN_FLIGHT=1, MAX_QUEUE=1, QUEUE_TIMEOUT=10, BREAKER_HALF_OPEN_PROBES=1)
+
+    async def scenario():
+        await pool.semaphore.acquire()
+        half_open(pool)
+        # Клиент отключился, пока запрос ждал в очереди admission
+        task = asyncio.create_task(pool.send("GET", "/", []))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert pool.queued == 0
+        assert pool.breaker.allow()
+
+    asyncio.run(scenario())
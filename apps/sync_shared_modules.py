@@ -0,0 +1,69 @@
+"""
+Сверка копий общих модулей сервисов.
+
+    python sync_shared_modules.py          # код возврата 1, если копии разошлись
+    python sync_shared_modules.py --fix    # переписать копии из эталона
+
+Каждый сервис собирается из своего каталога (свой Dockerfile и контекст сборки),
+поэтому общие модули лежат копиями. Правка вносится в эталон (ключ SHARED_MODULES)
+и разносится по сервисам через --fix.
+"""
+import argparse
+import filecmp
+import shutil
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+# Эталон -> копии в остальных сервисах
+SHARED_MODULES = {
+    "gateway_api/metrics.py": (
+        "temperature_api/metrics.py",
+        "device_service/app/metrics.py",
+        "telemetry_service/app/metrics.py",
+    ),
+    "gateway_api/serving.py": (
+        "temperature_api/serving.py",
+        "device_service/app/serving.py",
+        "telemetry_service/app/serving.py",
+    ),
+    "gateway_api/etags.py": (
+        "device_service/app/etags.py",
+    ),
+    "device_service/app/batching.py": (
+        "telemetry_service/app/batching.py",
+    ),
+    "device_service/app/bootstrap.py": (
+        "telemetry_service/app/bootstrap.py",
+    ),
+}
+
+def diverged_copies():
+    """Пары (эталон, копия), где копия отсутствует или отличается"""
+    for source, copies in SHARED_MODULES.items():
+        for copy in copies:
+            if not (ROOT / copy).exists() or not filecmp.cmp(ROOT / source, ROOT / copy, shallow=False):
+                yield source, copy
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fix", action="store_true", help="переписать разошедшиеся копии из эталона")
+    args = parser.parse_args()
+
+    diverged = list(diverged_copies())
+    for source, copy in diverged:
+        if args.fix:
+            shutil.copyfile(ROOT / source, ROOT / copy)
+            print(f"✅ {copy} <- {source}")
+        else:
+            print(f"❌ {copy} differs from {source}")
+    if diverged and not args.fix:
+        print("Run: python sync_shared_modules.py --fix")
+        return 1
+    if not diverged:
+        print("✅ Shared modules are in sync")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
+from datetime import datetime
+from sqlalchemy import text
+
+from app.database import bootstrap_state, engine
+from app.ingest import reading_buffer
+
+router = APIRouter()
+
+@router.get("/")
+async def health_check():
+    return {
+        "status": "ok",
+        "service": "telemetry-service",
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@router.get("/ready")
+async def readiness_check():
+    """Готов, если схема подготовлена, БД отвечает и в буфере есть место"""
+    if not bootstrap_state.ready:
+        return ORJSONResponse({"status": "not ready", "reason": bootstrap_state.reason}, status_code=503)
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        return ORJSONResponse({"status": "not ready", "reason": f"database: {e}"}, status_code=503)
+    if len(reading_buffer.pending) >= reading_buffer.max_pending:
+        return ORJSONResponse({"status": "not ready", "reason": "buffer is full"}, status_code=503)
+    return {"status": "ready", "pending": len(reading_buffer.pending)}
+
+@router.get("/live")
+async def liveness_check():
+    return {"status": "live"}
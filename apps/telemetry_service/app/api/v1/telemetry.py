@@ -0,0 +1,118 @@
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.codec import parse_binary, parse_json_lines, parse_timestamp
+from app.config import settings
+from app.database import bootstrap_state, get_db
+from app.ingest import reading_buffer
+from app.rollups import RESOLUTIONS, default_step, pick_resolution, query_series, retained
+
+router = APIRouter(prefix="/telemetry", tags=["Telemetry"])
+
+JSON_LINES_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines")
+BINARY_TYPES = ("application/x-telemetry", "application/octet-stream")
+
+STEP_PATTERN = re.compile(r"^(\d+)([smhd]?)$")
+STEP_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+async def read_body(request: Request) -> bytes:
+    """Тело запроса не больше telemetry_max_body_bytes, иначе 413"""
+    limit = settings.telemetry_max_body_bytes
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > limit:
+        raise HTTPException(status_code=413, detail=f"Body is larger than {limit} bytes")
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise HTTPException(status_code=413, detail=f"Body is larger than {limit} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+@router.post("/readings", status_code=status.HTTP_202_ACCEPTED)
+async def ingest_readings(request: Request):
+    """Пачка показаний: JSON lines или бинарный TLM1 (см. app.codec).
+    202 - показания в буфере, в БД они попадут следующим COPY."""
+    if not bootstrap_state.ready:
+        # Пока нет таблиц и партиций, пачку некуда записать
+        raise HTTPException(status_code=503, detail="Database is not ready", headers={"Retry-After": "5"})
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in JSON_LINES_TYPES + BINARY_TYPES:
+        raise HTTPException(
+            status_code=415,
+            detail=f"Content-Type must be one of: {', '.join(JSON_LINES_TYPES + BINARY_TYPES)}",
+        )
+    body = await read_body(request)
+    try:
+        if content_type in BINARY_TYPES:
+            readings = parse_binary(body)
+        else:
+            readings = parse_json_lines(body, datetime.now(timezone.utc))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not reading_buffer.add(readings):
+        raise HTTPException(status_code=503, detail="Telemetry buffer is full", headers={"Retry-After": "1"})
+    return {"accepted": len(readings)}
+
+def parse_time(value: Optional[str], name: str) -> Optional[datetime]:
+    """Epoch-секунды или ISO 8601 (без зоны - UTC)"""
+    if value is None:
+        return None
+    try:
+        try:
+            moment = float(value)
+        except ValueError:
+            moment = value
+        return parse_timestamp(moment, None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"{name}: {e}")
+
+def parse_step(value: str) -> int:
+    match = STEP_PATTERN.match(value.strip())
+    if not match or int(match.group(1)) == 0:
+        raise HTTPException(status_code=400, detail="step must be seconds or a duration like 30s, 5m, 1h, 1d")
+    return int(match.group(1)) * STEP_UNITS[match.group(2)]
+
+@router.get("/{device_id}/series")
+async def get_series(
+    device_id: str,
+    metric: Optional[str] = Query(None, description="Метрика; по умолчанию все метрики устройства"),
+    from_: Optional[str] = Query(None, alias="from", description="Начало (epoch или ISO 8601), по умолчанию to - 24 ч"),
+    to: Optional[str] = Query(None, description="Конец, не включая (epoch или ISO 8601), по умолчанию сейчас"),
+    step: Optional[str] = Query(None, description="Шаг: секунды или 30s/5m/1h/1d; по умолчанию под ~500 точек"),
+    db: AsyncSession = Depends(get_db),
+):
+    """min/max/avg/count по интервалам step колонками по метрикам.
+    Источник - самая грубая агрегация (1d/1h/1m), интервал которой делит шаг
+    и которая еще хранится от from."""
+    end = parse_time(to, "to") or datetime.now(timezone.utc)
+    start = parse_time(from_, "from") or end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="from must be earlier than to")
+    step_seconds = parse_step(step) if step else default_step(start, end)
+    range_seconds = (end - start).total_seconds()
+    if range_seconds / step_seconds > settings.telemetry_series_max_points:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range/step gives more than {settings.telemetry_series_max_points} points, increase step",
+        )
+    now = datetime.now(timezone.utc)
+    if pick_resolution(step_seconds, start, now) is None and (
+        range_seconds > settings.telemetry_series_raw_max_range
+        or not retained(settings.telemetry_retention_days, start, now)
+    ):
+        # Шаг требует агрегации, которой уже нет от from: подсказываем шаг, который ее найдет
+        covering = next((r for r in RESOLUTIONS if retained(r.retention_days, start, now)), None)
+        if covering is None:
+            raise HTTPException(status_code=400, detail="from is older than the retention of stored data")
+        raise HTTPException(
+            status_code=400,
+            detail=f"step must be a multiple of {covering.seconds} seconds for this range "
+                   f"(raw readings for ranges up to {settings.telemetry_series_raw_max_range} seconds)",
+        )
+    return await query_series(db, device_id, metric, start, end, step_seconds)
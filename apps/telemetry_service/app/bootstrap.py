@@ -0,0 +1,49 @@
+"""
+Фоновая подготовка схемы БД в lifespan.
+Одинаковый модуль подключают device_service и telemetry_service:
+эталон в device_service, копии сверяет и обновляет apps/sync_shared_modules.py.
+
+Процесс принимает запросы сразу после старта, а схема готовится фоновой
+задачей: недоступная БД не роняет запуск, подготовка повторяется раз в
+retry_interval секунд. Пока она не закончена, /health/ready отвечает 503
+с причиной из BootstrapState. Шаги, которым нужны таблицы (слушатели, relay,
+сборщик), lifespan запускает после run_with_retry.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+log = logging.getLogger(__name__)
+
+class BootstrapState:
+    """Состояние фоновой подготовки схемы для /health/ready"""
+    def __init__(self):
+        self.status = "pending"  # pending / running / failed / done / disabled
+        self.error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status in ("done", "disabled")
+
+    @property
+    def reason(self) -> str:
+        """Причина неготовности для ответа /health/ready"""
+        if self.error:
+            return f"bootstrap {self.status}: {self.error}"
+        return f"bootstrap {self.status}"
+
+async def run_with_retry(state: BootstrapState, bootstrap: Callable[[], Awaitable], retry_interval: float):
+    """Выполняет bootstrap до успеха и возвращает его результат"""
+    while True:
+        state.status = "running"
+        try:
+            result = await bootstrap()
+        except Exception as e:
+            state.status = "failed"
+            state.error = str(e)
+            log.error(f"❌ Database bootstrap failed, retry in {retry_interval}s: {e}")
+            await asyncio.sleep(retry_interval)
+            continue
+        state.status = "done"
+        state.error = None
+        return result
@@ -0,0 +1,175 @@
+"""
+Форматы тела POST /api/v1/telemetry/readings.
+
+JSON lines (application/x-ndjson) - одно показание на строку:
+    {"device_id": "1", "metric_name": "temperature", "value": 21.5,
+     "unit": "C", "device_type": "temperature_sensor", "timestamp": 1792348000.5}
+timestamp - epoch-секунды или ISO 8601; без него берется время приема.
+
+Бинарный (application/x-telemetry), little-endian:
+    b"TLM1"
+    u16 N, затем N строк: u8 длина + UTF-8        - словарь строк пачки
+    u32 M, затем M записей по 24 байта:
+        f64 timestamp (epoch, с), f64 value,
+        u16 device_id, u16 device_type, u16 metric_name, u16 unit - индексы в словаре
+Индекс 0xFFFF - NULL (для device_type и unit). Повторяющиеся ID и названия
+метрик передаются один раз, запись фиксированной длины разбирается без JSON.
+"""
+import math
+import struct
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import orjson
+
+# Порядок колонок COPY в telemetry_readings
+COPY_COLUMNS = ("device_id", "device_type", "metric_name", "value", "unit", "timestamp")
+Reading = Tuple[str, Optional[str], str, float, Optional[str], datetime]
+
+BINARY_MAGIC = b"TLM1"
+BINARY_NULL = 0xFFFF
+BINARY_RECORD = struct.Struct("<ddHHHH")
+
+# Длины колонок telemetry_readings
+MAX_ID_LENGTH = 50
+MAX_UNIT_LENGTH = 20
+
+def from_epoch(timestamp: float) -> datetime:
+    try:
+        return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    except (OverflowError, OSError):
+        raise ValueError("timestamp is out of range")
+
+def check_string(field: str, value: str, max_length: int):
+    if len(value) > max_length:
+        raise ValueError(f"{field} is longer than {max_length}")
+    # text в Postgres не хранит NUL: такое показание не записать никогда
+    if "\x00" in value:
+        raise ValueError(f"{field} must not contain NUL characters")
+
+def required_string(item: dict, field: str, max_length: int) -> str:
+    value = item.get(field)
+    if isinstance(value, int) and not isinstance(value, bool):
+        value = str(value)
+    if not isinstance(value, str) or not value:
+        raise ValueError(f"{field} is required")
+    check_string(field, value, max_length)
+    return value
+
+def optional_string(item: dict, field: str, max_length: int) -> Optional[str]:
+    value = item.get(field)
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be a string")
+    check_string(field, value, max_length)
+    return value
+
+def parse_timestamp(value, received_at: datetime) -> datetime:
+    if value is None:
+        return received_at
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if not math.isfinite(value):
+            raise ValueError("timestamp must be finite")
+        return from_epoch(value)
+    if isinstance(value, str):
+        parsed = datetime.fromisoformat(value)
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    raise ValueError("timestamp must be epoch seconds or ISO 8601")
+
+def reading_from_dict(item, received_at: datetime) -> Reading:
+    if not isinstance(item, dict):
+        raise ValueError("reading must be an object")
+    value = item.get("value")
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError("value must be a finite number")
+    return (
+        required_string(item, "device_id", MAX_ID_LENGTH),
+        optional_string(item, "device_type", MAX_ID_LENGTH),
+        required_string(item, "metric_name", MAX_ID_LENGTH),
+        float(value),
+        optional_string(item, "unit", MAX_UNIT_LENGTH),
+        parse_timestamp(item.get("timestamp"), received_at),
+    )
+
+def parse_json_lines(body: bytes, received_at: datetime) -> List[Reading]:
+    """Показания из JSON lines; ValueError с номером первой ошибочной строки"""
+    readings = []
+    for number, line in enumerate(body.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            readings.append(reading_from_dict(orjson.loads(line), received_at))
+        except orjson.JSONDecodeError:
+            raise ValueError(f"line {number}: invalid JSON")
+        except ValueError as e:
+            raise ValueError(f"line {number}: {e}")
+    return readings
+
+def parse_binary(body: bytes) -> List[Reading]:
+    """Показания из бинарного формата TLM1"""
+    if body[:4] != BINARY_MAGIC:
+        raise ValueError("binary body must start with TLM1")
+    try:
+        (string_count,) = struct.unpack_from("<H", body, 4)
+        offset = 6
+        strings: List[Optional[str]] = []
+        for _ in range(string_count):
+            length = body[offset]
+            strings.append(body[offset + 1:offset + 1 + length].decode("utf-8"))
+            offset += 1 + length
+        (record_count,) = struct.unpack_from("<I", body, offset)
+        offset += 4
+    except (IndexError, struct.error, UnicodeDecodeError):
+        raise ValueError("truncated or malformed string table")
+    end = offset + record_count * BINARY_RECORD.size
+    if end != len(body):
+        raise ValueError(f"expected {record_count} records of {BINARY_RECORD.size} bytes")
+    if any(len(string) > MAX_ID_LENGTH for string in strings):
+        raise ValueError(f"strings are limited to {MAX_ID_LENGTH} characters")
+    if any("\x00" in string for string in strings):
+        raise ValueError("strings must not contain NUL characters")
+
+    # NULL - последний элемент словаря
+    null = len(strings)
+    strings.append(None)
+    readings = []
+    try:
+        for timestamp, value, device_id, device_type, metric_name, unit in BINARY_RECORD.iter_unpack(
+            memoryview(body)[offset:end]
+        ):
+            device_id = strings[null if device_id == BINARY_NULL else device_id]
+            device_type = strings[null if device_type == BINARY_NULL else device_type]
+            metric_name = strings[null if metric_name == BINARY_NULL else metric_name]
+            unit = strings[null if unit == BINARY_NULL else unit]
+            if device_id is None or metric_name is None:
+                raise ValueError(f"record {len(readings)}: device_id and metric_name are required")
+            if not (math.isfinite(value) and math.isfinite(timestamp)):
+                raise ValueError(f"record {len(readings)}: value and timestamp must be finite")
+            if unit is not None and len(unit) > MAX_UNIT_LENGTH:
+                raise ValueError(f"record {len(readings)}: unit is longer than {MAX_UNIT_LENGTH}")
+            readings.append((device_id, device_type, metric_name, value, unit, from_epoch(timestamp)))
+    except IndexError:
+        raise ValueError(f"record {len(readings)}: string index out of range")
+    return readings
+
+def encode_binary(readings: Iterable[Tuple[str, Optional[str], str, float, Optional[str], float]]) -> bytes:
+    """Кодирует показания (timestamp - epoch-секунды) в формат TLM1 для клиентов"""
+    index: Dict[Optional[str], int] = {None: BINARY_NULL}
+    strings: List[bytes] = []
+    records = []
+    for device_id, device_type, metric_name, value, unit, timestamp in readings:
+        refs = []
+        for string in (device_id, device_type, metric_name, unit):
+            ref = index.get(string)
+            if ref is None:
+                ref = index[string] = len(strings)
+                strings.append(string.encode("utf-8"))
+            refs.append(ref)
+        records.append(BINARY_RECORD.pack(timestamp, value, *refs))
+    if len(strings) >= BINARY_NULL:
+        raise ValueError("too many distinct strings for one binary batch")
+    header = [BINARY_MAGIC, struct.pack("<H", len(strings))]
+    header.extend(bytes((len(string),)) + string for string in strings)
+    header.append(struct.pack("<I", len(records)))
+    return b"".join(header + records)
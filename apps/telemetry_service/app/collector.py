@@ -0,0 +1,274 @@
+"""
+Сборщик показаний температуры из temperature_api.
+
+Датчики - устройства type=temperature_sensor из device_service; список
+перечитывается раз в collector_sensors_refresh_interval секунд, а не на каждом
+цикле. Каждые collector_interval секунд (+- доля collector_jitter) показания
+запрашиваются через POST /temperature/batch пачками по collector_batch_size
+датчиков, не больше collector_concurrency запросов одновременно, через один
+пул соединений. Все показания цикла одной пачкой уходят в буфер приема
+(app.ingest) и пишутся общим COPY. Цикл стоит столько запросов, сколько
+пачек, а не датчиков.
+
+Опрашивает один процесс на все воркеры и реплики: лидер держит сессионную
+advisory-блокировку Postgres на отдельном соединении. Остальные процессы
+каждый цикл пробуют ее взять; соединение лидера пропало - блокировка снята
+сервером, и опрос подхватывает другой процесс.
+
+ID датчика в temperature_api - ID устройства в device_service, как в smart_home.
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+import orjson
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.codec import Reading, parse_timestamp
+from app.config import settings
+from app.database import engine
+from app.ingest import reading_buffer
+from app.metrics import LATENCY_BUCKETS
+
+log = logging.getLogger(__name__)
+# httpx пишет INFO-строку на каждый запрос
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+SENSOR_TYPE = "temperature_sensor"
+METRIC_NAME = "temperature"
+
+# Максимальная страница GET /api/v1/devices/ в device_service
+DEVICE_PAGE_LIMIT = 1000
+
+# Блокировка лидера сборщика
+COLLECTOR_LOCK_ID = 7_346_102
+
+COLLECTOR_SENSORS = Gauge("telemetry_collector_sensors", "Датчики температуры в опросе", multiprocess_mode="livemax")
+COLLECTOR_READINGS = Counter(
+    "telemetry_collector_readings_total",
+    "Показания сборщика: accepted, stale (тот же шаг симуляции), missing (датчика нет в temperature_api), rejected (буфер полон)",
+    ("result",),
+)
+COLLECTOR_REQUESTS = Counter("telemetry_collector_requests_total", "HTTP-запросы сборщика", ("target", "result"))
+COLLECTOR_CYCLE = Histogram("telemetry_collector_cycle_seconds", "Время одного цикла опроса", buckets=LATENCY_BUCKETS)
+
+class TemperatureCollector:
+    def __init__(
+        self,
+        device_service_url: str,
+        temperature_api_url: str,
+        interval: float,
+        jitter: float,
+        batch_size: int,
+        concurrency: int,
+        sensors_refresh_interval: float,
+        timeout: float,
+    ):
+        self.device_service_url = device_service_url.rstrip("/")
+        self.temperature_api_url = temperature_api_url.rstrip("/")
+        self.interval = interval
+        self.jitter = jitter
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.sensors_refresh_interval = sensors_refresh_interval
+        self.timeout = timeout
+        self.sensor_ids: List[str] = []
+        self.sensors_loaded_at: Optional[float] = None
+        # Время последнего записанного показания датчика: повторный опрос в пределах
+        # шага симуляции возвращает то же значение, его не пишем
+        self.last_timestamps: Dict[str, datetime] = {}
+        self.client: Optional[httpx.AsyncClient] = None
+        # Соединение, на котором держится блокировка лидера
+        self.lock_conn: Optional[AsyncConnection] = None
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.concurrency + 1,
+                    max_keepalive_connections=self.concurrency + 1,
+                ),
+            )
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.release_leadership()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def next_delay(self) -> float:
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        # Случайный сдвиг первого цикла: реплики не опрашивают temperature_api одновременно
+        next_tick = loop.time() + random.uniform(0, self.interval)
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            started = time.perf_counter()
+            try:
+                if await self.hold_leadership():
+                    await self.collect()
+                    COLLECTOR_CYCLE.observe(time.perf_counter() - started)
+            except Exception as e:
+                log.error(f"❌ Temperature collection failed: {e}")
+            # Сетка от начала цикла: медленный опрос не сдвигает расписание, но и не копит долг
+            next_tick = max(next_tick + self.next_delay(), loop.time())
+
+    async def hold_leadership(self) -> bool:
+        """True - этот процесс лидер: блокировка взята сейчас или держится с прошлых циклов"""
+        if self.lock_conn is not None:
+            try:
+                await self.lock_conn.execute(text("SELECT 1"))
+                return True
+            except Exception as e:
+                log.warning(f"⚠️ Collector lock connection lost: {e}")
+                await self.drop_lock_conn()
+                return False
+        conn = await engine.connect()
+        try:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            acquired = await conn.scalar(text("SELECT pg_try_advisory_lock(:lock)"), {"lock": COLLECTOR_LOCK_ID})
+        except Exception:
+            await conn.close()
+            raise
+        if not acquired:
+            await conn.close()
+            return False
+        self.lock_conn = conn
+        log.info("✅ Temperature collector is the leader")
+        return True
+
+    async def release_leadership(self):
+        if self.lock_conn is None:
+            return
+        try:
+            await self.lock_conn.execute(text("SELECT pg_advisory_unlock(:lock)"), {"lock": COLLECTOR_LOCK_ID})
+            await self.lock_conn.close()
+            self.lock_conn = None
+        except Exception:
+            await self.drop_lock_conn()
+
+    async def drop_lock_conn(self):
+        """Закрывает соединение лидера без возврата в пул: блокировка уходит вместе с сессией"""
+        conn, self.lock_conn = self.lock_conn, None
+        # Следующий лидер начнет с нового списка датчиков
+        self.sensors_loaded_at = None
+        try:
+            await conn.invalidate()
+            await conn.close()
+        except Exception:
+            pass
+
+    async def refresh_sensors(self):
+        """ID всех датчиков температуры из device_service (постранично по курсору)"""
+        sensor_ids = []
+        params = {"type": SENSOR_TYPE, "limit": DEVICE_PAGE_LIMIT}
+        while True:
+            resp = await self.client.get(f"{self.device_service_url}/api/v1/devices/", params=params)
+            resp.raise_for_status()
+            sensor_ids.extend(str(device["id"]) for device in orjson.loads(resp.content))
+            cursor = resp.headers.get("x-next-cursor")
+            if not cursor:
+                break
+            params["cursor"] = cursor
+        self.sensor_ids = sensor_ids
+        known = set(sensor_ids)
+        self.last_timestamps = {
+            sensor_id: timestamp for sensor_id, timestamp in self.last_timestamps.items() if sensor_id in known
+        }
+        COLLECTOR_SENSORS.set(len(sensor_ids))
+
+    async def collect(self):
+        now = asyncio.get_running_loop().time()
+        if self.sensors_loaded_at is None or now - self.sensors_loaded_at >= self.sensors_refresh_interval:
+            try:
+                await self.refresh_sensors()
+                COLLECTOR_REQUESTS.labels("device_service", "ok").inc()
+                self.sensors_loaded_at = now
+            except httpx.HTTPError as e:
+                COLLECTOR_REQUESTS.labels("device_service", "error").inc()
+                log.warning(f"⚠️ Sensor list refresh failed, polling {len(self.sensor_ids)} known sensors: {e}")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        batches = await asyncio.gather(*(
+            self.fetch_batch(semaphore, self.sensor_ids[start:start + self.batch_size])
+            for start in range(0, len(self.sensor_ids), self.batch_size)
+        ))
+        readings = [reading for batch in batches for reading in batch]
+        if not readings:
+            return
+        # Частями по flush_batch: цикл больше max_pending не отклоняется целиком.
+        # Полный буфер ждем один интервал записи, затем отбрасываем остаток цикла
+        for start in range(0, len(readings), reading_buffer.flush_batch):
+            chunk = readings[start:start + reading_buffer.flush_batch]
+            if not reading_buffer.add(chunk):
+                await asyncio.sleep(reading_buffer.flush_interval)
+                if not reading_buffer.add(chunk):
+                    rejected = len(readings) - start
+                    COLLECTOR_READINGS.labels("rejected").inc(rejected)
+                    log.warning(f"⚠️ Telemetry buffer is full, {rejected} collected readings dropped")
+                    return
+            COLLECTOR_READINGS.labels("accepted").inc(len(chunk))
+            for reading in chunk:
+                self.last_timestamps[reading[0]] = reading[5]
+
+    async def fetch_batch(self, semaphore: asyncio.Semaphore, sensor_ids: List[str]) -> List[Reading]:
+        async with semaphore:
+            try:
+                resp = await self.client.post(
+                    f"{self.temperature_api_url}/temperature/batch",
+                    content=orjson.dumps({"sensor_ids": sensor_ids}),
+                    headers={"content-type": "application/json"},
+                )
+                resp.raise_for_status()
+            except httpx.HTTPError as e:
+                COLLECTOR_REQUESTS.labels("temperature_api", "error").inc()
+                log.warning(f"⚠️ Temperature batch of {len(sensor_ids)} sensors failed: {e}")
+                return []
+        COLLECTOR_REQUESTS.labels("temperature_api", "ok").inc()
+
+        batch = orjson.loads(resp.content)
+        timestamp = parse_timestamp(batch["timestamp"], None)
+        unit = batch["unit"]
+        readings = []
+        stale = 0
+        for item in batch["readings"]:
+            sensor_id = item["sensor_id"]
+            last = self.last_timestamps.get(sensor_id)
+            if last is not None and timestamp <= last:
+                stale += 1
+                continue
+            readings.append((sensor_id, SENSOR_TYPE, METRIC_NAME, float(item["value"]), unit, timestamp))
+        if stale:
+            COLLECTOR_READINGS.labels("stale").inc(stale)
+        if batch["missing"]:
+            COLLECTOR_READINGS.labels("missing").inc(len(batch["missing"]))
+        return readings
+
+temperature_collector = TemperatureCollector(
+    device_service_url=settings.device_service_url,
+    temperature_api_url=settings.temperature_api_url,
+    interval=settings.collector_interval,
+    jitter=settings.collector_jitter,
+    batch_size=settings.collector_batch_size,
+    concurrency=settings.collector_concurrency,
+    sensors_refresh_interval=settings.collector_sensors_refresh_interval,
+    timeout=settings.collector_timeout,
+)
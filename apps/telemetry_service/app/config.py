@@ -0,0 +1,66 @@
+import os
+from pydantic_settings import BaseSettings
+
+class Settings(BaseSettings):
+    # Database
+    database_host: str = os.getenv("DATABASE_HOST", "localhost")
+    database_port: int = int(os.getenv("DATABASE_PORT", "5432"))
+    database_name: str = os.getenv("DATABASE_NAME", "smarthome_telemetry")
+    database_user: str = os.getenv("DATABASE_USER", "postgres")
+    database_password: str = os.getenv("DATABASE_PASSWORD", "postgres")
+
+    # Пул соединений async-движка (asyncpg)
+    database_pool_size: int = int(os.getenv("DATABASE_POOL_SIZE", "10"))
+    database_max_overflow: int = int(os.getenv("DATABASE_MAX_OVERFLOW", "5"))
+    database_pool_timeout: float = float(os.getenv("DATABASE_POOL_TIMEOUT", "30"))
+    database_pool_recycle: int = int(os.getenv("DATABASE_POOL_RECYCLE", "1800"))
+    database_pool_pre_ping: bool = os.getenv("DATABASE_POOL_PRE_PING", "true").lower() == "true"
+    # Схема готовится в фоне после старта; пауза между попытками, пока БД недоступна
+    database_bootstrap_retry_interval: float = float(os.getenv("DATABASE_BOOTSTRAP_RETRY_INTERVAL", "5.0"))
+
+    # Партиции telemetry_readings по суткам (UTC): сколько создавать вперед,
+    # сколько суток хранить (0 - без удаления)
+    telemetry_partitions_ahead: int = int(os.getenv("TELEMETRY_PARTITIONS_AHEAD", "2"))
+    telemetry_retention_days: int = int(os.getenv("TELEMETRY_RETENTION_DAYS", "0"))
+    # Срок хранения агрегатов по разрешениям в сутках (0 - без удаления)
+    telemetry_rollup_1m_retention_days: int = int(os.getenv("TELEMETRY_ROLLUP_1M_RETENTION_DAYS", "14"))
+    telemetry_rollup_1h_retention_days: int = int(os.getenv("TELEMETRY_ROLLUP_1H_RETENTION_DAYS", "400"))
+    telemetry_rollup_1d_retention_days: int = int(os.getenv("TELEMETRY_ROLLUP_1D_RETENTION_DAYS", "0"))
+    # Период обслуживания хранилища (партиции, чистка агрегатов), секунды
+    telemetry_maintenance_interval: float = float(os.getenv("TELEMETRY_MAINTENANCE_INTERVAL", "3600"))
+
+    # Запрос ряда: точек без явного step, максимум точек в ответе
+    telemetry_series_default_points: int = int(os.getenv("TELEMETRY_SERIES_DEFAULT_POINTS", "500"))
+    telemetry_series_max_points: int = int(os.getenv("TELEMETRY_SERIES_MAX_POINTS", "10000"))
+    # Шаг не кратен минуте - ряд считается по сырым показаниям; только для диапазонов не длиннее (секунды)
+    telemetry_series_raw_max_range: int = int(os.getenv("TELEMETRY_SERIES_RAW_MAX_RANGE", "21600"))
+
+    # Буфер приема: запись COPY раз в flush_interval секунд или по flush_batch
+    # показаний; потолок показаний в памяти (дальше 503) и размер тела запроса
+    telemetry_flush_interval: float = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "1.0"))
+    telemetry_flush_batch: int = int(os.getenv("TELEMETRY_FLUSH_BATCH", "20000"))
+    telemetry_max_pending: int = int(os.getenv("TELEMETRY_MAX_PENDING", "500000"))
+    telemetry_max_body_bytes: int = int(os.getenv("TELEMETRY_MAX_BODY_BYTES", str(16 * 1024 * 1024)))
+
+    # Сборщик температуры: датчики из device_service, показания из temperature_api
+    collector_enabled: bool = os.getenv("COLLECTOR_ENABLED", "false").lower() == "true"
+    device_service_url: str = os.getenv("DEVICE_SERVICE_URL", "http://localhost:8082")
+    temperature_api_url: str = os.getenv("TEMPERATURE_API_URL", "http://localhost:8081")
+    # Период опроса (секунды) и его случайное отклонение (доля периода)
+    collector_interval: float = float(os.getenv("COLLECTOR_INTERVAL", "10"))
+    collector_jitter: float = float(os.getenv("COLLECTOR_JITTER", "0.1"))
+    # Датчиков в одном POST /temperature/batch и одновременных запросов
+    collector_batch_size: int = int(os.getenv("COLLECTOR_BATCH_SIZE", "1000"))
+    collector_concurrency: int = int(os.getenv("COLLECTOR_CONCURRENCY", "4"))
+    collector_sensors_refresh_interval: float = float(os.getenv("COLLECTOR_SENSORS_REFRESH_INTERVAL", "60"))
+    collector_timeout: float = float(os.getenv("COLLECTOR_TIMEOUT", "5"))
+
+    # Server
+    server_port: int = 8083
+
+    model_config = {
+        "env_file": ".env",
+        "env_ignore_empty": True
+    }
+
+settings = Settings()
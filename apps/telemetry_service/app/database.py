@@ -0,0 +1,68 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.ext.declarative import declarative_base
+from app.bootstrap import BootstrapState, run_with_retry
+from app.config import settings
+import logging
+
+Base = declarative_base()
+log = logging.getLogger(__name__)
+
+# Подготовка схемы из нескольких процессов - по очереди
+SCHEMA_LOCK_ID = 7_346_100
+
+MASTER_URL = f"postgresql+asyncpg://{settings.database_user}:{settings.database_password}@{settings.database_host}:{settings.database_port}/postgres"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{settings.database_user}:{settings.database_password}@{settings.database_host}:{settings.database_port}/{settings.database_name}"
+
+engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=settings.database_pool_size,
+    max_overflow=settings.database_max_overflow,
+    pool_timeout=settings.database_pool_timeout,
+    pool_recycle=settings.database_pool_recycle,
+    pool_pre_ping=settings.database_pool_pre_ping,
+)
+
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+bootstrap_state = BootstrapState()
+
+async def ensure_database_exists():
+    """Создать БД"""
+    master_engine = create_async_engine(MASTER_URL, isolation_level="AUTOCOMMIT")
+    try:
+        async with master_engine.connect() as conn:
+            # Сессионная блокировка: в AUTOCOMMIT транзакции нет, CREATE DATABASE в ней и не выполнить
+            await conn.execute(text("SELECT pg_advisory_lock(:lock)"), {"lock": SCHEMA_LOCK_ID})
+            exists = await conn.scalar(
+                text("SELECT 1 FROM pg_catalog.pg_database WHERE datname = :name"), {"name": settings.database_name}
+            )
+            if not exists:
+                await conn.execute(text(f'CREATE DATABASE "{settings.database_name}"'))
+                log.info("✅ Database CREATED")
+            await conn.execute(text("SELECT pg_advisory_unlock(:lock)"), {"lock": SCHEMA_LOCK_ID})
+    finally:
+        await master_engine.dispose()
+
+async def ensure_tables_exist():
+    from app import models  # noqa: F401 - регистрирует таблицы в Base.metadata
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:lock)"), {"lock": SCHEMA_LOCK_ID})
+        await conn.run_sync(Base.metadata.create_all)
+    log.info("✅ Tables structure created")
+
+async def bootstrap_database():
+    """Подготовка схемы при старте: БД, таблицы, партиции"""
+    from app.partitions import ensure_partitions
+    await ensure_database_exists()
+    await ensure_tables_exist()
+    await ensure_partitions()
+
+async def run_bootstrap(retry_interval: float):
+    """Фоновый шаг lifespan (см. app.bootstrap)"""
+    await run_with_retry(bootstrap_state, bootstrap_database, retry_interval)
+    log.info("✅ Database bootstrap finished")
+
+async def get_db():
+    async with SessionLocal() as db:
+        yield db
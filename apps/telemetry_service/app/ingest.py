@@ -0,0 +1,98 @@
+"""
+Буфер приема показаний и запись через COPY.
+
+Запрос только разбирает тело и кладет показания в память; фоновая задача
+(app.batching) раз в telemetry_flush_interval секунд или при накоплении telemetry_flush_batch
+показаний пишет их бинарным COPY (asyncpg) пачками не больше
+telemetry_flush_batch строк, вместе с агрегатами (app.rollups). Память
+ограничена telemetry_max_pending: сверх него запросы получают 503, пока БД
+не догонит. Пачка, которую БД отвергла из-за данных, не повторяется - она
+отбрасывается и учитывается в telemetry_readings_invalid_total.
+"""
+import logging
+import time
+from typing import List
+
+import asyncpg
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.batching import FlushLoop
+from app.codec import Reading
+from app.config import settings
+from app.metrics import LATENCY_BUCKETS
+from app.rollups import write_readings
+
+log = logging.getLogger(__name__)
+
+READINGS_ACCEPTED = Counter("telemetry_readings_accepted_total", "Показания, принятые в буфер")
+READINGS_WRITTEN = Counter("telemetry_readings_written_total", "Показания, записанные в БД")
+READINGS_DROPPED = Counter("telemetry_readings_dropped_total", "Показания, потерянные при переполнении после ошибок записи")
+READINGS_INVALID = Counter("telemetry_readings_invalid_total", "Показания, отброшенные из-за ошибки данных в БД")
+READINGS_PENDING = Gauge("telemetry_readings_pending", "Показания в буфере", multiprocess_mode="livesum")
+COPY_DURATION = Histogram("telemetry_copy_duration_seconds", "Время записи одной пачки (COPY и агрегаты)", buckets=LATENCY_BUCKETS)
+
+# Ошибки самих данных (класс 22, нарушения ограничений): повтор пачки не поможет
+DATA_ERRORS = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError)
+
+class ReadingBuffer(FlushLoop):
+    items = "readings"
+
+    def __init__(self, flush_interval: float, flush_batch: int, max_pending: int):
+        super().__init__(flush_interval)
+        self.flush_batch = flush_batch
+        self.max_pending = max_pending
+        self.pending: List[Reading] = []
+
+    def add(self, readings: List[Reading]) -> bool:
+        """Кладет пачку в буфер целиком. False - буфер полон (БД не успевает)"""
+        if len(self.pending) + len(readings) > self.max_pending:
+            return False
+        self.pending.extend(readings)
+        READINGS_ACCEPTED.inc(len(readings))
+        READINGS_PENDING.set(len(self.pending))
+        if len(self.pending) >= self.flush_batch:
+            self.wake()
+        return True
+
+    async def flush(self) -> bool:
+        """COPY частями по flush_batch; записанные части не повторяются, в буфер
+        возвращается только хвост, начиная с упавшей части"""
+        batch, self.pending = self.pending, []
+        written = 0
+        try:
+            while written < len(batch):
+                chunk = batch[written:written + self.flush_batch]
+                started = time.perf_counter()
+                try:
+                    await write_readings(chunk)
+                except DATA_ERRORS as e:
+                    READINGS_INVALID.inc(len(chunk))
+                    log.error(f"❌ {len(chunk)} readings dropped, rejected by the database: {e}")
+                else:
+                    COPY_DURATION.observe(time.perf_counter() - started)
+                    READINGS_WRITTEN.inc(len(chunk))
+                written += len(chunk)
+        except Exception as e:
+            log.error(f"❌ COPY of {len(batch) - written} readings failed: {e}")
+            self.restore(batch[written:])
+            return False
+        except BaseException:
+            self.restore(batch[written:])
+            raise
+        finally:
+            READINGS_PENDING.set(len(self.pending))
+        return True
+
+    def restore(self, unwritten: List[Reading]):
+        """Незаписанное - перед новыми показаниями; сверх потолка теряем самые старые"""
+        self.pending = unwritten + self.pending
+        overflow = len(self.pending) - self.max_pending
+        if overflow > 0:
+            del self.pending[:overflow]
+            READINGS_DROPPED.inc(overflow)
+
+reading_buffer = ReadingBuffer(
+    flush_interval=settings.telemetry_flush_interval,
+    flush_batch=settings.telemetry_flush_batch,
+    max_pending=settings.telemetry_max_pending,
+)
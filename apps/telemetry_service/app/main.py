@@ -0,0 +1,81 @@
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import os
+
+from app.config import settings
+from app.database import run_bootstrap
+from app.api.health import router as health_router
+from app.api.v1.telemetry import router as telemetry_router
+from app.collector import temperature_collector
+from app.ingest import reading_buffer
+from app.metrics import MetricsMiddleware, mark_process_dead, metrics_response, start_queue_logging
+from app.rollups import maintain_storage
+
+logging.basicConfig(level=logging.INFO)
+
+async def bootstrap_then_start():
+    await run_bootstrap(settings.database_bootstrap_retry_interval)
+    # Сборщик и обслуживание партиций работают с таблицами - только когда они есть
+    if settings.collector_enabled:
+        temperature_collector.start()
+    await maintain_storage(settings.telemetry_maintenance_interval)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_listener = start_queue_logging()
+    reading_buffer.start()
+    background_task = asyncio.create_task(bootstrap_then_start())
+    print("🚀 Telemetry Service started!")
+    yield
+    background_task.cancel()
+    try:
+        await background_task
+    except asyncio.CancelledError:
+        pass
+    await temperature_collector.stop()
+    # Накопленные показания пишутся до остановки
+    await reading_buffer.stop()
+    log_listener.stop()
+    mark_process_dead()
+
+app = FastAPI(
+    title="Telemetry Service API",
+    description="Микросервис сбора телеметрии устройств умного дома",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Метрики и выборочный access-лог
+app.add_middleware(
+    MetricsMiddleware,
+    access_logger=logging.getLogger("app.access"),
+    sample_rate=float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "0.01")),
+)
+
+app.include_router(health_router, prefix="/health")
+app.include_router(telemetry_router, prefix="/api/v1")
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+@app.get("/")
+async def root():
+    return {"message": "Telemetry Service running ✅"}
+
+if __name__ == "__main__":
+    from app.serving import run
+    run("app.main:app", int(os.getenv("PORT", settings.server_port)))
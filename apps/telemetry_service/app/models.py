@@ -0,0 +1,45 @@
+from sqlalchemy import BigInteger, Column, DateTime, Float, Index, PrimaryKeyConstraint, String
+from .database import Base
+
+class TelemetryReading(Base):
+    """Показание устройства (TelemetryReading из ER-диаграммы).
+
+    Таблица секционирована по суткам timestamp (UTC), партиции создает и
+    удаляет app.partitions. Пишется только через COPY из app.ingest.
+    """
+    __tablename__ = "telemetry_readings"
+
+    # Ключ партиционированной таблицы обязан включать колонку секционирования
+    id = Column(BigInteger, autoincrement=True, nullable=False)
+    device_id = Column(String(50), nullable=False)
+    device_type = Column(String(50))
+    metric_name = Column(String(50), nullable=False)
+    value = Column(Float, nullable=False)
+    unit = Column(String(20))
+    timestamp = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("id", "timestamp"),
+        Index("ix_telemetry_readings_device_metric_timestamp", "device_id", "metric_name", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+class RollupColumns:
+    """Агрегаты показаний за интервал bucket (начало интервала, UTC).
+    Хранится сумма, а не среднее: агрегаты пачек складываются при upsert"""
+    device_id = Column(String(50), primary_key=True)
+    metric_name = Column(String(50), primary_key=True)
+    bucket = Column(DateTime(timezone=True), primary_key=True)
+    min = Column(Float, nullable=False)
+    max = Column(Float, nullable=False)
+    sum = Column(Float, nullable=False)
+    count = Column(BigInteger, nullable=False)
+
+class TelemetryRollup1m(RollupColumns, Base):
+    __tablename__ = "telemetry_rollups_1m"
+
+class TelemetryRollup1h(RollupColumns, Base):
+    __tablename__ = "telemetry_rollups_1h"
+
+class TelemetryRollup1d(RollupColumns, Base):
+    __tablename__ = "telemetry_rollups_1d"
@@ -0,0 +1,75 @@
+"""
+Суточные партиции telemetry_readings.
+
+Партиции создаются на telemetry_partitions_ahead суток вперед; показания вне
+созданных суток попадают в telemetry_readings_default, поэтому COPY не падает
+из-за времени устройства. Старые партиции удаляются целиком (DROP TABLE)
+по telemetry_retention_days - без DELETE и VACUUM по таблице показаний.
+"""
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import engine
+
+log = logging.getLogger(__name__)
+
+PARENT_TABLE = "telemetry_readings"
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+
+# Обслуживание партиций из нескольких процессов - по очереди
+PARTITION_LOCK_ID = 7_346_101
+
+def partition_name(day: date) -> str:
+    return f"{PARENT_TABLE}_{day:%Y%m%d}"
+
+def partition_day(name: str) -> Optional[date]:
+    try:
+        return datetime.strptime(name.removeprefix(f"{PARENT_TABLE}_"), "%Y%m%d").date()
+    except ValueError:
+        return None
+
+async def ensure_partitions(today: Optional[date] = None) -> List[str]:
+    """Создает недостающие партиции и удаляет устаревшие. Возвращает созданные"""
+    today = today or datetime.now(timezone.utc).date()
+    created = []
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:lock)"), {"lock": PARTITION_LOCK_ID})
+        await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"))
+        existing = set(await conn.scalars(text("""
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            WHERE parent.relname = :parent
+        """), {"parent": PARENT_TABLE}))
+
+        for offset in range(settings.telemetry_partitions_ahead + 1):
+            day = today + timedelta(days=offset)
+            name = partition_name(day)
+            if name in existing:
+                continue
+            try:
+                # Вложенная транзакция: конфликт с default не отменяет остальные партиции
+                async with conn.begin_nested():
+                    await conn.execute(text(
+                        f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} "
+                        f"FOR VALUES FROM ('{day.isoformat()} 00:00:00+00') TO ('{(day + timedelta(days=1)).isoformat()} 00:00:00+00')"
+                    ))
+                created.append(name)
+            except Exception as e:
+                # В default уже есть показания этих суток - они остаются там
+                log.warning(f"⚠️ Partition {name} not created: {e}")
+
+        if settings.telemetry_retention_days > 0:
+            cutoff = today - timedelta(days=settings.telemetry_retention_days)
+            for name in sorted(existing):
+                day = partition_day(name)
+                if day is not None and day < cutoff:
+                    await conn.execute(text(f"DROP TABLE {name}"))
+                    log.info(f"✅ Dropped partition {name}")
+    if created:
+        log.info(f"✅ Created partitions: {', '.join(created)}")
+    return created
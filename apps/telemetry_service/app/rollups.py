@@ -0,0 +1,199 @@
+"""
+Агрегаты показаний 1m / 1h / 1d и запрос временных рядов по ним.
+
+Пачка из буфера пишется одной транзакцией: COPY во временную таблицу
+telemetry_staging, оттуда INSERT в telemetry_readings и по одному
+INSERT ... SELECT ... GROUP BY ... ON CONFLICT DO UPDATE на каждое
+разрешение. Агрегаты хранят min/max/sum/count, поэтому пачки складываются
+без перечитывания сырых показаний, а повтор пачки после ошибки не
+удваивает их (транзакция откатывается целиком).
+
+Ряд за любой диапазон читается из самой грубой агрегации, интервал которой
+делит шаг и которая хранится от начала диапазона: число строк ограничено
+числом точек, а не длиной диапазона.
+"""
+import asyncio
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import BigInteger, Float, cast, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.codec import COPY_COLUMNS, Reading
+from app.config import settings
+from app.database import engine
+from app.partitions import ensure_partitions
+
+log = logging.getLogger(__name__)
+
+class Resolution(NamedTuple):
+    name: str
+    seconds: int
+    unit: str  # единица date_trunc
+    model: type
+    retention_days: int
+
+# От мелкой к грубой
+RESOLUTIONS = (
+    Resolution("1m", 60, "minute", models.TelemetryRollup1m, settings.telemetry_rollup_1m_retention_days),
+    Resolution("1h", 3600, "hour", models.TelemetryRollup1h, settings.telemetry_rollup_1h_retention_days),
+    Resolution("1d", 86400, "day", models.TelemetryRollup1d, settings.telemetry_rollup_1d_retention_days),
+)
+
+# Шаги по умолчанию (секунды): ряд без step укладывается в telemetry_series_default_points
+NICE_STEPS = (1, 5, 10, 30, 60, 300, 600, 900, 1800, 3600, 10800, 21600, 43200, 86400)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+CREATE_STAGING_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS telemetry_staging (
+    device_id varchar(50), device_type varchar(50), metric_name varchar(50),
+    value double precision, unit varchar(20), timestamp timestamptz
+) ON COMMIT DELETE ROWS
+"""
+
+INSERT_READINGS_SQL = f"""
+INSERT INTO telemetry_readings ({", ".join(COPY_COLUMNS)})
+SELECT {", ".join(COPY_COLUMNS)} FROM telemetry_staging
+"""
+
+def upsert_rollup_sql(resolution: Resolution) -> str:
+    # ORDER BY: параллельные пачки обновляют строки в одном порядке и не взаимоблокируются
+    return f"""
+INSERT INTO {resolution.model.__tablename__} AS r (device_id, metric_name, bucket, min, max, sum, count)
+SELECT device_id, metric_name, date_trunc('{resolution.unit}', timestamp, 'UTC'),
+       min(value), max(value), sum(value), count(*)
+FROM telemetry_staging
+GROUP BY 1, 2, 3
+ORDER BY 1, 2, 3
+ON CONFLICT (device_id, metric_name, bucket) DO UPDATE SET
+    min = LEAST(r.min, EXCLUDED.min),
+    max = GREATEST(r.max, EXCLUDED.max),
+    sum = r.sum + EXCLUDED.sum,
+    count = r.count + EXCLUDED.count
+"""
+
+UPSERT_ROLLUP_SQL = [upsert_rollup_sql(resolution) for resolution in RESOLUTIONS]
+
+async def write_readings(readings: List[Reading]):
+    """Показания и их агрегаты - одной транзакцией"""
+    async with engine.connect() as conn:
+        raw = (await conn.get_raw_connection()).driver_connection
+        async with raw.transaction():
+            await raw.execute(CREATE_STAGING_SQL)
+            await raw.copy_records_to_table("telemetry_staging", records=readings, columns=COPY_COLUMNS)
+            # Postgres сам раскладывает строки по партициям telemetry_readings
+            await raw.execute(INSERT_READINGS_SQL)
+            for sql in UPSERT_ROLLUP_SQL:
+                await raw.execute(sql)
+
+def retained(retention_days: int, start: datetime, now: datetime) -> bool:
+    """Данные от start еще не удалены чисткой по сроку хранения (0 - без удаления)"""
+    return retention_days <= 0 or start >= now - timedelta(days=retention_days)
+
+def pick_resolution(step: int, start: datetime, now: Optional[datetime] = None) -> Optional[Resolution]:
+    """Самая грубая агрегация, интервал которой делит шаг и которая хранится
+    от start (иначе старая часть ряда была бы пустой); None - сырые показания"""
+    now = now or datetime.now(timezone.utc)
+    for resolution in reversed(RESOLUTIONS):
+        if step % resolution.seconds == 0 and retained(resolution.retention_days, start, now):
+            return resolution
+    return None
+
+def default_step(start: datetime, end: datetime) -> int:
+    step = math.ceil((end - start).total_seconds() / settings.telemetry_series_default_points)
+    for nice in NICE_STEPS:
+        if nice >= step:
+            return nice
+    return math.ceil(step / 86400) * 86400
+
+def align(moment: datetime, step: int) -> datetime:
+    """Начало интервала шага, в который попадает moment (сетка от epoch)"""
+    seconds = (moment - EPOCH).total_seconds()
+    return EPOCH + timedelta(seconds=math.floor(seconds / step) * step)
+
+async def query_series(
+    db: AsyncSession,
+    device_id: str,
+    metric_name: Optional[str],
+    start: datetime,
+    end: datetime,
+    step: int,
+) -> Dict:
+    """min/max/avg/count по интервалам step в [start, end), колонками по метрикам"""
+    resolution = pick_resolution(step, start)
+    start = align(start, step)
+    step_interval = timedelta(seconds=step)
+    if resolution is None:
+        source = models.TelemetryReading
+        time_column = source.timestamp
+        columns = (
+            func.min(source.value),
+            func.max(source.value),
+            func.avg(source.value),
+            cast(func.count(), BigInteger),
+        )
+    else:
+        source = resolution.model
+        time_column = source.bucket
+        columns = (
+            func.min(source.min),
+            func.max(source.max),
+            cast(func.sum(source.sum) / func.sum(source.count), Float),
+            cast(func.sum(source.count), BigInteger),
+        )
+    bucket = func.date_bin(step_interval, time_column, EPOCH).label("bucket")
+    query = select(source.metric_name, bucket, *columns).where(
+        source.device_id == device_id,
+        time_column >= start,
+        time_column < end,
+    )
+    if metric_name is not None:
+        query = query.where(source.metric_name == metric_name)
+    query = query.group_by(source.metric_name, bucket).order_by(source.metric_name, bucket)
+
+    series: Dict[str, Dict[str, list]] = {}
+    for metric, moment, minimum, maximum, average, count in await db.execute(query):
+        columns_of = series.get(metric)
+        if columns_of is None:
+            columns_of = series[metric] = {"timestamp": [], "min": [], "max": [], "avg": [], "count": []}
+        columns_of["timestamp"].append(moment.timestamp())
+        columns_of["min"].append(minimum)
+        columns_of["max"].append(maximum)
+        columns_of["avg"].append(average)
+        columns_of["count"].append(count)
+    return {
+        "device_id": device_id,
+        "from": start.timestamp(),
+        "to": end.timestamp(),
+        "step": step,
+        "resolution": resolution.name if resolution else "raw",
+        "series": series,
+    }
+
+async def prune_rollups():
+    """Удаляет агрегаты старше срока хранения их разрешения"""
+    now = datetime.now(timezone.utc)
+    async with engine.begin() as conn:
+        for resolution in RESOLUTIONS:
+            if resolution.retention_days <= 0:
+                continue
+            result = await conn.execute(
+                text(f"DELETE FROM {resolution.model.__tablename__} WHERE bucket < :cutoff"),
+                {"cutoff": now - timedelta(days=resolution.retention_days)},
+            )
+            if result.rowcount:
+                log.info(f"✅ Pruned {result.rowcount} {resolution.name} rollups")
+
+async def maintain_storage(interval: float):
+    """Фоновая задача: партиции на следующие сутки заранее, чистка старых агрегатов"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await ensure_partitions()
+            await prune_rollups()
+        except Exception as e:
+            log.error(f"❌ Storage maintenance failed: {e}")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Пакет app импортируется из корня сервиса, как в образе (PYTHONPATH=/app)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,40 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app import database, main
+from app.database import bootstrap_state, run_bootstrap
+
+def test_bootstrap_retries_until_database_is_up(monkeypatch):
+    attempts = []
+
+    async def bootstrap_database():
+        attempts.append(bootstrap_state.status)
+        if len(attempts) < 3:
+            raise ConnectionRefusedError("database is down")
+
+    monkeypatch.setattr(database, "bootstrap_database", bootstrap_database)
+    monkeypatch.setattr(bootstrap_state, "status", "pending")
+    asyncio.run(run_bootstrap(0))
+    assert len(attempts) == 3
+    assert bootstrap_state.ready and bootstrap_state.error is None
+
+def test_not_ready_while_database_is_down(monkeypatch):
+    async def bootstrap_database():
+        raise ConnectionRefusedError("database is down")
+
+    monkeypatch.setattr(database, "bootstrap_database", bootstrap_database)
+    monkeypatch.setattr(bootstrap_state, "status", "pending")
+    monkeypatch.setattr(bootstrap_state, "error", None)
+    # Недоступная БД не роняет старт: процесс жив, но не готов и не принимает показания
+    with TestClient(main.app) as client:
+        assert client.get("/health/live").status_code == 200
+        ready = client.get("/health/ready")
+        assert ready.status_code == 503
+        assert ready.json()["reason"].startswith("bootstrap")
+        response = client.post(
+            "/api/v1/telemetry/readings",
+            content=b'{"device_id": "1", "metric_name": "temperature", "value": 21.5}',
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        assert response.status_code == 503
@@ -0,0 +1,64 @@
+from datetime import datetime, timezone
+
+import orjson
+import pytest
+
+from app.codec import encode_binary, parse_binary, parse_json_lines
+
+RECEIVED = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+def json_line(**fields) -> bytes:
+    reading = {"device_id": "1", "metric_name": "temperature", "value": 21.5}
+    reading.update(fields)
+    return orjson.dumps(reading)
+
+def test_json_lines_round_trip():
+    body = json_line(unit="C", timestamp=1792348000.5) + b"\n\n" + json_line(device_id=7)
+    readings = parse_json_lines(body, RECEIVED)
+    assert readings[0] == ("1", None, "temperature", 21.5, "C", datetime.fromtimestamp(1792348000.5, timezone.utc))
+    # Числовой ID приводится к строке, без timestamp - время приема
+    assert readings[1] == ("7", None, "temperature", 21.5, None, RECEIVED)
+
+@pytest.mark.parametrize("body, message", [
+    (b"{not json", "line 1: invalid JSON"),
+    (b"[1, 2]", "line 1: reading must be an object"),
+    (json_line(device_id=""), "line 1: device_id is required"),
+    (json_line(metric_name=None), "line 1: metric_name is required"),
+    (json_line(value=True), "line 1: value must be a finite number"),
+    (json_line(value="1"), "line 1: value must be a finite number"),
+    (b'{"device_id": "1", "metric_name": "t", "value": 1e400}', "line 1: invalid JSON"),
+    (json_line(unit=5), "line 1: unit must be a string"),
+    (json_line(unit="x" * 21), "line 1: unit is longer than 20"),
+    (json_line(device_id="x" * 51), "line 1: device_id is longer than 50"),
+    (json_line(timestamp=[1]), "line 1: timestamp must be epoch seconds or ISO 8601"),
+    (json_line() + b"\n" + json_line(device_id="a\x00b"), "line 2: device_id must not contain NUL characters"),
+    (json_line(metric_name="t\x00"), "line 1: metric_name must not contain NUL characters"),
+    (json_line(unit="\x00"), "line 1: unit must not contain NUL characters"),
+])
+def test_json_lines_rejects(body, message):
+    with pytest.raises(ValueError) as error:
+        parse_json_lines(body, RECEIVED)
+    assert str(error.value) == message
+
+def test_binary_round_trip():
+    body = encode_binary([
+        ("1", "temperature_sensor", "temperature", 21.5, "C", 1792348000.0),
+        ("2", None, "temperature", -3.25, None, 1792348001.0),
+    ])
+    assert parse_binary(body) == [
+        ("1", "temperature_sensor", "temperature", 21.5, "C", datetime.fromtimestamp(1792348000.0, timezone.utc)),
+        ("2", None, "temperature", -3.25, None, datetime.fromtimestamp(1792348001.0, timezone.utc)),
+    ]
+
+@pytest.mark.parametrize("body, message", [
+    (b"TLM2", "binary body must start with TLM1"),
+    (b"TLM1\x01\x00", "truncated or malformed string table"),
+    (encode_binary([("1", None, "t", 1.0, None, 0.0)])[:-1], "expected 1 records of 24 bytes"),
+    (encode_binary([("1\x00", None, "t", 1.0, None, 0.0)]), "strings must not contain NUL characters"),
+    (encode_binary([("1", None, "t", float("nan"), None, 0.0)]), "record 0: value and timestamp must be finite"),
+    (encode_binary([("1", None, "t", 1.0, "u" * 21, 0.0)]), "record 0: unit is longer than 20"),
+])
+def test_binary_rejects(body, message):
+    with pytest.raises(ValueError) as error:
+        parse_binary(body)
+    assert str(error.value) == message
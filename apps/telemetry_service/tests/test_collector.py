@@ -0,0 +1,60 @@
+import asyncio
+from datetime import datetime, timezone
+
+from app import collector, ingest
+from app.collector import TemperatureCollector
+from app.ingest import ReadingBuffer
+
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+def make_collector(monkeypatch, sensors: int) -> TemperatureCollector:
+    """Сборщик с подмененными запросами: каждый датчик дает одно показание"""
+    temperature_collector = TemperatureCollector(
+        device_service_url="http://127.0.0.1:9", temperature_api_url="http://127.0.0.1:9",
+        interval=10, jitter=0, batch_size=100, concurrency=2, sensors_refresh_interval=60, timeout=1,
+    )
+
+    async def refresh_sensors():
+        temperature_collector.sensor_ids = [str(index) for index in range(sensors)]
+
+    async def fetch_batch(semaphore, sensor_ids):
+        return [(sensor_id, "temperature_sensor", "temperature", 20.0, "C", NOW) for sensor_id in sensor_ids]
+
+    monkeypatch.setattr(temperature_collector, "refresh_sensors", refresh_sensors)
+    monkeypatch.setattr(temperature_collector, "fetch_batch", fetch_batch)
+    return temperature_collector
+
+def test_cycle_larger_than_buffer_is_written(monkeypatch):
+    written = []
+
+    async def write_readings(chunk):
+        written.extend(chunk)
+
+    monkeypatch.setattr(ingest, "write_readings", write_readings)
+
+    async def scenario():
+        buffer = ReadingBuffer(flush_interval=0.01, flush_batch=100, max_pending=250)
+        monkeypatch.setattr(collector, "reading_buffer", buffer)
+        temperature_collector = make_collector(monkeypatch, sensors=1000)
+        buffer.start()
+        # Цикл в 4 раза больше буфера: сборщик ждет, пока записанные части освободят место
+        await temperature_collector.collect()
+        await buffer.stop()
+        return temperature_collector
+
+    temperature_collector = asyncio.run(scenario())
+    assert len(written) == 1000
+    assert len(temperature_collector.last_timestamps) == 1000
+
+def test_full_buffer_rejects_rest_of_cycle(monkeypatch):
+    async def scenario():
+        # Фоновая запись не запущена: буфер не освобождается и остаток цикла отклоняется
+        buffer = ReadingBuffer(flush_interval=0.01, flush_batch=100, max_pending=250)
+        monkeypatch.setattr(collector, "reading_buffer", buffer)
+        temperature_collector = make_collector(monkeypatch, sensors=1000)
+        await temperature_collector.collect()
+        return buffer, temperature_collector
+
+    buffer, temperature_collector = asyncio.run(scenario())
+    assert len(buffer.pending) == 200
+    assert len(temperature_collector.last_timestamps) == 200
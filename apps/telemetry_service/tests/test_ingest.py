@@ -0,0 +1,112 @@
+import asyncio
+from datetime import datetime, timezone
+
+import asyncpg
+import pytest
+
+from app import ingest
+from app.ingest import READINGS_DROPPED, READINGS_INVALID, ReadingBuffer
+
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+def readings(count: int, start: int = 0):
+    return [(str(start + index), None, "temperature", 20.0, "C", NOW) for index in range(count)]
+
+def device_ids(rows):
+    return [row[0] for row in rows]
+
+class FakeCopy:
+    """write_readings по частям: failures - номер части -> исключение,
+    hang - номер зависшей части, delay - время записи части"""
+    def __init__(self, failures=None, hang=None, delay: float = 0.0):
+        self.failures = failures or {}
+        self.hang = hang
+        self.delay = delay
+        self.chunks = []
+
+    async def __call__(self, chunk):
+        number = len(self.chunks)
+        self.chunks.append(list(chunk))
+        await asyncio.sleep(10 if number == self.hang else self.delay)
+        if number in self.failures:
+            raise self.failures[number]
+
+@pytest.fixture
+def copy(monkeypatch):
+    def install(**kwargs):
+        fake = FakeCopy(**kwargs)
+        monkeypatch.setattr(ingest, "write_readings", fake)
+        return fake
+    return install
+
+def test_add_rejects_whole_request_over_limit():
+    buffer = ReadingBuffer(flush_interval=60, flush_batch=10, max_pending=5)
+    assert buffer.add(readings(3))
+    # Запрос принимается или отклоняется целиком (503), без частичной записи
+    assert not buffer.add(readings(3, start=3))
+    assert device_ids(buffer.pending) == ["0", "1", "2"]
+
+def test_failed_chunk_restores_only_unwritten_tail(copy):
+    fake = copy(failures={1: ConnectionError("database is down")})
+
+    async def scenario():
+        buffer = ReadingBuffer(flush_interval=60, flush_batch=2, max_pending=100)
+        buffer.add(readings(5))
+        assert not await buffer.flush()
+        return buffer
+
+    buffer = asyncio.run(scenario())
+    # Первая часть записана и не повторится; хвост с упавшей части - в буфере
+    assert [device_ids(chunk) for chunk in fake.chunks] == [["0", "1"], ["2", "3"]]
+    assert device_ids(buffer.pending) == ["2", "3", "4"]
+
+def test_cancelled_copy_puts_tail_before_new_readings(copy):
+    copy(hang=1)
+
+    async def scenario():
+        buffer = ReadingBuffer(flush_interval=60, flush_batch=2, max_pending=100)
+        buffer.add(readings(4))
+        task = asyncio.create_task(buffer.flush())
+        await asyncio.sleep(0.01)
+        buffer.add(readings(1, start=4))
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return buffer
+
+    # Порядок показаний сохраняется: незаписанное раньше пришедшего во время COPY
+    assert device_ids(asyncio.run(scenario()).pending) == ["2", "3", "4"]
+
+def test_restore_over_limit_drops_oldest(copy):
+    copy(failures={0: ConnectionError("database is down")}, delay=0.02)
+
+    async def scenario():
+        buffer = ReadingBuffer(flush_interval=60, flush_batch=10, max_pending=4)
+        buffer.add(readings(3))
+        task = asyncio.create_task(buffer.flush())
+        await asyncio.sleep(0.01)
+        # Пока COPY идет, буфер снова заполняется; вернувшаяся пачка не помещается
+        buffer.add(readings(3, start=3))
+        await task
+        return buffer
+
+    before = READINGS_DROPPED._value.get()
+    buffer = asyncio.run(scenario())
+    assert device_ids(buffer.pending) == ["2", "3", "4", "5"]
+    assert READINGS_DROPPED._value.get() - before == 2
+
+def test_data_error_drops_only_rejected_chunk(copy):
+    fake = copy(failures={1: asyncpg.CharacterNotInRepertoireError("invalid byte sequence")})
+
+    async def scenario():
+        buffer = ReadingBuffer(flush_interval=60, flush_batch=2, max_pending=100)
+        buffer.add(readings(5))
+        assert await buffer.flush()
+        return buffer
+
+    before = READINGS_INVALID._value.get()
+    buffer = asyncio.run(scenario())
+    # Повтор не поможет: часть отброшена и учтена, остальные записаны
+    assert buffer.pending == []
+    assert len(fake.chunks) == 3
+    assert READINGS_INVALID._value.get() - before == 2
@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.rollups import pick_resolution
+
+NOW = datetime(2026, 10, 18, tzinfo=timezone.utc)
+
+@pytest.mark.parametrize("step, days, resolution", [
+    (300, 1, "1m"),
+    (7200, 1, "1h"),
+    (86400, 1, "1d"),
+    # 1m-агрегаты хранятся 14 суток: старая часть ряда была бы пустой
+    (300, 30, None),
+    (3600, 30, "1h"),
+    # 1h - 400 суток
+    (3600, 500, None),
+    (86400, 500, "1d"),
+    # Шаг не кратен минуте - только сырые показания
+    (90, 1, None),
+])
+def test_resolution_is_kept_from_start(step, days, resolution):
+    picked = pick_resolution(step, NOW - timedelta(days=days), NOW)
+    assert (picked.name if picked else None) == resolution
+
+def get_series(**params):
+    # Без lifespan: 400 возвращается до обращения к БД
+    return TestClient(main.app).get("/api/v1/telemetry/1/series", params=params)
+
+def test_step_finer_than_retained_rollups_is_rejected():
+    end = datetime.now(timezone.utc)
+    response = get_series(**{"from": (end - timedelta(days=30)).timestamp(), "to": end.timestamp(), "step": "5m"})
+    assert response.status_code == 400
+    assert response.json()["detail"].startswith("step must be a multiple of 3600 seconds")
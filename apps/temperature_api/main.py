@@ -1,20 +1,91 @@
-from fastapi import FastAPI, HTTPException, Query, Path
-from pydantic import BaseModel
-from typing import Optional
-import random
-import uvicorn
+from fastapi import FastAPI, HTTPException, Query, Path, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from datetime import datetime, timezone
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from contextlib import asynccontextmanager
+import asyncio
 import logging
+import math
+import os
+import secrets
+import time
+
+from metrics import MetricsMiddleware, mark_process_dead, metrics_response, start_queue_logging
+from sensors import SensorRegistry, TemperatureSimulation, readings_of, simulated_sensors
+from stream import Subscriber, TemperatureBroadcaster
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+MAX_BATCH_SIZE = int(os.getenv("TEMPERATURE_MAX_BATCH_SIZE", "10000"))
+
+SENSOR_COUNT = int(os.getenv("TEMPERATURE_SENSOR_COUNT", "3"))
+TICK_INTERVAL = float(os.getenv("TEMPERATURE_TICK_INTERVAL", "1.0"))
+
+# Реестр датчиков и параметры симуляции строятся один раз, а не на каждый запрос.
+# Шаги идут по сетке TICK_INTERVAL от эпохи: воркеры с общим seed отдают одни показания
+registry = SensorRegistry(simulated_sensors(SENSOR_COUNT))
+simulation = TemperatureSimulation(
+    SENSOR_COUNT,
+    history_size=int(os.getenv("TEMPERATURE_HISTORY_SIZE", "360")),
+    batch_size=int(os.getenv("TEMPERATURE_SIMULATION_BATCH", "65536")),
+    seed=int(os.environ["TEMPERATURE_SIMULATION_SEED"]) if os.getenv("TEMPERATURE_SIMULATION_SEED") else None,
+)
+
+# Подписчики SSE/WebSocket получают каждый шаг симуляции
+broadcaster = TemperatureBroadcaster(
+    registry,
+    queue_size=int(os.getenv("TEMPERATURE_STREAM_QUEUE_SIZE", "8")),
+)
+
+def grid_tick(moment: float) -> float:
+    """Последний шаг сетки не позже moment"""
+    return math.floor(moment / TICK_INTERVAL) * TICK_INTERVAL
+
+async def backfill_history():
+    """История до старта: все шаги сетки, которые поместятся в буфер"""
+    last = grid_tick(time.time())
+    for offset in range(simulation.history_size - 1, -1, -1):
+        await simulation.step_async(last - offset * TICK_INTERVAL)
+
+async def simulation_loop():
+    """
+    Единственный producer процесса: шаг симуляции в моменты сетки TICK_INTERVAL и рассылка
+    """
+    while True:
+        # Пропущенные при перегрузке шаги не догоняем - следующий шаг сетки после текущего
+        next_tick = max(simulation.timestamp + TICK_INTERVAL, grid_tick(time.time()) + TICK_INTERVAL)
+        await asyncio.sleep(max(0.0, next_tick - time.time()))
+        try:
+            await simulation.step_async(next_tick)
+            if broadcaster.subscribers:
+                await broadcaster.publish(simulation.current, simulation.timestamp)
+        except Exception as e:
+            logger.error(f"Simulation step failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_listener = start_queue_logging()
+    await backfill_history()
+    simulation_task = asyncio.create_task(simulation_loop())
+    yield
+    simulation_task.cancel()
+    try:
+        await simulation_task
+    except asyncio.CancelledError:
+        pass
+    log_listener.stop()
+    mark_process_dead()
+
 app = FastAPI(
     title="Temperature API",
     description="Микросервис для получения данных o температуре c датчиков умного дома",
-    version="1.0"
+    version="1.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Добавляем CORS middleware
@@ -26,6 +97,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Метрики и выборочный access-лог
+app.add_middleware(
+    MetricsMiddleware,
+    access_logger=logger,
+    sample_rate=float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "0.01")),
+)
+
 class TemperatureData(BaseModel):
     value: float
     unit: str
@@ -36,6 +114,30 @@ class TemperatureData(BaseModel):
     sensor_type: str
     description: str
 
+class TemperatureHistory(BaseModel):
+    sensor_id: str
+    location: str
+    unit: str
+    timestamps: List[float]
+    values: List[float]
+
+class TemperatureBatchRequest(BaseModel):
+    sensor_ids: List[str] = Field(default_factory=list, max_length=MAX_BATCH_SIZE)
+    locations: List[str] = Field(default_factory=list, max_length=MAX_BATCH_SIZE)
+
+class TemperatureReading(BaseModel):
+    sensor_id: str
+    location: str
+    value: float
+
+class TemperatureBatch(BaseModel):
+    unit: str
+    timestamp: datetime
+    status: str
+    sensor_type: str
+    readings: List[TemperatureReading]
+    missing: List[str]
+
 @app.get("/health", summary="Проверка состояния сервиса", tags=["Health"])
 async def health_check() -> dict:
     """
@@ -43,65 +145,226 @@ async def health_check() -> dict:
     """
     return {"status": "ok"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
 @app.get("/temperature", response_model=TemperatureData, summary="Получить температуру по названию комнаты", tags=["Temperature"])
-async def get_temperature_by_location(location: str = Query(..., description="Название комнаты", regex="^(Kitchen|Bedroom|Living Room)$")):
+async def get_temperature_by_location(location: str = Query(..., description="Название комнаты")):
     """
-    Возвращает случайное значение температуры для указанной комнаты.
+    Возвращает текущее значение температуры для указанной комнаты.
     Используйте: /temperature?location={room}
     """
     if not location:
         raise HTTPException(status_code=400, detail="Location is required")
-    
-    data = generate_temperature_data(location, "")
-    return data
+
+    index = registry.index_by_location.get(location)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Location not found")
+    return generate_temperature_data(index)
+
+def split_query_list(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    return [part for part in (part.strip() for part in value.split(",")) if part]
+
+def subscribe(sensor_ids: List[str], locations: List[str]) -> Subscriber:
+    """
+    Подписка на набор датчиков. Ошибки валидации - ValueError с текстом для клиента.
+    """
+    if len(sensor_ids) + len(locations) > MAX_BATCH_SIZE:
+        raise ValueError(f"No more than {MAX_BATCH_SIZE} sensors per subscription")
+    indices, missing = registry.resolve(sensor_ids, locations)
+    if missing:
+        raise ValueError(f"Unknown sensors or locations: {', '.join(missing)}")
+    if not len(indices):
+        raise ValueError("At least one sensor id or location is required")
+    return broadcaster.subscribe(indices)
+
+# Объявлен до /temperature/{id}, иначе путь перехватит шаблон с ID
+@app.get("/temperature/stream", summary="Поток показаний (Server-Sent Events)", tags=["Temperature"])
+async def stream_temperature(
+    ids: Optional[str] = Query(None, description="ID датчиков через запятую"),
+    locations: Optional[str] = Query(None, description="Комнаты через запятую"),
+):
+    """
+    Отдает показания выбранных датчиков каждые TEMPERATURE_TICK_INTERVAL секунд
+    как text/event-stream. Медленный клиент теряет старые тики, а не копит очередь.
+    """
+    try:
+        subscriber = subscribe(split_query_list(ids), split_query_list(locations))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def events():
+        try:
+            while True:
+                payload = await subscriber.queue.get()
+                yield b"data: " + payload + b"\n\n"
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def subscription_from_message(message) -> Subscriber:
+    if not isinstance(message, dict):
+        raise ValueError("Subscription must be an object with sensor_ids and/or locations")
+    return subscribe(list(message.get("sensor_ids") or []), list(message.get("locations") or []))
+
+@app.websocket("/temperature/ws")
+async def temperature_websocket(websocket: WebSocket):
+    """
+    Поток показаний по WebSocket. Подписка задается параметрами ids/locations
+    при подключении или первым сообщением {"sensor_ids": [...], "locations": [...]};
+    следующее такое сообщение заменяет подписку.
+    """
+    await websocket.accept()
+    subscriber = None
+    try:
+        sensor_ids = split_query_list(websocket.query_params.get("ids"))
+        locations = split_query_list(websocket.query_params.get("locations"))
+        if sensor_ids or locations:
+            subscriber = subscribe(sensor_ids, locations)
+        else:
+            subscriber = subscription_from_message(await websocket.receive_json())
+
+        async def pump():
+            while True:
+                payload = await subscriber.queue.get()
+                if payload is not None:
+                    await websocket.send_bytes(payload)
+
+        async def listen():
+            nonlocal subscriber
+            while True:
+                try:
+                    replacement = subscription_from_message(await websocket.receive_json())
+                except ValueError as e:
+                    await websocket.send_json({"error": str(e)})
+                    continue
+                previous, subscriber = subscriber, replacement
+                broadcaster.unsubscribe(previous)
+                # Будим pump, ждущий очередь старой подписки
+                previous.close()
+
+        tasks = (asyncio.create_task(pump()), asyncio.create_task(listen()))
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+    except ValueError as e:
+        await websocket.send_json({"error": str(e)})
+        await websocket.close(code=1008)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if subscriber is not None:
+            broadcaster.unsubscribe(subscriber)
 
 @app.get("/temperature/{id}", response_model=TemperatureData, summary="Получить температуру по ID датчика", tags=["Temperature"])
-async def get_temperature_by_sensor_id(id: str = Path(..., description="ID датчика", regex="^(1|2|3)$")):
+async def get_temperature_by_sensor_id(id: str = Path(..., description="ID датчика")):
     """
-    Возвращает случайное значение температуры для указанного датчика
+    Возвращает текущее значение температуры для указанного датчика
     """
     if not id:
         raise HTTPException(status_code=400, detail="Sensor ID is required")
-    
-    data = generate_temperature_data("", id)
-    return data
 
-def generate_temperature_data(location: str, sensor_id: str) -> TemperatureData:
+    return generate_temperature_data(get_sensor_index(id))
+
+@app.get("/temperature/{id}/history", response_model=TemperatureHistory, summary="История показаний датчика", tags=["Temperature"])
+async def get_temperature_history(
+    id: str = Path(..., description="ID датчика"),
+    since: Optional[datetime] = Query(None, description="Только показания позже этого момента (ISO 8601 или epoch)"),
+):
     """
-    Генерирует случайные данные о температуре на основе локации или ID датчика
+    Показания датчика из кольцевого буфера симуляции (последние TEMPERATURE_HISTORY_SIZE шагов)
+    в колоночном виде: timestamps (epoch, с) и values. Массивы NumPy сериализуются orjson
+    напрямую, без объекта на каждое показание.
     """
-    # Генерируем случайную температуру между 10 и 30 градусами Цельсия
-    value = 10.0 + random.uniform(0, 20)
-    
-    # Если локация не указана, определяем по ID датчика
-    if not location:
-        location_map = {
-            "1": "Living Room",
-            "2": "Bedroom", 
-            "3": "Kitchen"
-        }
-        location = location_map.get(sensor_id, "Unknown")
-    
-    # Если ID датчика не указан, определяем по локации
-    if not sensor_id:
-        sensor_map = {
-            "Living Room": "1",
-            "Bedroom": "2",
-            "Kitchen": "3"
-        }
-        sensor_id = sensor_map.get(location, "0")
-    
+    index = get_sensor_index(id)
+    if since is not None and since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    timestamps, values = simulation.history(index, since.timestamp() if since is not None else None)
+    return ORJSONResponse({
+        "sensor_id": registry.ids[index],
+        "location": registry.locations[index],
+        "unit": "°C",
+        "timestamps": timestamps,
+        "values": values,
+    })
+
+@app.post("/temperature/batch", response_model=TemperatureBatch, summary="Получить температуру для набора датчиков", tags=["Temperature"])
+async def get_temperature_batch(batch: TemperatureBatchRequest):
+    """
+    Возвращает показания для всех перечисленных датчиков и комнат одним ответом.
+    Неизвестные ID и комнаты перечисляются в missing.
+    """
+    return generate_temperature_batch(batch.sensor_ids, batch.locations)
+
+@app.get("/temperatures", response_model=TemperatureBatch, summary="Получить температуру для списка датчиков", tags=["Temperature"])
+async def get_temperatures(ids: str = Query(..., description="ID датчиков через запятую")):
+    """
+    GET-вариант batch-запроса: /temperatures?ids=1,2,3
+    """
+    sensor_ids = [sensor_id for sensor_id in (part.strip() for part in ids.split(",")) if sensor_id]
+    if len(sensor_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"No more than {MAX_BATCH_SIZE} ids per request")
+    return generate_temperature_batch(sensor_ids, [])
+
+def get_sensor_index(sensor_id: str) -> int:
+    index = registry.index_by_id.get(sensor_id)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Sensor not found")
+    return index
+
+def generate_temperature_batch(sensor_ids: List[str], locations: List[str]) -> ORJSONResponse:
+    """
+    Берет последние показания всех запрошенных датчиков одной выборкой из массива симуляции.
+    Ответ собирается из словарей без построения Pydantic-моделей на каждое показание.
+    """
+    indices, missing = registry.resolve(sensor_ids, locations)
+    values = readings_of(simulation.current, indices)
+    ids = registry.ids
+    sensor_locations = registry.locations
+    readings = [
+        {"sensor_id": ids[index], "location": sensor_locations[index], "value": value}
+        for index, value in zip(indices.tolist(), values)
+    ]
+    return ORJSONResponse({
+        "unit": "°C",
+        "timestamp": datetime.fromtimestamp(simulation.timestamp, timezone.utc).isoformat(),
+        "status": "active",
+        "sensor_type": "temperature",
+        "readings": readings,
+        "missing": missing,
+    })
+
+def generate_temperature_data(index: int) -> TemperatureData:
+    """
+    Последнее значение датчика из симуляции
+    """
+    location = registry.locations[index]
     return TemperatureData(
-        value=value,
+        value=readings_of(simulation.current, [index])[0],
         unit="°C",
-        timestamp=datetime.now(timezone.utc).isoformat(),
+        timestamp=datetime.fromtimestamp(simulation.timestamp, timezone.utc),
         location=location,
         status="active",
-        sensor_id=sensor_id,
+        sensor_id=registry.ids[index],
         sensor_type="temperature",
         description=f"Temperature sensor in {location}"
     )
 
 if __name__ == "__main__":
-    logger.info("Temperature API starting on :8081")
-    uvicorn.run(app, host="0.0.0.0", port=8081)
\ No newline at end of file
+    from serving import run
+    # Общий seed задается до запуска воркеров - они наследуют окружение
+    if not os.getenv("TEMPERATURE_SIMULATION_SEED"):
+        os.environ["TEMPERATURE_SIMULATION_SEED"] = str(secrets.randbits(63))
+    run("main:app", int(os.getenv("PORT", "8081")))
@@ -0,0 +1,176 @@
+"""
+Реестр датчиков температуры и векторная симуляция показаний
+"""
+
+import asyncio
+import math
+import time
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_SENSORS = (
+    ("1", "Living Room"),
+    ("2", "Bedroom"),
+    ("3", "Kitchen"),
+)
+
+SECONDS_PER_DAY = 86400.0
+
+def simulated_sensors(count: int) -> Iterator[Tuple[str, str]]:
+    """Датчики 1..count: первые три - комнаты по умолчанию, дальше "Room N" """
+    for index in range(count):
+        if index < len(DEFAULT_SENSORS):
+            yield DEFAULT_SENSORS[index]
+        else:
+            yield str(index + 1), f"Room {index + 1}"
+
+def rounded(values: np.ndarray) -> np.ndarray:
+    """Показания с точностью 0.01 °C; float64, чтобы в JSON не попал хвост float32"""
+    return np.round(values.astype(np.float64), 2)
+
+def readings_of(values: np.ndarray, indices) -> List[float]:
+    """Значения по индексам датчиков - числа Python с точностью 0.01 °C"""
+    return rounded(values[np.asarray(indices, dtype=np.int64)]).tolist()
+
+class SensorRegistry:
+    """Датчики и их комнаты, собранные один раз при старте.
+
+    Датчик задается индексом в массивах; поиск по ID и комнате - словари.
+    """
+    def __init__(self, sensors: Iterable[Tuple[str, str]]):
+        sensors = list(sensors)
+        self.ids: List[str] = [sensor_id for sensor_id, _ in sensors]
+        self.locations: List[str] = [location for _, location in sensors]
+        self.index_by_id = {sensor_id: index for index, sensor_id in enumerate(self.ids)}
+        # Первый датчик комнаты отвечает за /temperature?location=
+        self.index_by_location = {}
+        for index, location in enumerate(self.locations):
+            self.index_by_location.setdefault(location, index)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def resolve(self, sensor_ids: Iterable[str] = (), locations: Iterable[str] = ()) -> Tuple[np.ndarray, List[str]]:
+        """Индексы датчиков по ID и комнатам (без повторов) и список неизвестных"""
+        indices = []
+        seen = set()
+        missing = []
+        for sensor_id in sensor_ids:
+            index = self.index_by_id.get(sensor_id)
+            if index is None:
+                missing.append(sensor_id)
+            elif index not in seen:
+                seen.add(index)
+                indices.append(index)
+        for location in locations:
+            index = self.index_by_location.get(location)
+            if index is None:
+                missing.append(location)
+            elif index not in seen:
+                seen.add(index)
+                indices.append(index)
+        return np.asarray(indices, dtype=np.int64), missing
+
+class TemperatureSimulation:
+    """Состояние всех датчиков в массивах NumPy, шаг - векторно пачками.
+
+    Температура датчика = базовый уровень + суточный цикл (пик днем, у каждого
+    датчика своя амплитуда и сдвиг) + дрейф + шум измерения.
+
+    Значение - функция seed и времени шага, без состояния между шагами: воркеры
+    с одним seed на одном времени шага считают одинаковые показания. Дрейф -
+    две синусоиды с периодами в 2-8 drift_reversion и случайными фазами,
+    амплитуда как СКО стационарного процесса Орнштейна-Уленбека
+    (drift_sigma / sqrt(2 / drift_reversion)). Шум шага берется из генератора,
+    заданного seed и временем шага (мс).
+
+    История хранится кольцевым буфером float32 формы (history_size, N): шаг
+    пишет одну непрерывную строку, время шага общее для всех датчиков.
+    Память истории - history_size * N * 4 байт.
+    """
+    def __init__(
+        self,
+        size: int,
+        history_size: int = 360,
+        batch_size: int = 65536,
+        drift_reversion: float = 3600.0,
+        noise: float = 0.1,
+        seed=None,
+    ):
+        self.size = size
+        self.history_size = max(2, history_size)
+        self.batch_size = max(1, batch_size)
+        self.noise = noise
+        # Без seed - случайный; его и используют шаги
+        self.seed = np.random.SeedSequence().entropy if seed is None else seed
+        rng = np.random.default_rng(self.seed)
+
+        self.base = rng.uniform(18.0, 24.0, size)
+        self.amplitude = rng.uniform(1.0, 4.0, size)
+        # Доля суток, на которую приходится пик (около 15:00 +- 2.5 часа)
+        self.peak = 15.0 / 24.0 + rng.uniform(-0.1, 0.1, size)
+        drift_sigma = rng.uniform(0.01, 0.05, size)
+        self.drift_amplitude = drift_sigma * math.sqrt(drift_reversion / 2.0)
+        # Угловые частоты (рад/с) и фазы двух синусоид дрейфа; период ~2pi*drift_reversion - как время корреляции OU
+        self.drift_frequency = 2.0 * np.pi / (drift_reversion * rng.uniform(2.0, 8.0, (2, size)))
+        self.drift_phase = rng.uniform(0.0, 2.0 * np.pi, (2, size))
+
+        self.values = np.zeros((self.history_size, size), dtype=np.float32)
+        self.timestamps = np.zeros(self.history_size)
+        self.head = -1  # строка последнего завершенного шага
+        self.count = 0
+
+    @property
+    def timestamp(self) -> float:
+        return float(self.timestamps[self.head]) if self.count else 0.0
+
+    @property
+    def current(self) -> np.ndarray:
+        """Последние значения всех датчиков (представление строки буфера)"""
+        return self.values[self.head]
+
+    def step(self, now: Optional[float] = None):
+        for _ in self._step(now):
+            pass
+
+    async def step_async(self, now: Optional[float] = None):
+        """Шаг с передачей управления event loop между пачками"""
+        for _ in self._step(now):
+            await asyncio.sleep(0)
+
+    def _step(self, now: Optional[float]) -> Iterator[None]:
+        now = time.time() if now is None else now
+        row = (self.head + 1) % self.history_size
+        # Строку, которую перезаписываем, читатели больше не видят
+        self.count = min(self.count, self.history_size - 1)
+
+        day_phase = (now % SECONDS_PER_DAY) / SECONDS_PER_DAY
+        rng = np.random.default_rng([self.seed, int(round(now * 1000))])
+        target = self.values[row]
+        for start in range(0, self.size, self.batch_size):
+            stop = min(start + self.batch_size, self.size)
+            part = slice(start, stop)
+            drift = np.sin(self.drift_frequency[:, part] * now + self.drift_phase[:, part]).sum(axis=0)
+            drift *= self.drift_amplitude[part]
+            value = np.cos(2.0 * np.pi * (day_phase - self.peak[part]))
+            value *= self.amplitude[part]
+            value += self.base[part]
+            value += drift
+            value += rng.normal(0.0, self.noise, stop - start)
+            target[part] = value
+            yield
+
+        self.timestamps[row] = now
+        self.head = row
+        self.count += 1
+
+    def history(self, index: int, since: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Время (epoch, с) и значения датчика (0.01 °C) из буфера, старые первыми"""
+        rows = (self.head - self.count + 1 + np.arange(self.count)) % self.history_size
+        timestamps = self.timestamps[rows]
+        if since is not None:
+            first = int(np.searchsorted(timestamps, since, side="right"))
+            rows = rows[first:]
+            timestamps = timestamps[first:]
+        return timestamps, rounded(self.values[rows, index])
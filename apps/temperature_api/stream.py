@@ -0,0 +1,96 @@
+"""
+Push-рассылка показаний температуры (SSE / WebSocket).
+
+Цикл симуляции на каждом шаге передает сюда значения всех датчиков,
+а рассылка раздает их подписчикам. Подписчики с одинаковым набором датчиков
+объединены в группу: JSON тика сериализуется один раз на группу.
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, Set, Tuple
+
+import numpy as np
+import orjson
+from prometheus_client import Counter, Gauge
+
+from sensors import SensorRegistry, readings_of
+
+STREAM_SUBSCRIBERS = Gauge("temperature_stream_subscribers", "Активные подписчики SSE/WebSocket", multiprocess_mode="livesum")
+STREAM_DROPPED = Counter("temperature_stream_dropped_total", "Тики, вытесненные из очереди медленного подписчика")
+
+# Сколько подписчиков обслужить, прежде чем отдать управление event loop
+FANOUT_YIELD_EVERY = 1024
+
+class Subscriber:
+    """Очередь тиков одного клиента.
+
+    Очередь ограничена: если клиент не успевает читать, самый старый тик
+    выбрасывается, и клиент всегда получает свежие значения.
+    """
+    __slots__ = ("queue", "key", "dropped")
+
+    def __init__(self, key: Tuple[int, ...], queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.key = key
+        self.dropped = 0
+
+    def offer(self, payload: bytes):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            STREAM_DROPPED.inc()
+        self.queue.put_nowait(payload)
+
+    def close(self):
+        """Будит читателя очереди пустым тиком (None) после отписки"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+class TemperatureBroadcaster:
+    def __init__(self, registry: SensorRegistry, queue_size: int):
+        self.registry = registry
+        self.queue_size = queue_size
+        self.groups: Dict[Tuple[int, ...], Set[Subscriber]] = {}
+        self.subscribers = 0
+
+    def subscribe(self, indices: np.ndarray) -> Subscriber:
+        key = tuple(sorted(set(indices.tolist())))
+        subscriber = Subscriber(key, self.queue_size)
+        self.groups.setdefault(key, set()).add(subscriber)
+        self.subscribers += 1
+        STREAM_SUBSCRIBERS.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        group = self.groups.get(subscriber.key)
+        if group is None or subscriber not in group:
+            return
+        group.discard(subscriber)
+        if not group:
+            del self.groups[subscriber.key]
+        self.subscribers -= 1
+        STREAM_SUBSCRIBERS.dec()
+
+    async def publish(self, values: np.ndarray, timestamp: float):
+        timestamp = datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+        ids = self.registry.ids
+        locations = self.registry.locations
+        served = 0
+        # Копия: подписчики могут прийти и уйти, пока мы уступаем loop
+        for key, group in list(self.groups.items()):
+            selected = readings_of(values, key)
+            payload = orjson.dumps({
+                "unit": "°C",
+                "timestamp": timestamp,
+                "readings": [
+                    {"sensor_id": ids[index], "location": locations[index], "value": value}
+                    for index, value in zip(key, selected)
+                ],
+            })
+            for subscriber in list(group):
+                subscriber.offer(payload)
+                served += 1
+                if served % FANOUT_YIELD_EVERY == 0:
+                    await asyncio.sleep(0)
@@ -0,0 +1,94 @@
+import time
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from sensors import TemperatureSimulation
+
+@pytest.fixture
+def simulation(monkeypatch):
+    """Симуляция с фиксированным seed и шагами 1000..1003 вместо фонового цикла"""
+    simulation = TemperatureSimulation(len(main.registry), history_size=8, seed=7)
+    for now in (1000.0, 1001.0, 1002.0, 1003.0):
+        simulation.step(now)
+    monkeypatch.setattr(main, "simulation", simulation)
+    return simulation
+
+@pytest.fixture
+def live_client(monkeypatch):
+    """Клиент с lifespan: цикл симуляции рассылает тики подписчикам"""
+    monkeypatch.setattr(main, "TICK_INTERVAL", 0.05)
+    with TestClient(main.app) as client:
+        yield client
+
+def test_batch_reports_missing_ids(simulation):
+    client = TestClient(main.app)
+    response = client.post("/temperature/batch", json={
+        "sensor_ids": ["1", "404", "3"],
+        "locations": ["Kitchen", "Attic"],
+    })
+    assert response.status_code == 200
+    body = response.json()
+    # Kitchen - датчик 3, уже попавший в ответ
+    assert [reading["sensor_id"] for reading in body["readings"]] == ["1", "3"]
+    assert body["missing"] == ["404", "Attic"]
+    assert body["readings"][0]["value"] == round(float(simulation.current[0]), 2)
+    assert body["timestamp"] == "1970-01-01T00:16:43+00:00"
+
+    body = client.get("/temperatures", params={"ids": "2,,nope"}).json()
+    assert [reading["sensor_id"] for reading in body["readings"]] == ["2"]
+    assert body["missing"] == ["nope"]
+
+def test_history_since(simulation):
+    client = TestClient(main.app)
+    body = client.get("/temperature/2/history").json()
+    assert body["timestamps"] == [1000.0, 1001.0, 1002.0, 1003.0]
+    assert body["values"] == [round(value, 2) for value in simulation.values[:4, 1].astype(float).tolist()]
+
+    # since - epoch или ISO 8601; без часового пояса - UTC
+    for since in ("1001", "1970-01-01T00:16:41"):
+        body = client.get("/temperature/2/history", params={"since": since}).json()
+        assert body["timestamps"] == [1002.0, 1003.0]
+        assert len(body["values"]) == 2
+
+    assert client.get("/temperature/404/history").status_code == 404
+
+def test_websocket_subscribe_by_message(live_client):
+    with live_client.websocket_connect("/temperature/ws") as websocket:
+        websocket.send_json({"locations": ["Bedroom"]})
+        tick = orjson.loads(websocket.receive_bytes())
+        assert [reading["sensor_id"] for reading in tick["readings"]] == ["2"]
+
+        # Ошибка в новой подписке не закрывает соединение и не меняет текущую
+        websocket.send_json({"sensor_ids": ["nope"]})
+        message = websocket.receive()
+        while "text" not in message:
+            message = websocket.receive()
+        assert orjson.loads(message["text"]) == {"error": "Unknown sensors or locations: nope"}
+
+        websocket.send_json({"sensor_ids": ["1", "3"]})
+        while True:
+            tick = orjson.loads(websocket.receive_bytes())
+            if len(tick["readings"]) == 2:
+                break
+        assert [reading["sensor_id"] for reading in tick["readings"]] == ["1", "3"]
+    # Отписка - в обработчике после разрыва, он завершается в потоке приложения
+    deadline = time.monotonic() + 2.0
+    while main.broadcaster.subscribers and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert main.broadcaster.subscribers == 0
+
+@pytest.mark.parametrize("path, first_message, error", [
+    ("/temperature/ws?ids=nope", None, "Unknown sensors or locations: nope"),
+    ("/temperature/ws", [], "Subscription must be an object with sensor_ids and/or locations"),
+    ("/temperature/ws", {}, "At least one sensor id or location is required"),
+])
+def test_websocket_rejects_bad_subscription(live_client, path, first_message, error):
+    with live_client.websocket_connect(path) as websocket:
+        if first_message is not None:
+            websocket.send_json(first_message)
+        assert websocket.receive_json() == {"error": error}
+        assert websocket.receive()["type"] == "websocket.close"
+    assert main.broadcaster.subscribers == 0
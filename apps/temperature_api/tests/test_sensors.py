@@ -0,0 +1,42 @@
+import numpy as np
+
+from sensors import SensorRegistry, TemperatureSimulation, simulated_sensors
+
+def test_step_depends_only_on_seed_and_time():
+    first = TemperatureSimulation(1000, batch_size=128, seed=42)
+    second = TemperatureSimulation(1000, batch_size=1000, seed=42)
+    first.step(1000.0)
+    first.step(1001.0)
+    # Другая история шагов и размер пачки не меняют значение шага
+    second.step(1001.0)
+    assert np.array_equal(first.current, second.current)
+    assert first.timestamp == second.timestamp == 1001.0
+
+    other_time = TemperatureSimulation(1000, seed=42)
+    other_time.step(1002.0)
+    other_seed = TemperatureSimulation(1000, seed=43)
+    other_seed.step(1001.0)
+    assert not np.array_equal(first.current, other_time.current)
+    assert not np.array_equal(first.current, other_seed.current)
+
+def test_history_keeps_last_steps_and_filters_by_since():
+    simulation = TemperatureSimulation(3, history_size=3, seed=1)
+    for now in (1000.0, 1001.0, 1002.0, 1003.0, 1004.0):
+        simulation.step(now)
+    # Буфер на 3 строки: старые шаги перезаписаны
+    timestamps, values = simulation.history(1)
+    assert timestamps.tolist() == [1002.0, 1003.0, 1004.0]
+    assert values.dtype == np.float64
+    assert values.tolist() == np.round(values, 2).tolist()
+    assert values[-1] == round(float(simulation.current[1]), 2)
+
+    timestamps, values = simulation.history(1, since=1003.0)
+    assert timestamps.tolist() == [1004.0] and len(values) == 1
+    timestamps, values = simulation.history(1, since=1004.0)
+    assert timestamps.tolist() == [] and len(values) == 0
+
+def test_resolve_reports_missing_and_skips_duplicates():
+    registry = SensorRegistry(simulated_sensors(5))
+    indices, missing = registry.resolve(["2", "404", "2", "5"], ["Bedroom", "Living Room", "Attic"])
+    assert indices.tolist() == [1, 4, 0]
+    assert missing == ["404", "Attic"]